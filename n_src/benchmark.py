@@ -0,0 +1,301 @@
+"""
+benchmark.py: Generation benchmark on synthetic schemas
+
+Synthesizes a schema of a configurable size, loads it into SQLite or a schema
+snapshot file (see schema_snapshot.py), and times every phase of the code
+generation pipeline against it:
+
+    reflection                  schema_snapshot.load_schema
+    prepare_relationship_info   gen_models.prepare_relationship_info
+    gen_models                  gen_models.gen_models (gen_models.py, the standalone models generator)
+    codegen_models              codegen.gen_models (models.py as written by codegen.py, no fragment cache)
+    generate_views              gen_views.iter_views
+    gen_api, gen_graphql,       codegen.gen_api, codegen.gen_graphql, codegen.gen_kivy
+    gen_kivy
+
+Each phase is run --repeat times; the best and median wall times, plus the
+number of lines and bytes the phase emitted, are written as JSON together with
+the git commit and the schema parameters, so results can be compared across
+commits. A phase that raises is recorded with its error instead of aborting
+the run.
+
+The synthetic schema follows the conventions the generators expect: an `id`
+primary key per table, foreign keys named `<table>_id_fk` and association
+tables ending in `_link`. Foreign keys only point at earlier tables (besides
+self-references), so there are no dependency cycles.
+
+SQLite has no enum types, so with --target sqlite enum columns are reflected
+as VARCHAR. With --target snapshot the enum types are kept, as PostgreSQL would
+report them.
+
+Usage:
+python benchmark.py --tables 400 --columns 12 --fk-density 0.3 --association-tables 40 \\
+    --enums 10 --self-refs 20 --target snapshot --repeat 3 --output bench.json
+python benchmark.py --tables 400 --baseline bench.json   # print the change against an earlier run
+
+Dependencies:
+- SQLAlchemy
+- inflect
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import sqlalchemy
+from sqlalchemy import (Boolean, Column, Date, DateTime, Enum, ForeignKey, Integer, MetaData,
+                        Numeric, String, Table, Text, create_engine)
+
+from schema_snapshot import SchemaSnapshot, load_schema
+import codegen
+import gen_models
+import gen_views
+
+# Types cycled through for the plain data columns
+COLUMN_TYPES = [
+    lambda: String(100),
+    lambda: Integer(),
+    lambda: Numeric(12, 2),
+    lambda: Boolean(),
+    lambda: Date(),
+    lambda: DateTime(),
+    lambda: Text(),
+]
+
+PHASES = ['reflection', 'prepare_relationship_info', 'gen_models', 'codegen_models', 'generate_views',
+          'gen_api', 'gen_graphql', 'gen_kivy']
+
+
+def synthesize_schema(tables=100, columns=10, fk_density=0.3, association_tables=10,
+                      enums=5, self_refs=5, seed=0):
+    """
+    Build a synthetic schema as SQLAlchemy MetaData.
+
+    Args:
+        tables (int): Number of entity tables.
+        columns (int): Number of data columns per entity table, besides id and foreign keys.
+        fk_density (float): Expected number of foreign keys per table to earlier tables.
+        association_tables (int): Number of `_link` tables joining two random entity tables.
+        enums (int): Number of enum types, each used by a few random columns.
+        self_refs (int): Number of tables with a self-referential `parent_id_fk`.
+        seed (int): Random seed, so the same parameters always give the same schema.
+
+    Returns:
+        MetaData: The synthetic tables.
+    """
+    rng = random.Random(seed)
+    metadata = MetaData()
+    enum_types = [Enum(*[f"value_{i}_{j}" for j in range(4)], name=f"status_{i}") for i in range(enums)]
+    self_ref_tables = set(rng.sample(range(tables), min(self_refs, tables)))
+
+    table_names = [f"entity_{i:04d}" for i in range(tables)]
+    for i, table_name in enumerate(table_names):
+        items = [Column('id', Integer, primary_key=True)]
+        items.append(Column('name', String(100), nullable=False, comment=f"Name of the {table_name}"))
+        for j in range(columns - 1):
+            if enum_types and rng.random() < 0.05:
+                items.append(Column(f"state_{j}", rng.choice(enum_types)))
+            else:
+                items.append(Column(f"field_{j}", COLUMN_TYPES[j % len(COLUMN_TYPES)](), nullable=rng.random() < 0.5))
+
+        # Whole foreign keys plus a fractional chance of one more
+        fk_count = int(fk_density) + (rng.random() < fk_density % 1)
+        for parent in sorted(set(rng.choice(table_names[:i]) for _ in range(fk_count)) if i else []):
+            items.append(Column(f"{parent}_id_fk", Integer, ForeignKey(f"{parent}.id")))
+        if i in self_ref_tables:
+            items.append(Column('parent_id_fk', Integer, ForeignKey(f"{table_name}.id")))
+        Table(table_name, metadata, *items)
+
+    pairs = set()
+    while len(pairs) < min(association_tables, tables * (tables - 1) // 2):
+        pairs.add(tuple(sorted(rng.sample(table_names, 2))))
+    for left, right in sorted(pairs):
+        Table(f"{left}_{right}_link", metadata,
+              Column(f"{left}_id_fk", Integer, ForeignKey(f"{left}.id"), primary_key=True),
+              Column(f"{right}_id_fk", Integer, ForeignKey(f"{right}.id"), primary_key=True))
+    return metadata
+
+
+def load_schema_source(metadata, target, path):
+    """
+    Create the synthetic schema in SQLite, or dump it to a snapshot file.
+
+    Args:
+        metadata (MetaData): The synthetic schema.
+        target (str): 'sqlite' or 'snapshot'.
+        path (str): Database file or snapshot file to write.
+
+    Returns:
+        dict: Keyword arguments for schema_snapshot.load_schema.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    db_path = path if target == 'sqlite' else f"{path}.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    metadata.create_all(engine)
+    if target == 'sqlite':
+        return {'database_uri': f"sqlite:///{db_path}"}
+
+    snapshot = SchemaSnapshot.from_engine(engine)
+    engine.dispose()
+    os.remove(db_path)
+    # Put back the enum types SQLite reflected as VARCHAR
+    enums = {}
+    for table in metadata.tables.values():
+        for column in table.columns:
+            if isinstance(column.type, Enum):
+                enums[column.type.name] = column.type
+                for reflected in snapshot.get_columns(table.name):
+                    if reflected['name'] == column.name:
+                        reflected['type'] = column.type
+    snapshot.enums = [{'name': name, 'schema': None, 'visible': True, 'labels': list(enum_type.enums)}
+                      for name, enum_type in sorted(enums.items())]
+    snapshot.dump(path)
+    return {'snapshot_path': path}
+
+
+def count_output(output):
+    """Consume a phase's output and return (lines, bytes), or (None, None) for non-code results."""
+    if isinstance(output, (dict, tuple)):
+        return None, None
+    if isinstance(output, str):
+        output = [output]
+    lines = 0
+    size = 0
+    for chunk in output:
+        lines += chunk.count('\n') + 1
+        size += len(chunk.encode())
+    return lines, size
+
+
+def time_phase(func, repeat):
+    """Run func `repeat` times, consuming its output each time, and summarize the timings."""
+    timings = []
+    lines = size = None
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            lines, size = count_output(func())
+            timings.append(time.perf_counter() - start)
+    except Exception as e:
+        return {'error': f"{type(e).__name__}: {e}"}
+    return {
+        'best': min(timings),
+        'median': statistics.median(timings),
+        'runs': timings,
+        'lines': lines,
+        'bytes': size,
+    }
+
+
+def run_benchmark(source, repeat=3, jobs=1):
+    """
+    Time every phase of the pipeline against a schema source.
+
+    Args:
+        source (dict): Keyword arguments for schema_snapshot.load_schema.
+        repeat (int): Number of runs per phase.
+        jobs (int): Worker processes for the phases that support --jobs.
+
+    Returns:
+        dict: Phase name -> timing summary (see time_phase).
+    """
+    results = {'reflection': time_phase(lambda: load_schema(**source), repeat)}
+    metadata, inspector = load_schema(**source)
+
+    phases = {
+        'prepare_relationship_info': lambda: gen_models.prepare_relationship_info(metadata, inspector),
+        'gen_models': lambda: gen_models.gen_models(metadata, inspector, jobs=jobs),
+        'codegen_models': lambda: codegen.gen_models(metadata, inspector, jobs=jobs),
+        'generate_views': lambda: gen_views.iter_views(metadata, inspector, jobs=jobs),
+        'gen_api': lambda: codegen.gen_api(metadata, inspector, jobs=jobs),
+        'gen_graphql': lambda: codegen.gen_graphql(metadata, inspector, jobs=jobs),
+        'gen_kivy': lambda: codegen.gen_kivy(metadata, inspector),
+    }
+    for name, func in phases.items():
+        results[name] = time_phase(func, repeat)
+    return results
+
+
+def git_commit():
+    """Return the current git commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    """Print a table of the phase timings, with the change against a baseline run if given."""
+    print(f"{'phase':<28}{'best (s)':>12}{'median (s)':>12}{'lines':>10}{'bytes':>12}{'vs base':>10}")
+    for name in PHASES:
+        result = results[name]
+        if 'error' in result:
+            print(f"{name:<28}  {result['error']}")
+            continue
+        change = ''
+        base = (baseline or {}).get(name, {})
+        if base.get('best'):
+            change = f"{(result['best'] / base['best'] - 1) * 100:+.1f}%"
+        print(f"{name:<28}{result['best']:>12.4f}{result['median']:>12.4f}"
+              f"{result['lines'] if result['lines'] is not None else '':>10}"
+              f"{result['bytes'] if result['bytes'] is not None else '':>12}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the code generators on a synthetic schema.')
+    parser.add_argument('--tables', type=int, default=100, help='Number of entity tables')
+    parser.add_argument('--columns', type=int, default=10, help='Data columns per table')
+    parser.add_argument('--fk-density', type=float, default=0.3, help='Average foreign keys per table')
+    parser.add_argument('--association-tables', type=int, default=10, help='Number of _link tables')
+    parser.add_argument('--enums', type=int, default=5, help='Number of enum types')
+    parser.add_argument('--self-refs', type=int, default=5, help='Number of self-referential tables')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the schema')
+    parser.add_argument('--target', choices=['sqlite', 'snapshot'], default='sqlite',
+                        help='Load the schema into SQLite or a snapshot file')
+    parser.add_argument('--path', type=str, help='Database or snapshot file (default: a temporary file)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per phase')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of worker processes for per-table generation')
+    parser.add_argument('--output', type=str, default='benchmark.json', help='JSON results file')
+    parser.add_argument('--baseline', type=str, help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    params = {key: getattr(args, key) for key in
+              ('tables', 'columns', 'fk_density', 'association_tables', 'enums', 'self_refs', 'seed', 'target', 'jobs')}
+    metadata = synthesize_schema(args.tables, args.columns, args.fk_density, args.association_tables,
+                                 args.enums, args.self_refs, args.seed)
+
+    suffix = '.db' if args.target == 'sqlite' else '.json'
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.path or os.path.join(directory, f"benchmark_schema{suffix}")
+        source = load_schema_source(metadata, args.target, path)
+        results = run_benchmark(source, args.repeat, args.jobs)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['phases']
+    print_results(results, baseline)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'params': params,
+            'phases': results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
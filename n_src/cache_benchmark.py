@@ -0,0 +1,202 @@
+"""
+cache_benchmark.py: Size and speed of the cache payloads of CacheMixin, pickle against RowCodec
+
+Creates a table of --columns data columns of the usual types, fills an SQLite
+database with --rows rows and encodes them the ways CacheMixin has cached them:
+
+    instance    one payload per instance (cache_instance, bulk_cache)
+    result      one payload for the result of a query (CachedQuery)
+
+with pickle (pickle.dumps of the instances, and of the query's FrozenResult)
+and with the RowCodec of mixins/cache-mixin.py. Decoding includes attaching the
+instances to a new session with merge(load=False), which RowCodec.decode does
+and the pickled instances need before their relationships can load.
+
+Each path is run --repeat times; the best run is reported per row:
+
+    bytes       payload size
+    encode_us   microseconds to encode
+    decode_us   microseconds to decode and merge
+
+The results are written as JSON with the git commit and the parameters, like
+benchmark.py.
+
+Usage:
+python cache_benchmark.py --rows 10000 --columns 12 --repeat 5 --output cache_benchmark.json
+
+Dependencies:
+- SQLAlchemy
+- msgpack
+- Flask-AppBuilder (imported by the mixin)
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import pickle
+import platform
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import Boolean, Column, Date, DateTime, Integer, Numeric, String, Text, create_engine, select
+from sqlalchemy.orm import Session, declarative_base
+
+from benchmark import git_commit
+
+CACHE_MIXIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mixins', 'cache-mixin.py')
+
+CASES = ['instance', 'result']
+PATHS = ['pickle', 'codec']
+MEASURES = ['bytes', 'encode_us', 'decode_us']
+
+# Column types cycled through, with a random value of each
+COLUMN_TYPES = [
+    (lambda: String(100), lambda rnd: ''.join(rnd.choices('abcdefghij ', k=rnd.randint(5, 40)))),
+    (Integer, lambda rnd: rnd.randint(0, 10 ** 6)),
+    (lambda: Numeric(12, 2), lambda rnd: Decimal(rnd.randint(0, 10 ** 8)) / 100),
+    (DateTime, lambda rnd: datetime(2024, 1, 1) + timedelta(seconds=rnd.randint(0, 10 ** 7))),
+    (Date, lambda rnd: date(2000, 1, 1) + timedelta(days=rnd.randint(0, 10000))),
+    (Boolean, lambda rnd: rnd.random() < 0.5),
+    (Text, lambda rnd: ' '.join(rnd.choices(['lorem', 'ipsum', 'dolor', 'sit', 'amet'], k=rnd.randint(10, 60)))),
+]
+
+
+def load_cache_mixin():
+    """The mixins/cache-mixin.py module (its file name is not importable as is)."""
+    spec = importlib.util.spec_from_file_location('cache_mixin', CACHE_MIXIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_model(columns):
+    """A mapped class of columns data columns, on a declarative base of its own."""
+    Base = declarative_base()
+    attributes = {'__tablename__': 'bench_row', 'id': Column(Integer, primary_key=True)}
+    for i in range(columns):
+        column_type, _ = COLUMN_TYPES[i % len(COLUMN_TYPES)]
+        attributes[f"col_{i}"] = Column(column_type())
+    model = type('BenchRow', (Base,), attributes)
+    # pickle finds classes by their module attribute
+    globals()[model.__name__] = model
+    return model
+
+
+def fill(engine, model, rows, columns, seed=0):
+    rnd = random.Random(seed)
+    model.metadata.create_all(engine)
+    with Session(engine) as session:
+        for _ in range(rows):
+            values = {f"col_{i}": COLUMN_TYPES[i % len(COLUMN_TYPES)][1](rnd) for i in range(columns)}
+            session.add(model(**values))
+        session.commit()
+
+
+def best_time(func, repeat, setup=lambda: None):
+    """Best wall time of func(setup()) over repeat runs."""
+    times = []
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        func(argument)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_benchmark(rows=10000, columns=12, repeat=3, seed=0):
+    """
+    Encode and decode the rows of a synthetic table with every path.
+
+    Returns:
+        dict: case -> path -> measure -> value per row.
+    """
+    cache_mixin = load_cache_mixin()
+    model = make_model(columns)
+    engine = create_engine('sqlite://')
+    fill(engine, model, rows, columns, seed)
+    codec = cache_mixin.RowCodec.for_model(model)
+    new_session = lambda: Session(engine)
+
+    with Session(engine) as session:
+        instances = session.query(model).all()
+        frozen = session.execute(select(model)).freeze()
+
+    pickled_instances = [pickle.dumps(instance) for instance in instances]
+    encoded_instances = [codec.encode(instance) for instance in instances]
+    pickled_result = pickle.dumps(frozen)
+    encoded_result = cache_mixin.encode_result(codec, frozen)
+
+    def unpickle_instances(session):
+        for payload in pickled_instances:
+            session.merge(pickle.loads(payload), load=False)
+
+    def decode_instances(session):
+        for payload in encoded_instances:
+            codec.decode(payload, session)
+
+    def unpickle_result(session):
+        for instance in pickle.loads(pickled_result).data:
+            session.merge(instance, load=False)
+
+    results = {
+        'instance': {
+            'pickle': (sum(map(len, pickled_instances)),
+                       best_time(lambda _: [pickle.dumps(instance) for instance in instances], repeat),
+                       best_time(unpickle_instances, repeat, new_session)),
+            'codec': (sum(map(len, encoded_instances)),
+                      best_time(lambda _: [codec.encode(instance) for instance in instances], repeat),
+                      best_time(decode_instances, repeat, new_session)),
+        },
+        'result': {
+            'pickle': (len(pickled_result),
+                       best_time(lambda _: pickle.dumps(frozen), repeat),
+                       best_time(unpickle_result, repeat, new_session)),
+            'codec': (len(encoded_result),
+                      best_time(lambda _: cache_mixin.encode_result(codec, frozen), repeat),
+                      best_time(lambda session: cache_mixin.decode_result(codec, encoded_result, session).all(),
+                                repeat, new_session)),
+        },
+    }
+    return {case: {path: {'bytes': size / rows, 'encode_us': encode * 1e6 / rows, 'decode_us': decode * 1e6 / rows}
+                   for path, (size, encode, decode) in paths.items()}
+            for case, paths in results.items()}
+
+
+def print_results(results):
+    """Print every measure per case and path, with the codec/pickle ratio."""
+    print(f"{'case':<10}{'measure':<12}" + ''.join(f"{path:>12}" for path in PATHS) + f"{'codec/pickle':>14}")
+    for case in CASES:
+        for measure in MEASURES:
+            values = [results[case][path][measure] for path in PATHS]
+            print(f"{case:<10}{measure:<12}" + ''.join(f"{value:>12.2f}" for value in values)
+                  + f"{values[1] / values[0]:>14.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the pickled and msgpack cache payloads of CacheMixin.')
+    parser.add_argument('--rows', type=int, default=10000, help='Number of rows')
+    parser.add_argument('--columns', type=int, default=12, help='Data columns per row')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the values')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per path')
+    parser.add_argument('--output', type=str, default='cache_benchmark.json', help='JSON results file')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.rows, args.columns, args.repeat, args.seed)
+    print_results(results)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'params': {key: getattr(args, key) for key in ('rows', 'columns', 'seed', 'repeat')},
+            'results': results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
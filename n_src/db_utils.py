@@ -100,7 +100,7 @@ def map_pgsql_datatypes(pg_type: str) -> str:
         return 'Date'
     elif pg_type in ('time', 'timetz'):
         return 'Time'
-    elif pg_type.startswith('timestamp'):  # in ('timestamp', 'timestamptz'):
+    elif pg_type.startswith('timestamp') or pg_type == 'datetime':  # SQLite and MySQL call it datetime
         return "DateTime"
         # return "DateTime, server_default=text('NOW()')"
     elif pg_type in ('bytea', 'byte', 'blob'):
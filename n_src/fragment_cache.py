@@ -0,0 +1,139 @@
+"""
+fragment_cache.py: Incremental regeneration keyed on per-table schema fingerprints
+
+Each generator emits its output as one fragment of code per table. FragmentCache keeps
+those fragments on disk together with a fingerprint of the table they were generated
+from, so the next run only regenerates the tables whose definition changed and splices
+the cached fragments in for everything else.
+
+A table's fingerprint hashes its reflected columns, keys, constraints, indexes and
+comment. A fragment is reused only when neither its own table nor any of its FK
+neighbours (tables it references or that reference it) changed, and when the generator
+sources are unchanged, since any of those can alter the generated code.
+
+Usage:
+    cache = FragmentCache('.codegen_cache.json', inspector, salt=source_digest(__file__))
+    fragments = cache.emit('models', _gen_model_class_task, table_names, jobs, state)
+    cache.save()
+"""
+
+import hashlib
+import json
+import os
+
+from parallel import emit_parallel
+
+CACHE_VERSION = 1
+
+
+def source_digest(*paths):
+    """Hash the given source files, so cached fragments are dropped when a generator changes."""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def table_definition(inspector, table_name):
+    """Collect everything reflected about a table that can influence the generated code."""
+    return {
+        'columns': inspector.get_columns(table_name),
+        'pk_constraint': inspector.get_pk_constraint(table_name),
+        'foreign_keys': inspector.get_foreign_keys(table_name),
+        'unique_constraints': inspector.get_unique_constraints(table_name),
+        'indexes': inspector.get_indexes(table_name),
+        'check_constraints': inspector.get_check_constraints(table_name),
+        'comment': inspector.get_table_comment(table_name),
+    }
+
+
+def table_fingerprints(inspector, salt=''):
+    """
+    Fingerprint every table together with its FK neighbours.
+
+    Args:
+        inspector (Inspector): SQLAlchemy Inspector or SchemaSnapshot.
+        salt (str): Extra input mixed into every fingerprint, e.g. a digest of the generator sources.
+
+    Returns:
+        dict: table name -> hex digest that changes when the table or one of its FK neighbours changes.
+    """
+    table_names = inspector.get_table_names()
+    own = {}
+    neighbours = {table_name: set() for table_name in table_names}
+    for table_name in table_names:
+        # Column types are TypeEngine instances; their repr is stable and includes all arguments
+        definition = json.dumps(table_definition(inspector, table_name), sort_keys=True, default=repr)
+        own[table_name] = hashlib.blake2b((salt + definition).encode(), digest_size=16).hexdigest()
+        for fk in inspector.get_foreign_keys(table_name):
+            referred_table = fk['referred_table']
+            neighbours[table_name].add(referred_table)
+            neighbours.setdefault(referred_table, set()).add(table_name)
+
+    fingerprints = {}
+    for table_name in table_names:
+        digest = hashlib.blake2b(own[table_name].encode(), digest_size=16)
+        for neighbour in sorted(neighbours[table_name] - {table_name}):
+            digest.update(f"{neighbour}:{own.get(neighbour, '')}".encode())
+        fingerprints[table_name] = digest.hexdigest()
+    return fingerprints
+
+
+class FragmentCache:
+    """On-disk cache of per-table generated code fragments."""
+
+    def __init__(self, path, inspector, salt=''):
+        self.path = path
+        self.fingerprints = table_fingerprints(inspector, salt)
+        self.cached = self._load()
+        self.fragments = {}
+        self.regenerated = {}
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != CACHE_VERSION:
+            return {}
+        return data.get('fragments', {})
+
+    def emit(self, kind, func, table_names, jobs=1, state=None):
+        """
+        Return the fragment of every table, regenerating only the stale ones.
+
+        Args:
+            kind (str): Name of the output the fragments belong to, e.g. 'models'.
+            func (callable): Task taking (state, table_name), as for parallel.emit_parallel.
+            table_names (list): Tables to emit, in output order.
+            jobs (int): Number of worker processes used for the stale tables.
+            state (dict, optional): Read-only state passed to func.
+
+        Returns:
+            list: One fragment per table, in the order of table_names.
+        """
+        cached = self.cached.get(kind, {})
+        fragments = self.fragments.setdefault(kind, {})
+
+        stale = [t for t in table_names
+                 if t not in cached or cached[t]['fingerprint'] != self.fingerprints.get(t)]
+        generated = dict(zip(stale, emit_parallel(func, stale, jobs, state)))
+        self.regenerated[kind] = stale
+
+        result = []
+        for table_name in table_names:
+            code = generated[table_name] if table_name in generated else cached[table_name]['code']
+            fragments[table_name] = {'fingerprint': self.fingerprints.get(table_name), 'code': code}
+            result.append(code)
+        return result
+
+    def save(self):
+        """Write the cache, keeping fragments of outputs that were not generated in this run."""
+        fragments = dict(self.cached)
+        fragments.update(self.fragments)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'fragments': fragments}, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
@@ -25,12 +25,31 @@ Features:
 17. Breaks circular relationships to avoid infinite recursion
 
 Usage:
-python gen_models.py --uri "postgresql:///your_database_name" --output "your_models.py"
+python gen_models.py --uri "postgresql:///your_database_name" --output "your_models.py" [--jobs 4]
+
+With --jobs N the per-table classes are generated in N worker processes; the output is
+identical to a serial run.
+
+To generate without a database connection, dump the schema once and generate from the file:
+python gen_models.py --uri "postgresql:///your_database_name" --dump-schema schema.json
+python gen_models.py --from-snapshot schema.json --output "your_models.py"
+
+The lazy= strategy of each relationship is planned from the FK graph and the table row
+estimates (see lazy_planner.py); --lazy-overrides FILE overrides it per relationship.
+
+--advise-indexes MIGRATION adds the indexes the generated views and relationships need but the
+database lacks (see index_advisor.py) and writes them as an Alembic migration.
+
+--profile [TRACE] prints the time spent in each phase and table, the Inspector calls and the
+emitted lines and bytes, and writes the full trace as JSON (see profiling.py).
 
 Dependencies:
 - SQLAlchemy
 - inflect
 
+Schema information is read through a SchemaSnapshot (schema_snapshot.py), which loads
+the whole catalog in a handful of bulk queries instead of several queries per table.
+
 Note: This script requires utility functions from 'utils.py' and header generation
 functions from 'oheaders.py' in the same directory.
 """
@@ -47,8 +66,13 @@ import enum
 import argparse
 
 from oheaders import gen_model_header, gen_photo_column, gen_file_column
-from utils import snake_to_pascal
+from utils import snake_to_pascal, write_file
 from db_utils import map_pgsql_datatypes, get_display_column
+from schema_snapshot import SchemaSnapshot, load_schema
+from parallel import emit_parallel
+from lazy_planner import LazyPlanner, load_overrides
+from index_advisor import advise_indexes, format_index, render_migration
+import profiling
 
 p = inflect.engine()
 Base = declarative_base()
@@ -56,64 +80,83 @@ Base = declarative_base()
 # Set the indentation to 4 spaces
 INDENT = "    "
 
-# Track processed relationships to detect circular dependencies
-processed_relationships = set()
+# Order in which the sections of a model class are emitted
+CLASS_SECTIONS = ('header', 'columns', 'relationships', 'constraints', 'repr')
 
 
-def gen_models(metadata, inspector):
-    """Main function to generate model code."""
-    model_code = []
+def gen_models(metadata, inspector, jobs=1, lazy_overrides=None, index_suggestions=None):
+    """
+    Main function to generate model code.
 
+    Args:
+        metadata (MetaData): Reflected SQLAlchemy metadata.
+        inspector (Inspector): SQLAlchemy Inspector or SchemaSnapshot.
+        jobs (int): Number of worker processes used to generate the table classes.
+        lazy_overrides (dict, optional): Loader strategy overrides, see lazy_planner.load_overrides.
+        index_suggestions (dict, optional): Indexes to add to __table_args__, see index_advisor.advise_indexes.
+
+    Yields:
+        str: Lines of the generated models file, as soon as they are final.
+    """
     # Generate header, domains, and enums
-    model_code.extend(gen_model_header())
-    model_code.extend(gen_domains(inspector))
-    model_code.extend(gen_enums(inspector))
+    yield from gen_model_header()
+    yield from gen_domains(inspector)
+    yield from gen_enums(inspector)
 
     # Prepare relationship information
-    relationship_info = prepare_relationship_info(metadata, inspector)
-
-    # Generate regular tables and collect reverse relationships
-    reverse_relationships = {}
-    for table_name in inspector.get_table_names():
-        if table_name.startswith('ab_'):
-            continue
-        if not is_association_table(table_name, inspector):
-            table = metadata.tables[table_name]
-            table_code, reverse_rels = gen_table(table, inspector, relationship_info)
-            model_code.extend(table_code)
-            reverse_relationships[table_name] = reverse_rels
-
-    # Add reverse relationships to the appropriate tables
-    for table_name, relationships in reverse_relationships.items():
-        if table_name.startswith('ab_'):
-            continue
-        table_index = next(
-            i for i, line in enumerate(model_code) if line.startswith(f"class {snake_to_pascal(table_name)}("))
-        for rel in relationships:
-            insert_index = next(
-                (i for i, line in enumerate(model_code[table_index:]) if line.strip().startswith("def __repr__")), None)
-            if insert_index is not None:
-                insert_index += table_index
-            else:
-                insert_index = len(model_code)
-            model_code.insert(insert_index, f"{INDENT}{rel}")
-            model_code.insert(insert_index + 1, "")  # Add a blank line for readability
+    with profiling.phase('prepare_relationship_info'):
+        relationship_info = prepare_relationship_info(metadata, inspector, lazy_overrides)
+
+    # Each model class is kept as separate section buffers (see CLASS_SECTIONS) so that
+    # relationships discovered later can be appended to their class without searching
+    # and inserting into the generated lines. Everything is joined once at the end.
+    table_names = [table_name for table_name in inspector.get_table_names() if not table_name.startswith('ab_')]
+    association_tables = [t for t in table_names if t in relationship_info['association_tables']]
+    model_tables = [t for t in table_names if t not in relationship_info['association_tables']]
+
+    state = {'metadata': metadata, 'inspector': inspector, 'relationship_info': relationship_info,
+             'index_suggestions': index_suggestions or {}}
+    class_sections = {}
+    reverse_relationships = []
+    with profiling.phase('tables'):
+        table_sections = emit_parallel(_gen_table_task, model_tables, jobs, state)
+    for table_name, (sections, reverse_rels) in zip(model_tables, table_sections):
+        class_sections[table_name] = sections
+        reverse_relationships.extend(reverse_rels)
+
+    with profiling.phase('relationships'):
+        # Add reverse relationships to the referred tables
+        for referred_table, rel in reverse_relationships:
+            if referred_table in class_sections:
+                class_sections[referred_table]['relationships'].append(f"{INDENT}{rel}")
+
+        # Add the many-to-many relationships to the tables linked by each association table
+        processed_associations = set()
+        for table_name in association_tables:
+            update_related_tables_for_association(table_name, inspector, class_sections, processed_associations,
+                                                  relationship_info['lazy_planner'])
+
+    for sections in class_sections.values():
+        yield from join_class_sections(sections)
 
     # Generate association tables
-    for table_name in inspector.get_table_names():
-        if table_name.startswith('ab_'):
-            continue
-        if is_association_table(table_name, inspector):
-            model_code.extend(gen_association_table(table_name, metadata, inspector))
+    for table_name in association_tables:
+        yield from gen_association_table(table_name, metadata, inspector)
+
+
+def _gen_table_task(state, table_name):
+    """Process-pool task generating the class sections of one table (see parallel.emit_parallel)."""
+    return gen_table(state['metadata'].tables[table_name], state['inspector'], state['relationship_info'],
+                     state['index_suggestions'].get(table_name, ()))
 
-    # Update related tables for associations
-    for table_name in inspector.get_table_names():
-        if table_name.startswith('ab_'):
-            continue
-        if is_association_table(table_name, inspector):
-            model_code = update_related_tables_for_association(table_name, metadata, inspector, model_code)
 
-    return model_code
+def join_class_sections(sections):
+    """Join the section buffers of a model class into its lines of code."""
+    class_code = []
+    for section in CLASS_SECTIONS:
+        class_code.extend(sections[section])
+    class_code.append("\n")
+    return class_code
 
 
 def gen_domains(inspector):
@@ -247,34 +290,35 @@ def gen_association_table(table_name, metadata, inspector):
     return table_code
 
 
-def update_related_tables_for_association(table_name, metadata, inspector, model_code):
-    """Update related tables to include the association relationship for many-to-many relationships."""
+def update_related_tables_for_association(table_name, inspector, class_sections, processed_relationships,
+                                          lazy_planner=None):
+    """
+    Update related tables to include the association relationship for many-to-many relationships.
+
+    The relationships are appended to the 'relationships' section of each referred table's class.
+    processed_relationships is the set of (referred table, association table) pairs already added.
+    lazy_planner (LazyPlanner) picks the loader strategy of each relationship.
+    """
     fks = inspector.get_foreign_keys(table_name)
 
     # Handle tables with two or more foreign keys
     if len(fks) < 2:
-        return model_code
+        return
 
     for fk in fks:
         referred_table = fk['referred_table']
-        referred_table_class = snake_to_pascal(referred_table)
 
         # Determine the relationship name
         relationship_name = p.plural(table_name)
 
-        # Locate the table class in the model code
-        table_start_index = next((i for i, line in enumerate(model_code)
-                                  if line.startswith(f"class {referred_table_class}(")), None)
-
-        if table_start_index is None:
+        # Locate the table class
+        sections = class_sections.get(referred_table)
+        if sections is None:
             continue  # Skip if the related table is not found
 
-        # Find the correct insertion index
-        insert_index = find_insertion_index(model_code, table_start_index)
-
         # Check if the relationship already exists
         existing_relationship = any(f"{relationship_name} = relationship(" in line
-                                    for line in model_code[table_start_index:insert_index])
+                                    for line in sections['relationships'])
 
         if not existing_relationship:
             # Add the relationship to the related table
@@ -286,25 +330,19 @@ def update_related_tables_for_association(table_name, metadata, inspector, model
             if relationship_key in processed_relationships:
                 continue  # Avoid circular relationship
 
+            lazy = ''
+            if lazy_planner:
+                strategy = lazy_planner.collection(referred_table, relationship_name, other_fk['referred_table'],
+                                                   via=table_name)
+                lazy = f", lazy='{strategy}'"
             relationship_str = (f"{INDENT}{relationship_name} = relationship('{other_table_class}', "
                                 f"secondary='{table_name}', "
-                                f"back_populates='{p.plural(referred_table)}')")
-            model_code.insert(insert_index, relationship_str)
-            model_code.insert(insert_index + 1, "")  # Add a blank line for readability
+                                f"back_populates='{p.plural(referred_table)}'{lazy})")
+            sections['relationships'].append(relationship_str)
 
             # Record this relationship as processed
             processed_relationships.add(relationship_key)
 
-    return model_code
-
-
-def find_insertion_index(model_code, table_start_index):
-    """Find the correct index to insert the relationship in the model code."""
-    for i, line in enumerate(model_code[table_start_index:]):
-        if line.strip().startswith("def __repr__") or line.startswith("class "):
-            return i + table_start_index
-    return len(model_code)  # If no suitable position is found, append at the end
-
 
 def gen_tables(metadata, inspector, relationship_info, association_tables):
     """Generate code for database tables, excluding association tables."""
@@ -312,13 +350,22 @@ def gen_tables(metadata, inspector, relationship_info, association_tables):
     for table_name in inspector.get_table_names():
         if table_name not in association_tables:
             table = metadata.tables[table_name]
-            table_code.extend(gen_table(table, inspector, relationship_info))
+            sections, _ = gen_table(table, inspector, relationship_info)
+            table_code.extend(join_class_sections(sections))
     return table_code
 
 
-def gen_table(table, inspector, relationship_info):
-    """Generate code for a single table, including all constraints, indexes, and comments."""
-    table_code = []
+def gen_table(table, inspector, relationship_info, suggested_indexes=()):
+    """
+    Generate code for a single table, including all constraints, indexes, and comments.
+
+    suggested_indexes are index advisor suggestions (see index_advisor.py) added to __table_args__.
+
+    Returns:
+        tuple: (sections, reverse_relationships) where sections maps each name in CLASS_SECTIONS
+            to its lines of code, and reverse_relationships is a list of (referred table name,
+            relationship line) to be added to the referred tables.
+    """
     table_name = table.name
     columns = inspector.get_columns(table_name)
     pk_constraint = inspector.get_pk_constraint(table_name)
@@ -328,25 +375,26 @@ def gen_table(table, inspector, relationship_info):
     table_comment = inspector.get_table_comment(table_name)
 
     table_class = snake_to_pascal(table_name)
-    table_code.append(f"class {table_class}(Model):")
-    table_code.append(f'{INDENT}__tablename__ = "{table_name}"')
-    table_code.extend(gen_table_args(pk_constraint, uqs, indexes, table_comment))
+    sections = {section: [] for section in CLASS_SECTIONS}
+    sections['header'].append(f"class {table_class}(Model):")
+    sections['header'].append(f'{INDENT}__tablename__ = "{table_name}"')
+    sections['header'].extend(gen_table_args(pk_constraint, uqs, indexes, table_comment, suggested_indexes))
 
-    table_code.extend(gen_columns(columns, pk_constraint, fks, uqs, table_class))
+    sections['columns'].extend(gen_columns(columns, pk_constraint, fks, uqs, table_class))
 
+    # Relationships already generated for this table, to skip duplicates and circular references
+    processed_relationships = set()
     reverse_relationships = []
     for fk in fks:
-        local_rel, reverse_rel = gen_relationship(fk, table_name, table_class, inspector, relationship_info)
-        if local_rel and isinstance(local_rel, list) and local_rel:
-            table_code.extend(local_rel)
-        if reverse_rel and isinstance(reverse_rel, list) and reverse_rel:
-            reverse_relationships.extend(reverse_rel)
+        local_rel, reverse_rel = gen_relationship(fk, table_name, table_class, inspector, relationship_info,
+                                                  processed_relationships)
+        sections['relationships'].extend(local_rel)
+        reverse_relationships.extend((fk['referred_table'], rel) for rel in reverse_rel)
 
-    table_code.extend(gen_check_constraints(inspector, table_name))
-    table_code.extend(gen_repr_method(columns, pk_constraint))
+    sections['constraints'].extend(gen_check_constraints(inspector, table_name))
+    sections['repr'].extend(gen_repr_method(columns, pk_constraint))
 
-    table_code.append("\n")
-    return table_code, reverse_relationships
+    return sections, reverse_relationships
 
 
 def gen_columns(columns, pk_constraint, fks, uqs, table_class):
@@ -409,8 +457,13 @@ def gen_column(column, pk_columns, fks, uqs, table_class):
     return column_code
 
 
-def gen_relationship(fk, table_name, table_class, inspector, relationship_info):
-    """Generate code for relationships, handling both sides of the relationship."""
+def gen_relationship(fk, table_name, table_class, inspector, relationship_info, processed_relationships):
+    """
+    Generate code for relationships, handling both sides of the relationship.
+
+    processed_relationships is the set of (table, referred table) pairs already generated for
+    this table; it is updated in place.
+    """
     relationship_code = []
     reverse_relationship_code = []
 
@@ -425,7 +478,8 @@ def gen_relationship(fk, table_name, table_class, inspector, relationship_info):
         return relationship_code, reverse_relationship_code  # Avoid circular relationship
 
     # Determine relationship type
-    cardinality = relationship_info[table_name].get(referred_table, 'many-to-one')
+    cardinality = relationship_info['cardinality'][table_name].get(referred_table, 'many-to-one')
+    lazy_planner = relationship_info['lazy_planner']
 
     # Handle naming for the relationship
     local_relationship_name = determine_relationship_name(fk_cols)
@@ -433,11 +487,13 @@ def gen_relationship(fk, table_name, table_class, inspector, relationship_info):
 
     # Handle many-to-many relationships
     if cardinality == 'many-to-many':
-        association_table = find_association_table(table_name, referred_table, inspector)
+        association_table = find_association_table(table_name, referred_table, relationship_info)
         if association_table:
+            strategy = lazy_planner.collection(table_name, p.plural(referred_table), referred_table,
+                                               via=association_table)
             relationship_code.append(
                 f"{INDENT}{p.plural(referred_table)} = relationship('{referred_class}', "
-                f"secondary='{association_table}', back_populates='{remote_relationship_name}')"
+                f"secondary='{association_table}', back_populates='{remote_relationship_name}', lazy='{strategy}')"
             )
             # Record this relationship as processed
             processed_relationships.add(relationship_key)
@@ -446,10 +502,12 @@ def gen_relationship(fk, table_name, table_class, inspector, relationship_info):
     # Generate relationship for the current table
     relationship_args = [f"'{referred_class}'", f"back_populates='{remote_relationship_name}'"]
 
-    if cardinality == 'many-to-one':
-        relationship_args.append("lazy='joined'")
+    if cardinality in ('many-to-one', 'one-to-one'):
+        strategy = lazy_planner.scalar(table_name, local_relationship_name, referred_table)
+        relationship_args.append(f"lazy='{strategy}'")
     elif cardinality == 'one-to-many':
-        relationship_args.append("lazy='selectin'")
+        strategy = lazy_planner.collection(table_name, local_relationship_name, referred_table)
+        relationship_args.append(f"lazy='{strategy}'")
 
     if table_class == referred_class:  # self-referential
         relationship_args.append(f"remote_side=[{', '.join([f'{referred_class}.{col}' for col in referred_columns])}]")
@@ -460,10 +518,14 @@ def gen_relationship(fk, table_name, table_class, inspector, relationship_info):
     # Generate the reverse relationship (to be added to the referred table)
     reverse_relationship_args = [f"'{table_class}'", f"back_populates='{local_relationship_name}'"]
 
-    if cardinality == 'one-to-many':
-        reverse_relationship_args.append("lazy='selectin'")
-    elif cardinality == 'many-to-one':
-        reverse_relationship_args.append("lazy='joined'")
+    if cardinality in ('one-to-many', 'many-to-one'):
+        # The referred table gets the collection of rows pointing at it
+        strategy = lazy_planner.collection(referred_table, remote_relationship_name, table_name)
+        reverse_relationship_args.append(f"lazy='{strategy}'")
+    elif cardinality == 'one-to-one':
+        # Only one side of a one-to-one pair is joined
+        strategy = lazy_planner.scalar(referred_table, remote_relationship_name, table_name, allow_joined=False)
+        reverse_relationship_args.append(f"lazy='{strategy}'")
 
     reverse_relationship_str = ', '.join(reverse_relationship_args)
     reverse_relationship_code.append(f"{remote_relationship_name} = relationship({reverse_relationship_str})")
@@ -489,7 +551,7 @@ def determine_remote_relationship_name(cardinality, table_name, referred_table):
     return table_name
 
 
-def gen_table_args(pk_constraint, uqs, indexes, table_comment):
+def gen_table_args(pk_constraint, uqs, indexes, table_comment, suggested_indexes=()):
     """Generate __table_args__ for composite primary keys, unique constraints, indexes, and table comments."""
     table_args = []
     pk_columns = pk_constraint['constrained_columns']
@@ -508,6 +570,9 @@ def gen_table_args(pk_constraint, uqs, indexes, table_comment):
         unique_str = ", unique=True" if idx["unique"] else ""
         table_args.append(f"Index('{idx['name']}', {idx_columns_str}{unique_str})")
 
+    for suggestion in suggested_indexes:
+        table_args.append(format_index(suggestion))
+
     if table_comment['text']:
         cmnt = {'comment': table_comment['text']}
         table_args.append(str(cmnt))
@@ -662,8 +727,8 @@ def is_association_table(table_name, inspector):
     return True
 
 
-def analyze_cardinality(table_name, fk, inspector):
-    """Analyze the cardinality of a relationship."""
+def analyze_cardinality(table_name, fk, inspector, association_tables):
+    """Analyze the cardinality of a relationship, given the set of known association tables."""
     referred_table = fk["referred_table"]
     constrained_columns = fk["constrained_columns"]
     referred_columns = fk["referred_columns"]
@@ -672,7 +737,7 @@ def analyze_cardinality(table_name, fk, inspector):
         # Self-referencing table
         return handle_self_referencing_table(table_name, constrained_columns, referred_columns, inspector)
 
-    if is_association_table(table_name, inspector):
+    if table_name in association_tables:
         return 'many-to-many'
 
     pk_constraint = inspector.get_pk_constraint(table_name)
@@ -720,47 +785,113 @@ def handle_self_referencing_table(table_name, constrained_columns, referred_colu
     return 'many-to-many'
 
 
-def prepare_relationship_info(metadata, inspector):
-    """Prepare relationship information for all tables."""
-    relationship_info = {}
-    for table_name in inspector.get_table_names():
-        relationship_info[table_name] = {}
-        for fk in inspector.get_foreign_keys(table_name):
+def prepare_relationship_info(metadata, inspector, lazy_overrides=None):
+    """
+    Prepare relationship information for all tables.
+
+    The whole relationship graph is built here in one pass over the foreign keys, so every
+    later question (is this an association table, what is the cardinality of this FK, which
+    table links these two) is a dictionary lookup.
+
+    Args:
+        metadata (MetaData): Reflected SQLAlchemy metadata.
+        inspector (Inspector): SQLAlchemy Inspector or SchemaSnapshot.
+        lazy_overrides (dict, optional): Loader strategy overrides, see lazy_planner.load_overrides.
+
+    Returns:
+        dict: The relationship graph:
+            'association_tables': set of association table names
+            'foreign_keys': table name -> list of its foreign keys
+            'cardinality': table name -> {referred table name: cardinality}
+            'association_pairs': frozenset of referred table names -> association table name
+            'lazy_planner': LazyPlanner choosing the loader strategy of each relationship
+    """
+    table_names = inspector.get_table_names()
+    relationship_info = {
+        'association_tables': set(),
+        'foreign_keys': {},
+        'cardinality': {},
+        'association_pairs': {},
+    }
+
+    for table_name in table_names:
+        fks = inspector.get_foreign_keys(table_name)
+        relationship_info['foreign_keys'][table_name] = fks
+
+        if is_association_table(table_name, inspector):
+            relationship_info['association_tables'].add(table_name)
+            referred_tables = {fk['referred_table'] for fk in fks}
+            # The first association table (in table order) linking two tables wins
+            for table1 in referred_tables:
+                for table2 in referred_tables:
+                    relationship_info['association_pairs'].setdefault(frozenset((table1, table2)), table_name)
+
+    for table_name in table_names:
+        relationship_info['cardinality'][table_name] = {}
+        for fk in relationship_info['foreign_keys'][table_name]:
             referred_table = fk['referred_table']
-            cardinality = analyze_cardinality(table_name, fk, inspector)
-            relationship_info[table_name][referred_table] = cardinality
+            cardinality = analyze_cardinality(table_name, fk, inspector, relationship_info['association_tables'])
+            relationship_info['cardinality'][table_name][referred_table] = cardinality
+
+    row_estimates = inspector.get_row_estimates() if hasattr(inspector, 'get_row_estimates') else {}
+    relationship_info['lazy_planner'] = LazyPlanner(relationship_info['foreign_keys'], row_estimates, lazy_overrides)
     return relationship_info
 
 
-def find_association_table(table1, table2, inspector):
+def find_association_table(table1, table2, relationship_info):
     """Find the association table for a many-to-many relationship."""
-    for table_name in inspector.get_table_names():
-        if is_association_table(table_name, inspector):
-            fks = inspector.get_foreign_keys(table_name)
-            referred_tables = {fk['referred_table'] for fk in fks}
-            if table1 in referred_tables and table2 in referred_tables:
-                return table_name
-    return None
+    return relationship_info['association_pairs'].get(frozenset((table1, table2)))
 
 
 def main():
     """Main execution function."""
     parser = argparse.ArgumentParser(description='Generate SQLAlchemy models from database schema.')
-    parser.add_argument('--uri', type=str, required=True, help='Database URI')
+    parser.add_argument('--uri', type=str, help='Database URI')
     parser.add_argument('--output', type=str, default='generated_models.py', help='Output file name')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of worker processes for per-table generation')
+    parser.add_argument('--dump-schema', type=str, metavar='FILE', help='Write the reflected schema to FILE and exit')
+    parser.add_argument('--from-snapshot', type=str, metavar='FILE', help='Generate from a schema dumped with --dump-schema')
+    parser.add_argument('--lazy-overrides', type=str, metavar='FILE',
+                        help='JSON file overriding the planned lazy= strategy of relationships')
+    parser.add_argument('--advise-indexes', type=str, metavar='MIGRATION',
+                        help='Add the indexes the generated views need to the models and write an Alembic migration')
+    parser.add_argument('--down-revision', type=str, help='Alembic revision the index migration follows')
+    parser.add_argument('--create-date', type=str, help='Create Date of the index migration (default: none)')
+    parser.add_argument('--profile', type=str, nargs='?', const='profile.json', metavar='TRACE',
+                        help='Print per-phase timings and write a JSON trace (default profile.json)')
     args = parser.parse_args()
-
-    engine = create_engine(args.uri)
-    inspector = inspect(engine)
-    metadata = MetaData()
-    metadata.reflect(bind=engine)
-
-    model_code = gen_models(metadata, inspector)
-
-    with open(args.output, "w") as f:
-        f.write("\n".join(model_code))
+    if not args.uri and not args.from_snapshot:
+        parser.error('one of --uri or --from-snapshot is required')
+
+    if args.dump_schema:
+        SchemaSnapshot.from_engine(create_engine(args.uri)).dump(args.dump_schema)
+        print(f"Schema written to {args.dump_schema}")
+        return
+
+    profiler = profiling.enable() if args.profile else None
+    with profiling.phase('reflection'):
+        metadata, snapshot = load_schema(args.uri, args.from_snapshot)
+    snapshot = profiling.count_calls(snapshot)
+
+    with profiling.phase('gen_models'):
+        lazy_overrides = load_overrides(args.lazy_overrides) if args.lazy_overrides else None
+        index_suggestions = None
+        if args.advise_indexes:
+            with profiling.phase('index_advisor'):
+                index_suggestions = advise_indexes(metadata, snapshot)
+                write_file(args.advise_indexes, render_migration(index_suggestions, down_revision=args.down_revision,
+                                                                    create_date=args.create_date))
+            count = sum(len(table_suggestions) for table_suggestions in index_suggestions.values())
+            print(f"{count} suggested indexes. Migration written to {args.advise_indexes}")
+        model_code = gen_models(metadata, snapshot, jobs=args.jobs, lazy_overrides=lazy_overrides,
+                                index_suggestions=index_suggestions)
+        write_file(args.output, profiling.counted(model_code), atomic=True)
 
     print(f"Models generated successfully. Output written to {args.output}")
+    if profiler:
+        profiler.print_summary()
+        profiler.dump(args.profile)
+        print(f"Profile trace written to {args.profile}")
 
 
 if __name__ == "__main__":
@@ -15,26 +15,43 @@ from sqlalchemy.orm import RelationshipProperty
 from sqlalchemy.sql import sqltypes
 from flask import g, flash, redirect, url_for, session
 # from flask_appbuilder.models.sqla.interface import SQLAInterface
-from utils import snake_to_pascal, snake_to_words, pascal_to_words
+from utils import snake_to_pascal, snake_to_words, pascal_to_words, write_file
+from schema_snapshot import SchemaSnapshot, load_schema
+from parallel import emit_parallel
+from large_tables import (DEFAULT_KEYSET_THRESHOLD, DEFAULT_COUNT_THRESHOLD, DATAMODEL_IMPORTS, VIEW_MIXIN,
+                          API_MIXIN, plan_large_tables, parse_sort_keys, heavy_columns, projection_options,
+                          class_bases, datamodel_code)
+import profiling
 
 p = inflect.engine()
 
-def generate_views(database_uri):
+def generate_views(database_uri, jobs=1, snapshot_path=None):
     """
     Generate Flask-AppBuilder views for all tables in the database.
 
     :param database_uri: SQLAlchemy database URI
+    :param jobs: Number of worker processes used for the per-table model and API views
+    :param snapshot_path: Schema file written with --dump-schema, used instead of the database
     :return: String containing the generated views code
     """
-    engine = create_engine(database_uri)
-    metadata = MetaData()
-    metadata.reflect(bind=engine)
-    inspector = inspect(engine)
+    metadata, inspector = load_schema(database_uri, snapshot_path)
+    return "\n".join(iter_views(metadata, inspector, jobs))
 
-    views = []
 
+def iter_views(metadata, inspector, jobs=1, large_tables=None, projection=True):
+    """
+    Generate the views file chunk by chunk, for streaming it to disk with write_file.
+
+    :param metadata: Reflected SQLAlchemy metadata
+    :param inspector: SQLAlchemy Inspector or SchemaSnapshot
+    :param jobs: Number of worker processes used for the per-table model and API views
+    :param large_tables: Datamodel options of the large tables, see large_tables.plan_large_tables
+    :param projection: Keep heavy columns out of lists and defer them (see large_tables.projection_options)
+    :return: Iterator over the chunks of the generated views code
+    """
+    large_tables = large_tables or {}
     # Add necessary imports
-    views.extend([
+    yield from [
         "from flask_appbuilder import ModelView, MasterDetailView, MultipleView",
         "from flask_appbuilder.models.sqla.interface import SQLAInterface",
         "from flask_appbuilder.fields import AJAXSelectField, QuerySelectField",
@@ -54,65 +71,75 @@ def generate_views(database_uri):
         "from wtforms import StringField, BooleanField, DecimalField",
         "from . import appbuilder, db",
         "from .models import *\n\n"
-    ])
+    ]
+    if large_tables or (projection and any(heavy_columns(table) for table in metadata.sorted_tables)):
+        yield DATAMODEL_IMPORTS
 
     # Generate regular ModelViews
-    model_views = generate_model_views(metadata, inspector)
-    views.extend(model_views)
+    with profiling.phase('model_views'):
+        yield from generate_model_views(metadata, inspector, jobs, large_tables, projection)
 
     # Generate MasterDetailViews
-    master_detail_views = generate_master_detail_views(metadata, inspector)
-    views.extend(master_detail_views)
+    with profiling.phase('master_detail_views'):
+        yield from generate_master_detail_views(metadata, inspector)
 
     # Generate MultipleViews
-    multiple_views = generate_multiple_views(metadata)
-    views.extend(multiple_views)
+    with profiling.phase('multiple_views'):
+        yield from generate_multiple_views(metadata)
 
-    chart_views = generate_charts(metadata, inspector)
-    views.extend(chart_views)
+    with profiling.phase('charts'):
+        yield from generate_charts(metadata, inspector)
 
-    api_views = generate_api_views(metadata, inspector)
-    views.extend(api_views)
+    with profiling.phase('api_views'):
+        yield from generate_api_views(metadata, inspector, jobs, large_tables, projection)
 
     # Add view registration functions
-    views.extend(generate_view_registration_functions())
+    yield from generate_view_registration_functions()
 
-    return "\n".join(views)
 
 
 
+def generate_model_views(metadata, inspector, jobs=1, large_tables=None, projection=False):
+    # Skip Flask-AppBuilder system tables
+    table_names = [table.name for table in metadata.sorted_tables if not table.name.lower().startswith('ab_')]
+    state = {'metadata': metadata, 'inspector': inspector, 'large_tables': large_tables or {}, 'projection': projection}
+    return emit_parallel(_generate_model_view_task, table_names, jobs, state)
 
-def generate_model_views(metadata, inspector):
-    model_views = []
-    for table in metadata.sorted_tables:
-        model_name = snake_to_pascal(table.name)
-        view_class = f"{model_name}View"
 
-        # Skip Flask-AppBuilder system tables
-        if table.name.lower().startswith('ab_'):
-            continue
+def _generate_model_view_task(state, table_name):
+    """Process-pool task generating the ModelView of one table (see parallel.emit_parallel)."""
+    metadata = state['metadata']
+    table = metadata.tables[table_name]
+    model_name = snake_to_pascal(table.name)
+    view_class = f"{model_name}View"
+    options = state['large_tables'].get(table_name)
+    projection = state['projection']
 
-        if len(get_columns(table, 'add')) > 10:  # Threshold for multi-step form
-            model_views.append(generate_multistep_view(table, model_name, view_class, inspector, metadata))
-        else:
-            model_views.append(generate_model_view(table, model_name, view_class, inspector, metadata))
+    if len(get_columns(table, 'add')) > 10:  # Threshold for multi-step form
+        return generate_multistep_view(table, model_name, view_class, state['inspector'], metadata, options, projection)
+    return generate_model_view(table, model_name, view_class, state['inspector'], metadata, options, projection)
 
-    return model_views
 
 
+def generate_model_view(table: Table, model_name: str, view_class: str, inspector: Any, metadata: Any,
+                        large_table: Dict = None, projection: bool = False) -> str:
+    """
+    Generate a comprehensive ModelView for a table.
 
-def generate_model_view(table: Table, model_name: str, view_class: str, inspector: Any, metadata: Any) -> str:
-    """Generate a comprehensive ModelView for a table."""
-    list_columns = get_columns(table, 'list')
+    large_table holds the table's options from plan_large_tables; projection keeps heavy columns
+    out of the list (see project_list).
+    """
+    list_columns, large_table = project_list(table, get_columns(table, 'list'), large_table, projection)
     show_columns = get_columns(table, 'show')
     add_columns = get_columns(table, 'add')
     edit_columns = get_columns(table, 'edit')
     search_columns = get_search_columns(table)
     label_columns = get_label_columns(table)
 
+    default_datamodel = f"SQLAInterface('{model_name}')"
     view_code = [
-        f"class {view_class}(ModelView):",
-        f"    datamodel = SQLAInterface('{model_name}')",
+        f"class {view_class}({class_bases('ModelView', VIEW_MIXIN, large_table)}):",
+        f"    datamodel = {datamodel_code(model_name, large_table, default_datamodel)}",
         f"    list_title = '{snake_to_words(table.name)} List'",
         f"    show_title = '{snake_to_words(table.name)} Details'",
         f"    add_title = 'Add {snake_to_words(table.name)}'",
@@ -204,7 +231,7 @@ def generate_master_detail_views(metadata, inspector):
     for table in metadata.sorted_tables:
         if table.name.lower().startswith('ab_'):
             continue
-        for fk in table.foreign_keys:
+        for fk in get_foreign_keys(table):
             parent_table = fk.column.table
             parent_model_name = snake_to_pascal(parent_table.name)
             child_model_name = snake_to_pascal(table.name)
@@ -308,17 +335,17 @@ def generate_multiple_views(metadata):
     for table in metadata.sorted_tables:
         if table.name.lower().startswith('ab_'):
             continue
-        related_tables = set()
+        related_tables = {}  # Used as an ordered set
 
         # Identify tables that this table references
-        for fk in table.foreign_keys:
-            related_tables.add(fk.column.table)
+        for fk in get_foreign_keys(table):
+            related_tables[fk.column.table] = None
 
         # Identify tables that reference this table
         for other_table in metadata.sorted_tables:
-            for fk in other_table.foreign_keys:
+            for fk in get_foreign_keys(other_table):
                 if fk.column.table == table:
-                    related_tables.add(other_table)
+                    related_tables[other_table] = None
 
         # Only generate MultipleView if there are more than one related tables
         if len(related_tables) > 1:
@@ -349,14 +376,16 @@ def generate_multiple_views(metadata):
 
     return multiple_views
 
-def generate_api_view(table: Any, model_name: str) -> str:
-    """Generate an API view for a table."""
+def generate_api_view(table: Any, model_name: str, large_table: Dict = None, projection: bool = False) -> str:
+    """Generate an API view for a table; large_table and projection as for generate_model_view."""
     columns = get_columns(table)
+    list_columns, large_table = project_list(table, columns, large_table, projection)
+    default_datamodel = f"SQLAInterface('{model_name}')"
     api_view_code = [
-        f"class {model_name}API(ModelRestApi):",
+        f"class {model_name}API({class_bases('ModelRestApi', API_MIXIN, large_table)}):",
         f"    resource_name = '{snake_to_words(table.name).lower()}'",
-        f"    datamodel = SQLAInterface('{model_name}')",
-        f"    list_columns = {columns}",
+        f"    datamodel = {datamodel_code(model_name, large_table, default_datamodel)}",
+        f"    list_columns = {list_columns}",
         f"    show_columns = {columns}",
         f"    add_columns = {[col for col in columns if col != 'id']}",
         f"    edit_columns = {[col for col in columns if col != 'id']}",
@@ -402,19 +431,22 @@ def generate_view_registration_functions():
 
 
 # TODO: Explore hiding fieldsets
-def generate_multistep_view(table: Table, model_name: str, view_class: str, inspector: Any, metadata: Any) -> str:
+def generate_multistep_view(table: Table, model_name: str, view_class: str, inspector: Any, metadata: Any,
+                            large_table: Dict = None, projection: bool = False) -> str:
     """Generate a multi-step view for models with many fields."""
     columns = get_columns(table, 'add')
+    list_columns, large_table = project_list(table, get_columns(table, 'list'), large_table, projection)
     step_size = 5  # Number of fields per step
     num_steps = math.ceil(len(columns) / step_size)
 
+    default_datamodel = f"SQLAInterface('{model_name}')"
     view_code = [
-        f"class {view_class}(ModelView):",
-        f"    datamodel = SQLAInterface('{model_name}')",
+        f"class {view_class}({class_bases('ModelView', VIEW_MIXIN, large_table)}):",
+        f"    datamodel = {datamodel_code(model_name, large_table, default_datamodel)}",
         f"    list_title = '{snake_to_words(table.name)} List'",
         f"    add_title = 'Add {snake_to_words(table.name)}'",
         f"    edit_title = 'Edit {snake_to_words(table.name)}'",
-        f"    list_columns = {get_columns(table, 'list')}",
+        f"    list_columns = {list_columns}",
         f"    show_columns = {get_columns(table, 'show')}",
         f"    search_columns = {get_search_columns(table)}",
         f"    label_columns = {get_label_columns(table)}",
@@ -591,6 +623,36 @@ def get_columns(table: Any, purpose: str = 'list') -> List[str]:
 
     return columns
 
+def project_list(table: Table, list_columns: List[str], large_table: Dict = None, projection: bool = False):
+    """
+    Drop the heavy columns from a view's list columns and add the datamodel options loading only the rest.
+
+    :param table: SQLAlchemy Table object
+    :param list_columns: The view's list columns
+    :param large_table: The table's options from plan_large_tables, if any
+    :param projection: Leave list_columns and large_table as they are when False
+    :return: Tuple of the list columns and the datamodel options (None when there are none)
+    """
+    if not projection:
+        return list_columns, large_table
+    heavy = heavy_columns(table)
+    list_columns = [column for column in list_columns if column not in heavy]
+    options = {**(large_table or {}), **projection_options(table, list_columns)}
+    return list_columns, options or None
+
+def get_foreign_keys(table: Table) -> List[ForeignKey]:
+    """
+    Return the foreign keys of a table in column order.
+
+    Table.foreign_keys is a set whose iteration order changes from run to run, so the
+    generated code must never iterate it directly.
+
+    :param table: SQLAlchemy Table object
+    :return: List of ForeignKey objects
+    """
+    return [fk for column in table.columns
+            for fk in sorted(column.foreign_keys, key=lambda fk: fk.target_fullname)]
+
 def get_search_columns(table):
     """Generate list of searchable columns."""
     return [col.name for col in table.columns if isinstance(col.type, (sqltypes.String, sqltypes.Text))]
@@ -676,7 +738,7 @@ def generate_validators(table: Any, inspector: Any) -> str:
 def generate_form_query_rel_fields(table: Any) -> str:
     """Generate form_query_rel_fields for foreign key relationships."""
     form_query_rel_fields = {}
-    for fk in table.foreign_keys:
+    for fk in get_foreign_keys(table):
         referred_table = fk.column.table
         form_query_rel_fields[fk.parent.name] = f"db.session.query({snake_to_pascal(referred_table.name)})"
 
@@ -876,7 +938,7 @@ def generate_relationship_fields(table: Table, metadata: Any) -> str:
     relationship_fields = []
 
     # Handle one-to-many and many-to-one relationships
-    for fk in table.foreign_keys:
+    for fk in get_foreign_keys(table):
         related_table = fk.column.table
         related_model = snake_to_pascal(related_table.name)  # Use consistent PascalCase conversion
         field_name = fk.parent.name.replace('_id', '')
@@ -892,10 +954,10 @@ def generate_relationship_fields(table: Table, metadata: Any) -> str:
     for other_table in metadata.tables.values():
         if is_association_table(other_table):
             # Check if this table is referenced in the association table
-            foreign_keys = [fk for fk in other_table.foreign_keys if fk.column.table == table]
+            foreign_keys = [fk for fk in get_foreign_keys(other_table) if fk.column.table == table]
             if foreign_keys:
                 # Identify the other related table in the many-to-many relationship
-                other_related_table = [fk.column.table for fk in other_table.foreign_keys if fk.column.table != table][0]
+                other_related_table = [fk.column.table for fk in get_foreign_keys(other_table) if fk.column.table != table][0]
                 related_model = snake_to_pascal(other_related_table.name)
                 field_name = f"{snake_to_pascal(other_related_table.name).lower()}s"  # Pluralize the relationship field name
 
@@ -975,24 +1037,29 @@ def get_related_model_columns(model: Any) -> List[str]:
     return [col.name for col in model.__table__.columns
             if col.name in ['name', 'title', 'label', 'description']]
 
-def generate_api_views(metadata: MetaData, inspector: Any) -> List[str]:
+def generate_api_views(metadata: MetaData, inspector: Any, jobs: int = 1, large_tables: Dict = None,
+                       projection: bool = False) -> List[str]:
     """
     Generate API views for all tables in the database.
 
     :param metadata: SQLAlchemy MetaData object
     :param inspector: SQLAlchemy Inspector object
+    :param jobs: Number of worker processes used to generate the API views
+    :param large_tables: Datamodel options of the large tables, see large_tables.plan_large_tables
+    :param projection: Keep heavy columns out of lists and defer them (see project_list)
     :return: List of strings containing the generated API view code
     """
-    api_views = []
-    for table in metadata.sorted_tables:
-        model_name = snake_to_pascal(table.name)
+    # Skip Flask-AppBuilder system tables
+    table_names = [table.name for table in metadata.sorted_tables
+                   if not snake_to_pascal(table.name).lower().startswith('ab_')]
+    state = {'metadata': metadata, 'large_tables': large_tables or {}, 'projection': projection}
+    return emit_parallel(_generate_api_view_task, table_names, jobs, state)
 
-        # Skip Flask-AppBuilder system tables
-        if model_name.lower().startswith('ab_'):
-            continue
 
-        api_views.append(generate_api_view(table, model_name))
-    return api_views
+def _generate_api_view_task(state, table_name):
+    """Process-pool task generating the API view of one table (see parallel.emit_parallel)."""
+    return generate_api_view(state['metadata'].tables[table_name], snake_to_pascal(table_name),
+                             state['large_tables'].get(table_name), state['projection'])
 
 def generate_charts(metadata: MetaData, inspector: Any) -> List[str]:
     """
@@ -1089,16 +1156,50 @@ def get_suitable_y_axis(table: Table) -> str:
 
 def main():
     parser = argparse.ArgumentParser(description='Generate Flask-AppBuilder views from database schema.')
-    parser.add_argument('--uri', type=str, required=True, help='Database URI')
+    parser.add_argument('--uri', type=str, help='Database URI')
     parser.add_argument('--output', type=str, default='views.py', help='Output file name')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of worker processes for per-table generation')
+    parser.add_argument('--dump-schema', type=str, metavar='FILE', help='Write the reflected schema to FILE and exit')
+    parser.add_argument('--from-snapshot', type=str, metavar='FILE', help='Generate from a schema dumped with --dump-schema')
+    parser.add_argument('--keyset-threshold', type=int, default=DEFAULT_KEYSET_THRESHOLD, metavar='ROWS',
+                        help='Page tables with at least ROWS estimated rows with keyset pagination (0: all tables)')
+    parser.add_argument('--keyset-sort', action='append', metavar='TABLE=COLUMNS',
+                        help='Page TABLE with keyset pagination on COLUMNS (comma separated); repeatable')
+    parser.add_argument('--count-threshold', type=int, default=DEFAULT_COUNT_THRESHOLD, metavar='ROWS',
+                        help='Show estimated counts in lists of more than ROWS rows (0: all tables)')
+    parser.add_argument('--no-projection', action='store_true',
+                        help='Load whole rows in lists, including Text, image and file columns')
+    parser.add_argument('--profile', type=str, nargs='?', const='profile.json', metavar='TRACE',
+                        help='Print per-phase timings and write a JSON trace (default profile.json)')
     args = parser.parse_args()
-
-    views_code = generate_views(args.uri)
-
-    with open(args.output, "w") as f:
-        f.write(views_code)
+    if not args.uri and not args.from_snapshot:
+        parser.error('one of --uri or --from-snapshot is required')
+
+    if args.dump_schema:
+        SchemaSnapshot.from_engine(create_engine(args.uri)).dump(args.dump_schema)
+        print(f"Schema written to {args.dump_schema}")
+        return
+
+    profiler = profiling.enable() if args.profile else None
+    with profiling.phase('reflection'):
+        metadata, inspector = load_schema(args.uri, args.from_snapshot)
+    inspector = profiling.count_calls(inspector)
+
+    try:
+        large_tables = plan_large_tables(metadata, inspector, args.keyset_threshold, args.count_threshold,
+                                         parse_sort_keys(args.keyset_sort))
+    except ValueError as e:
+        parser.error(str(e))
+    with profiling.phase('generate_views'):
+        views = iter_views(metadata, inspector, jobs=args.jobs, large_tables=large_tables,
+                           projection=not args.no_projection)
+        write_file(args.output, profiling.counted(views), atomic=True)
 
     print(f"Views generated successfully in {args.output}")
+    if profiler:
+        profiler.print_summary()
+        profiler.dump(args.profile)
+        print(f"Profile trace written to {args.profile}")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,230 @@
+"""
+index_advisor.py: Suggest the indexes the generated views and relationships need
+
+The generated ModelViews join on foreign keys and search their search_columns
+with ilike, but the reflected schema often has no index for any of these.
+advise_indexes cross-references those access paths with the reflected indexes,
+primary keys and unique constraints and suggests what is missing:
+
+- a btree index on every foreign key whose columns do not lead an existing index
+- a GIN trigram index (pg_trgm) for ilike search on each of the view's
+  search_columns (gen_views.get_search_columns: every String and Text column),
+  optionally at most max_search_indexes per table
+- on tables with an `is_deleted` soft-delete flag, the search indexes are
+  partial indexes on `is_deleted = false`, matching the queries of the mixins;
+  foreign key indexes stay full, as joins and cascades also reach deleted rows
+
+An existing index only covers a suggestion with the same access method whose
+leading columns are the suggestion's, and it must be a full index or a partial
+index on the same predicate: a partial index cannot serve the rows it leaves out.
+
+The generated views leave base_order commented out, so they add no ordering
+that needs an index.
+
+The suggestions are emitted as Index(...) entries in the generated models'
+__table_args__ and as an Alembic migration that creates them.
+
+Usage:
+    suggestions = advise_indexes(metadata, inspector)
+    write_file('versions/add_suggested_indexes.py', render_migration(suggestions, create_date='2024-06-01 12:00:00'))
+"""
+
+import hashlib
+
+from sqlalchemy.sql import sqltypes
+
+from gen_views import get_search_columns
+
+SOFT_DELETE_COLUMN = 'is_deleted'
+
+# PostgreSQL truncates identifiers longer than this
+MAX_IDENTIFIER_LENGTH = 63
+
+
+def advise_indexes(metadata, inspector, max_search_indexes=None):
+    """
+    Suggest the indexes missing for the generated views and relationships.
+
+    Args:
+        metadata (MetaData): Reflected SQLAlchemy metadata.
+        inspector (Inspector): SQLAlchemy Inspector or SchemaSnapshot.
+        max_search_indexes (int, optional): Maximum number of trigram search indexes per table,
+            for the first search_columns; all of them by default.
+
+    Returns:
+        dict: table name -> list of suggested indexes, each a dict with the keys
+              'name', 'table', 'columns', 'using' ('btree' or 'gin'), 'ops', 'where' and 'reason'.
+    """
+    suggestions = {}
+    for table_name in inspector.get_table_names():
+        if table_name.startswith('ab_'):
+            continue  # Flask-AppBuilder system tables
+        table = metadata.tables[table_name]
+        table_suggestions = advise_table_indexes(table, inspector, max_search_indexes)
+        if table_suggestions:
+            suggestions[table_name] = table_suggestions
+    return suggestions
+
+
+def advise_table_indexes(table, inspector, max_search_indexes=None):
+    """Suggest the missing indexes of one table; see advise_indexes."""
+    table_name = table.name
+    existing = _existing_indexes(inspector, table_name)
+    soft_delete = (SOFT_DELETE_COLUMN in table.columns
+                   and isinstance(table.columns[SOFT_DELETE_COLUMN].type, sqltypes.Boolean))
+    where = f"{SOFT_DELETE_COLUMN} = false" if soft_delete else None
+
+    suggestions = []
+
+    def suggest(columns, reason, using='btree', where=None):
+        if _is_covered(columns, using, where, existing):
+            return
+        if any(s['columns'] == columns and s['using'] == using for s in suggestions):
+            return
+        ops = {column: 'gin_trgm_ops' for column in columns} if using == 'gin' else None
+        suffix = '_trgm' if using == 'gin' else ''
+        suggestions.append({
+            'name': _index_name(table_name, columns, suffix),
+            'table': table_name,
+            'columns': columns,
+            'using': using,
+            'ops': ops,
+            'where': where,
+            'reason': reason,
+        })
+
+    for fk in inspector.get_foreign_keys(table_name):
+        suggest(list(fk['constrained_columns']), f"join on foreign key to {fk['referred_table']}")
+
+    for column in get_search_columns(table)[:max_search_indexes]:
+        suggest([column], 'ilike search on search_columns', using='gin', where=where)
+
+    return suggestions
+
+
+def format_index(suggestion):
+    """Render a suggestion as an Index(...) entry for __table_args__."""
+    args = [f"'{suggestion['name']}'"] + [f"'{column}'" for column in suggestion['columns']]
+    if suggestion['using'] != 'btree':
+        args.append(f"postgresql_using='{suggestion['using']}'")
+    if suggestion['ops']:
+        args.append(f"postgresql_ops={suggestion['ops']!r}")
+    if suggestion['where']:
+        args.append(f"postgresql_where=text('{suggestion['where']}')")
+    return f"Index({', '.join(args)})"
+
+
+def render_migration(suggestions, revision=None, down_revision=None, create_date=None):
+    """
+    Render an Alembic migration creating the suggested indexes.
+
+    Args:
+        suggestions (dict): Output of advise_indexes.
+        revision (str, optional): Revision id; defaults to a hash of the suggestions, so
+            re-running the advisor on the same schema gives the same revision.
+        down_revision (str, optional): Revision this migration follows.
+        create_date (str or datetime, optional): Create Date of the migration header. It is left out
+            when not given, so the same suggestions always render the same file.
+
+    Returns:
+        list: Lines of the migration file.
+    """
+    all_suggestions = [s for table_suggestions in suggestions.values() for s in table_suggestions]
+    if revision is None:
+        names = ','.join(s['name'] for s in all_suggestions)
+        revision = hashlib.blake2b(names.encode(), digest_size=6).hexdigest()
+
+    code = [
+        '"""Add indexes suggested by the index advisor',
+        '',
+        f'Revision ID: {revision}',
+        f'Revises: {down_revision or ""}',
+    ]
+    if create_date is not None:
+        code.append(f'Create Date: {create_date}')
+    code += [
+        '',
+        '"""',
+        'from alembic import op',
+        'import sqlalchemy as sa',
+        '',
+        '# revision identifiers, used by Alembic.',
+        f'revision = {revision!r}',
+        f'down_revision = {down_revision!r}',
+        'branch_labels = None',
+        'depends_on = None',
+        '',
+        '',
+        'def upgrade():',
+    ]
+    if any(s['using'] == 'gin' for s in all_suggestions):
+        code.append('    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")')
+    for s in all_suggestions:
+        args = [f"'{s['name']}'", f"'{s['table']}'", repr(s['columns'])]
+        if s['using'] != 'btree':
+            args.append(f"postgresql_using='{s['using']}'")
+        if s['ops']:
+            args.append(f"postgresql_ops={s['ops']!r}")
+        if s['where']:
+            args.append(f"postgresql_where=sa.text('{s['where']}')")
+        code.append(f"    # {s['reason']}")
+        code.append(f"    op.create_index({', '.join(args)})")
+    if not all_suggestions:
+        code.append('    pass')
+
+    code.extend(['', '', 'def downgrade():'])
+    for s in reversed(all_suggestions):
+        code.append(f"    op.drop_index('{s['name']}', table_name='{s['table']}')")
+    if not all_suggestions:
+        code.append('    pass')
+    code.append('')
+    return code
+
+
+def _existing_indexes(inspector, table_name):
+    """
+    Column lists of the table's indexes, primary key and unique constraints, with their access method
+    and the normalized predicate of partial indexes (None for full ones).
+    """
+    existing = []
+    pk_columns = inspector.get_pk_constraint(table_name)['constrained_columns']
+    if pk_columns:
+        existing.append((list(pk_columns), 'btree', None))
+    for uq in inspector.get_unique_constraints(table_name):
+        existing.append((list(uq['column_names']), 'btree', None))
+    for index in inspector.get_indexes(table_name):
+        dialect_options = index.get('dialect_options', {})
+        using = dialect_options.get('postgresql_using', 'btree')
+        where = dialect_options.get('postgresql_where', dialect_options.get('sqlite_where'))
+        existing.append((list(index['column_names']), using, _normalize_predicate(where)))
+    return existing
+
+
+def _is_covered(columns, using, where, existing):
+    """
+    Whether an existing index serves lookups on columns: they lead it, it uses the same method,
+    and it is a full index or a partial one on the same predicate as where.
+    """
+    where = _normalize_predicate(where)
+    return any(index_using == using and index_columns[:len(columns)] == columns
+               and index_where in (None, where)
+               for index_columns, index_using, index_where in existing)
+
+
+def _normalize_predicate(where):
+    """A partial index predicate as text without enclosing parentheses, in lower case with single spaces."""
+    if where is None:
+        return None
+    # PostgreSQL reflects predicates as strings, SQLite as text() clauses
+    where = ' '.join(str(where).split()).lower()
+    while where.startswith('(') and where.endswith(')'):
+        where = where[1:-1].strip()
+    return where
+
+
+def _index_name(table_name, columns, suffix=''):
+    name = f"ix_{table_name}_{'_'.join(columns)}{suffix}"
+    if len(name) > MAX_IDENTIFIER_LENGTH:
+        digest = hashlib.blake2b(name.encode(), digest_size=4).hexdigest()
+        name = f"{name[:MAX_IDENTIFIER_LENGTH - len(digest) - 1]}_{digest}"
+    return name
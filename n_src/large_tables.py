@@ -0,0 +1,154 @@
+"""
+large_tables.py: Plan the datamodels of the generated views and APIs of large tables
+
+Flask-AppBuilder pages lists with OFFSET/LIMIT, which reads and discards every
+row before the requested page; on tables with millions of rows deep pages get
+slower and slower. Tables whose estimated row count (pg_class.reltuples, see
+SchemaSnapshot.get_row_estimates) reaches the keyset threshold, or that are
+given a sort key explicitly, get views and APIs paged with keyset pagination
+instead (KeysetSQLAInterface and the Keyset*Mixin classes of
+py_templates/datamodels.py).
+
+Rendering the pager of a list costs a SELECT count(*) over the whole list.
+Tables whose estimate reaches the count threshold get a datamodel that shows
+the planner's estimate, or a periodically refreshed exact count, once the list
+is larger than the threshold (ApproxCountSQLAInterface).
+
+Independent of size, lists should not load columns they do not show. Tables
+with heavy columns (names ending in _img, _doc or _file, doc_text, and Text or
+LargeBinary columns) get a datamodel that loads only the list's columns for
+lists and defers the heavy ones on every other read (ProjectedSQLAInterface);
+projection_options plans them from the list columns of a view.
+
+Sort keys are given as "<table>=<column>[,<column>...]"; the primary key is
+always appended as a tie breaker, so the columns need not be unique, but they
+must be non-nullable. Tables without a sort key are paged on their primary key.
+
+Usage:
+    plan = plan_large_tables(metadata, inspector, keyset_threshold=1000000, count_threshold=100000,
+                             sort_keys=parse_sort_keys(['loan_transaction=created_on']))
+    f"class {model}Api({class_bases('ModelRestApi', API_MIXIN, plan.get(table))}):"
+    f"    datamodel = {datamodel_code(model, plan.get(table), f'SQLAInterface({model})')}"
+"""
+
+from sqlalchemy.sql import sqltypes
+
+DEFAULT_KEYSET_THRESHOLD = 1000000
+DEFAULT_COUNT_THRESHOLD = 100000
+
+VIEW_MIXIN = 'KeysetModelViewMixin'
+API_MIXIN = 'KeysetApiMixin'
+
+HEAVY_SUFFIXES = ('_img', '_doc', '_file')
+HEAVY_NAMES = ('doc_text',)
+
+DATAMODEL_IMPORTS = ("from .datamodels import ProjectedSQLAInterface, ApproxCountSQLAInterface, KeysetSQLAInterface, "
+                     "KeysetModelViewMixin, KeysetApiMixin")
+
+
+def parse_sort_keys(specs):
+    """Parse "<table>=<column>[,<column>...]" options into table name -> list of columns."""
+    sort_keys = {}
+    for spec in specs or []:
+        table_name, sep, columns = spec.partition('=')
+        if not sep or not table_name or not columns:
+            raise ValueError(f"Invalid sort key {spec!r}; expected <table>=<column>[,<column>...]")
+        sort_keys[table_name] = [column.strip() for column in columns.split(',')]
+    return sort_keys
+
+
+def plan_large_tables(metadata, inspector, keyset_threshold=DEFAULT_KEYSET_THRESHOLD,
+                      count_threshold=DEFAULT_COUNT_THRESHOLD, sort_keys=None):
+    """
+    Pick the tables whose views and APIs use keyset pagination or approximate counts.
+
+    Args:
+        metadata (MetaData): Reflected SQLAlchemy metadata.
+        inspector (Inspector): SQLAlchemy Inspector or SchemaSnapshot.
+        keyset_threshold (int): Estimated row count from which a table is paged with keyset pagination;
+            0 pages every table that way, also when there are no estimates.
+        count_threshold (int): Estimated row count from which a table's lists show approximate counts;
+            also the list size from which they do so at runtime. 0 applies it to every table.
+        sort_keys (dict, optional): table name -> sort key columns, see parse_sort_keys.
+            Tables listed here are always paged with keyset pagination.
+
+    Returns:
+        dict: table name -> options of its datamodel, for the tables that need one:
+              'keyset_columns' (list) for keyset pagination, 'count_threshold' (int) for approximate counts.
+    """
+    sort_keys = sort_keys or {}
+    unknown = set(sort_keys) - set(metadata.tables)
+    if unknown:
+        raise ValueError(f"Sort keys given for unknown tables: {', '.join(sorted(unknown))}")
+    row_estimates = inspector.get_row_estimates() if hasattr(inspector, 'get_row_estimates') else {}
+
+    def reaches(rows, threshold):
+        return threshold == 0 or (rows is not None and rows >= threshold)
+
+    plan = {}
+    for table in metadata.sorted_tables:
+        if table.name.startswith('ab_'):
+            continue
+        rows = row_estimates.get(table.name)
+        options = {}
+        columns = sort_keys.get(table.name)
+        if columns is None and reaches(rows, keyset_threshold):
+            columns = []
+        if columns is not None and table.primary_key.columns:
+            for column in columns:
+                if column not in table.columns:
+                    raise ValueError(f"Sort key column {table.name}.{column} does not exist")
+                if table.columns[column].nullable and not table.columns[column].primary_key:
+                    raise ValueError(f"Sort key column {table.name}.{column} is nullable")
+            options['keyset_columns'] = columns
+        if reaches(rows, count_threshold):
+            options['count_threshold'] = count_threshold
+        if options:
+            plan[table.name] = options
+    return plan
+
+
+def heavy_columns(table):
+    """Columns too large to load for a list: images, documents and files by name, Text and LargeBinary by type."""
+    return [column.name for column in table.columns
+            if not column.primary_key
+            and (column.name.endswith(HEAVY_SUFFIXES) or column.name in HEAVY_NAMES
+                 or isinstance(column.type, (sqltypes.Text, sqltypes.LargeBinary)))]
+
+
+def projection_options(table, list_columns):
+    """
+    Datamodel options loading only what a list shows; empty for tables without heavy columns.
+
+    The primary and foreign keys are always loaded, so showing a relationship in the list does
+    not first have to load its foreign key row by row.
+
+    Returns:
+        dict: {'load_columns': [...], 'deferred_columns': [...]} or {}.
+    """
+    heavy = heavy_columns(table)
+    if not heavy:
+        return {}
+    load_columns = [column.name for column in table.columns
+                    if column.name not in heavy
+                    and (column.name in list_columns or column.primary_key or column.foreign_keys)]
+    return {'load_columns': load_columns, 'deferred_columns': heavy}
+
+
+def class_bases(base, mixin, options):
+    """Base classes of a generated view or API class: the keyset mixin goes first for keyset-paged tables."""
+    return f"{mixin}, {base}" if options and 'keyset_columns' in options else base
+
+
+def datamodel_code(model_name, options, default):
+    """Expression for the datamodel of a generated view or API class; default when the table has no options."""
+    if not options:
+        return default
+    if 'keyset_columns' in options:
+        interface = 'KeysetSQLAInterface'
+    elif 'count_threshold' in options:
+        interface = 'ApproxCountSQLAInterface'
+    else:
+        interface = 'ProjectedSQLAInterface'
+    args = [model_name] + [f"{key}={value!r}" for key, value in options.items()]
+    return f"{interface}({', '.join(args)})"
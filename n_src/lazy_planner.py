@@ -0,0 +1,197 @@
+"""
+lazy_planner.py: Choose the loader strategy (lazy=...) of each generated relationship
+
+Eager-loading every many-to-one with lazy='joined' makes every list page issue
+one huge JOIN across the schema, and joining both sides of one-to-one pairs or
+relationships that run in a cycle multiplies it further. LazyPlanner picks one
+of 'joined', 'selectin', 'select', 'raise' or 'noload' per relationship from:
+
+- the FK graph: relationships between tables in the same FK cycle (including
+  self-references) are never eager loaded; a many-to-one is only joined when
+  its target is a leaf or a known-small table, so joins do not chain through
+  the schema
+- row count estimates (pg_class.reltuples, see SchemaSnapshot.get_row_estimates):
+  large targets are loaded with 'selectin' instead of joined, and collections
+  are loaded with 'selectin', 'select' or 'raise' depending on the average
+  number of children per parent
+- an override file, which wins over everything else
+
+The override file is JSON; keys of "relationships" are "<table>.<relationship>"
+and may use fnmatch wildcards. The first matching key wins, exact keys first:
+
+    {
+        "thresholds": {"joined_max_rows": 50000},
+        "relationships": {
+            "customer.orders": "raise",
+            "*.created_by": "select",
+            "audit_log.*": "noload"
+        }
+    }
+"""
+
+import json
+from fnmatch import fnmatchcase
+
+STRATEGIES = ('joined', 'selectin', 'select', 'raise', 'noload')
+
+DEFAULT_THRESHOLDS = {
+    # Largest many-to-one target (in rows) that is still loaded with a JOIN
+    'joined_max_rows': 10000,
+    # Largest average number of children per parent for which a collection is eager loaded
+    'selectin_max_fanout': 100,
+    # Collections averaging this many children per parent raise instead of loading
+    'raise_min_fanout': 10000,
+}
+
+
+def load_overrides(path):
+    """Read a lazy-loading override file; see the module docstring for the format."""
+    with open(path) as f:
+        overrides = json.load(f)
+    for key, strategy in overrides.get('relationships', {}).items():
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Invalid lazy strategy {strategy!r} for {key}; expected one of {', '.join(STRATEGIES)}")
+    unknown = set(overrides.get('thresholds', {})) - set(DEFAULT_THRESHOLDS)
+    if unknown:
+        raise ValueError(f"Unknown lazy planner thresholds: {', '.join(sorted(unknown))}")
+    return overrides
+
+
+def fk_cycles(parents):
+    """
+    Group the tables into strongly connected components of the FK graph.
+
+    Args:
+        parents (dict): table name -> set of the tables it references.
+
+    Returns:
+        dict: table name -> component id, for the tables that are part of a cycle
+              (a component of two or more tables, or a self-referencing table).
+    """
+    index = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    components = {}
+    counter = 0
+
+    # Iterative Tarjan, so deep FK chains do not hit the recursion limit
+    for root in parents:
+        if root in index:
+            continue
+        work = [(root, iter(sorted(parents.get(root, ()))))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            table, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(sorted(parents.get(child, ())))))
+                    break
+                if child in on_stack:
+                    lowlink[table] = min(lowlink[table], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[table])
+                if lowlink[table] == index[table]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == table:
+                            break
+                    if len(component) > 1 or table in parents.get(table, ()):
+                        for member in component:
+                            components[member] = index[table]
+    return components
+
+
+class LazyPlanner:
+    """Plans the lazy= argument of generated relationships; see the module docstring."""
+
+    def __init__(self, foreign_keys, row_estimates=None, overrides=None):
+        """
+        Args:
+            foreign_keys (dict): table name -> list of reflected foreign keys.
+            row_estimates (dict, optional): table name -> estimated number of rows.
+            overrides (dict, optional): Parsed override file (see load_overrides).
+        """
+        overrides = overrides or {}
+        self.rows = row_estimates or {}
+        self.thresholds = {**DEFAULT_THRESHOLDS, **overrides.get('thresholds', {})}
+        self.overrides = sorted(overrides.get('relationships', {}).items(),
+                                key=lambda item: any(c in item[0] for c in '*?['))
+        self.parents = {table: {fk['referred_table'] for fk in fks} for table, fks in foreign_keys.items()}
+        self.cycles = fk_cycles(self.parents)
+
+    def scalar(self, table, attribute, target, allow_joined=True):
+        """
+        Strategy for an attribute on table holding at most one target row (many-to-one, one-to-one).
+
+        Args:
+            table (str): Table whose class gets the relationship.
+            attribute (str): Name of the relationship attribute.
+            target (str): Table the relationship loads.
+            allow_joined (bool): False for the second side of a one-to-one pair, so only one side joins.
+        """
+        override = self._override(table, attribute)
+        if override:
+            return override
+        if self._in_cycle(table, target):
+            return 'select'
+        rows = self.rows.get(target)
+        if rows is None:
+            # Unknown size: only join leaf tables, so joins do not chain across the schema
+            small = not self.parents.get(target)
+        else:
+            small = rows <= self.thresholds['joined_max_rows']
+        return 'joined' if small and allow_joined else 'selectin'
+
+    def collection(self, table, attribute, target, via=None):
+        """
+        Strategy for a collection on table holding target rows (one-to-many, many-to-many).
+
+        Args:
+            table (str): Table whose class gets the relationship.
+            attribute (str): Name of the relationship attribute.
+            target (str): Table the collection holds.
+            via (str, optional): Association table of a many-to-many relationship.
+        """
+        override = self._override(table, attribute)
+        if override:
+            return override
+        if self._in_cycle(table, target):
+            return 'select'
+        fanout = self._fanout(table, via or target)
+        if fanout is None or fanout <= self.thresholds['selectin_max_fanout']:
+            return 'selectin'
+        if fanout >= self.thresholds['raise_min_fanout']:
+            return 'raise'
+        return 'select'
+
+    def _override(self, table, attribute):
+        key = f"{table}.{attribute}"
+        for pattern, strategy in self.overrides:
+            if fnmatchcase(key, pattern):
+                return strategy
+        return None
+
+    def _in_cycle(self, table, target):
+        return table in self.cycles and self.cycles[table] == self.cycles.get(target)
+
+    def _fanout(self, parent, child):
+        """Average number of child rows per parent row, or None without estimates for both."""
+        parent_rows = self.rows.get(parent)
+        child_rows = self.rows.get(child)
+        if parent_rows is None or child_rows is None:
+            return None
+        return child_rows / max(parent_rows, 1)
@@ -8,24 +8,720 @@ The CacheMixin allows easy caching of model instances and query results,
 improving application performance by reducing database queries for
 frequently accessed data.
 
+Cached instances are kept in two tiers: a bounded per-process LRU cache (L1)
+in front of the shared Flask-Caching backend (L2), so a hot lookup of the same
+row skips the round trip to the backend. Invalidations are published to every
+worker's L1 over Redis pub/sub when the backend (or CACHE_INVALIDATION_REDIS_URL)
+is Redis; otherwise they only reach the current process and the entries of the
+other workers expire with their L1 timeout, which is kept short.
+
+Cached query results are invalidated with per-table version counters kept in
+the backend: every committed write to a table bumps its version, and the key
+of a cached query embeds the versions of all the tables its statement reads
+(and of the relationships loaded eagerly with its rows), so a write makes the
+stale results unreachable without looking for them. cached_method results are
+keyed the same way on the tables of their model (and the tables= they name),
+and on the model's generation, so clear_cache drops them too. Writes are tracked
+for every ORM session; writes made with raw SQL must call bump_table_versions.
+
+Instances are not pickled: RowCodec stores the values of their columns with
+msgpack, in the order of their mapper's columns, and rebuilds them as detached
+instances attached to the session with merge(load=False), which takes no
+query. Relationships and unloaded columns are not stored, and load on access.
+cached_method results go through the same codec, so instances in them are
+stored the same way; values msgpack cannot represent are pickled.
+
+cached_method and CachedQuery keep hot keys from stampeding the database when
+they expire: the first caller to find a value expired takes a short lock in the
+backend and recomputes it, while the others get the expired value (for up to
+stale_timeout seconds after its expiry) or wait for the new one. Values are
+also recomputed early with a probability growing as their expiry nears and
+with the time they took to compute (XFetch), and with background_refresh the
+caller that takes the lock returns the old value and leaves the recomputation
+to a worker thread. All of it is set per decorated method or cached query
+(see CachePolicy).
+
+Configuration (app.config):
+    CACHE_L1_MAX_ENTRIES (int): Entries kept in each process (default 10000).
+    CACHE_L1_MAX_BYTES (int): Total size of the entries kept in each process (default 64 MB).
+    CACHE_L1_TIMEOUT (int): Seconds an entry is kept in each process (default 30).
+    CACHE_INVALIDATION_REDIS_URL (str): Redis used for invalidation messages (default: the cache backend's).
+    CACHE_INVALIDATION_CHANNEL (str): Pub/sub channel of the invalidation messages.
+
 Dependencies:
     - SQLAlchemy
     - Flask-AppBuilder
     - Flask-Caching
-    - pickle (for serialization)
+    - msgpack (for serialization)
+    - redis (optional, for invalidation across workers)
 
 Author: Nyimbi Odero
 Date: 25/08/2024
-Version: 1.0
+Version: 1.2
 """
 
-from flask import current_app
-from sqlalchemy import event
-from sqlalchemy.orm import Query
+from flask import current_app, has_app_context
+from sqlalchemy import Table, event, inspect
+from sqlalchemy.engine.result import IteratorResult, SimpleResultMetaData
+from sqlalchemy.orm import Query, Session, make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import instance_state
+from sqlalchemy.sql import visitors
 from flask_appbuilder.models.mixins import AuditMixin
+import enum
+import hashlib
+import json
+import logging
+import math
+import msgpack
+import os
+import random
 import pickle
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from itertools import chain
 from functools import wraps
-from datetime import datetime, timedelta
+from datetime import date, datetime, time as time_of_day, timedelta
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_L1_MAX_ENTRIES = 10000
+DEFAULT_L1_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_L1_TIMEOUT = 30
+DEFAULT_INVALIDATION_CHANNEL = 'cache-mixin:invalidate'
+VERSION_PREFIX = 'cache-version:'
+EAGER_LOADS = ('joined', 'selectin', 'subquery', 'immediate')
+STATEMENT_DIGESTS_SIZE = 1000
+DEFAULT_STALE_TIMEOUT = 60
+DEFAULT_LOCK_TIMEOUT = 10
+REFRESH_WORKERS = 4
+COUNTERS = ('l1_hits', 'l2_hits', 'misses', 'stale_hits', 'early_refreshes', 'lock_waits')
+
+def _digest(*parts):
+    """Hex blake2b digest of strings, the same in every process (unlike hash(), salted by PYTHONHASHSEED)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class CacheFormatError(ValueError):
+    """A cached payload that cannot be decoded in this process, e.g. written before its model's columns changed."""
+
+# msgpack extension types of RowCodec
+EXT_INSTANCE = 1
+EXT_UNLOADED = 2
+EXT_TUPLE = 3
+EXT_DATETIME = 4
+EXT_DATE = 5
+EXT_TIME = 6
+EXT_TIMEDELTA = 7
+EXT_DECIMAL = 8
+EXT_UUID = 9
+EXT_PICKLE = 10
+
+Layout = namedtuple('Layout', 'mapper keys enum_classes fingerprint')
+_codecs = {}  # registry -> RowCodec
+
+class RowCodec:
+    """
+    msgpack encoding of mapped instances as the values of their columns, in their mapper's column order.
+
+    Any value can be encoded; mapped instances among it (at any depth) keep only their loaded column
+    values, and values msgpack has no type for are pickled. Decoding rebuilds the instances detached
+    and merges them into the given session with load=False.
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self._layouts = {}  # class name -> Layout
+        self._mappers = None
+
+    @classmethod
+    def for_model(cls, model):
+        """The codec of the registry (declarative base) of a model class."""
+        registry = inspect(model).mapper.registry
+        codec = _codecs.get(registry)
+        if codec is None:
+            codec = _codecs.setdefault(registry, cls(registry))
+        return codec
+
+    def layout(self, name):
+        layout = self._layouts.get(name)
+        if layout is None:
+            if self._mappers is None or name not in self._mappers:
+                self._mappers = {mapper.class_.__name__: mapper for mapper in self.registry.mappers}
+            if name not in self._mappers:
+                raise CacheFormatError(f"No mapped class {name}")
+            mapper = self._mappers[name]
+            keys = tuple(prop.key for prop in mapper.column_attrs)
+            enum_classes = {prop.key: prop.columns[0].type.enum_class for prop in mapper.column_attrs
+                            if getattr(prop.columns[0].type, 'enum_class', None) is not None}
+            # Payloads written with another column order are refused rather than misread
+            fingerprint = int(_digest(name, *keys)[:8], 16)
+            layout = self._layouts[name] = Layout(mapper, keys, enum_classes, fingerprint)
+        return layout
+
+    def encode(self, value):
+        return msgpack.packb(value, default=self._default, use_bin_type=True, strict_types=True)
+
+    def decode(self, payload, session=None):
+        """
+        Decode a payload; its instances are merged into session (if given) without loading them.
+
+        Raises:
+            CacheFormatError: if the payload holds an instance of a model whose columns changed.
+        """
+        def ext_hook(code, data):
+            if code == EXT_INSTANCE:
+                return self._decode_instance(msgpack.unpackb(data, ext_hook=ext_hook, raw=False,
+                                                             strict_map_key=False), session)
+            if code == EXT_TUPLE:
+                return tuple(msgpack.unpackb(data, ext_hook=ext_hook, raw=False, strict_map_key=False))
+            return self._decode_value(code, data)
+
+        return msgpack.unpackb(payload, ext_hook=ext_hook, raw=False, strict_map_key=False)
+
+    def _default(self, value):
+        state = getattr(value, '_sa_instance_state', None)
+        if state is not None:
+            layout = self.layout(type(value).__name__)
+            loaded = state.dict
+            unloaded = msgpack.ExtType(EXT_UNLOADED, b'')
+            values = [self._column_value(layout, key, loaded[key]) if key in loaded else unloaded
+                      for key in layout.keys]
+            return msgpack.ExtType(EXT_INSTANCE, self.encode([type(value).__name__, layout.fingerprint, values]))
+        if isinstance(value, tuple) and type(value) is tuple:
+            return msgpack.ExtType(EXT_TUPLE, self.encode(list(value)))
+        if isinstance(value, datetime):
+            return msgpack.ExtType(EXT_DATETIME, value.isoformat().encode())
+        if isinstance(value, date):
+            return msgpack.ExtType(EXT_DATE, value.isoformat().encode())
+        if isinstance(value, time_of_day):
+            return msgpack.ExtType(EXT_TIME, value.isoformat().encode())
+        if isinstance(value, timedelta):
+            return msgpack.ExtType(EXT_TIMEDELTA, self.encode([value.days, value.seconds, value.microseconds]))
+        if isinstance(value, Decimal):
+            return msgpack.ExtType(EXT_DECIMAL, str(value).encode())
+        if isinstance(value, uuid.UUID):
+            return msgpack.ExtType(EXT_UUID, value.bytes)
+        # strict_types sends subclasses here too (e.g. str enums); values of the base type are kept as they are
+        for base in (bool, int, float, str, bytes, list, dict):
+            if isinstance(value, base) and not isinstance(value, enum.Enum):
+                return base(value)
+        return msgpack.ExtType(EXT_PICKLE, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _column_value(layout, key, value):
+        # Enum columns are stored by name, as SQLAlchemy stores them
+        if key in layout.enum_classes and isinstance(value, enum.Enum):
+            return value.name
+        return value
+
+    def _decode_instance(self, data, session):
+        name, fingerprint, values = data
+        layout = self.layout(name)
+        if fingerprint != layout.fingerprint:
+            raise CacheFormatError(f"Cached {name} has other columns than the model")
+        instance = layout.mapper.class_manager.new_instance()
+        loaded = instance_state(instance).dict
+        for key, value in zip(layout.keys, values):
+            if type(value) is msgpack.ExtType and value.code == EXT_UNLOADED:
+                continue
+            if key in layout.enum_classes and value is not None:
+                value = layout.enum_classes[key][value]
+            loaded[key] = value
+        # Commits the values set, with the identity key of the primary key; columns not set load on access
+        make_transient_to_detached(instance)
+        if session is not None:
+            return session.merge(instance, load=False)
+        return instance
+
+    def _decode_value(self, code, data):
+        if code == EXT_DATETIME:
+            return datetime.fromisoformat(data.decode())
+        if code == EXT_DATE:
+            return date.fromisoformat(data.decode())
+        if code == EXT_TIME:
+            return time_of_day.fromisoformat(data.decode())
+        if code == EXT_TIMEDELTA:
+            return timedelta(*msgpack.unpackb(data))
+        if code == EXT_DECIMAL:
+            return Decimal(data.decode())
+        if code == EXT_UUID:
+            return uuid.UUID(bytes=data)
+        if code == EXT_PICKLE:
+            return pickle.loads(data)
+        if code == EXT_UNLOADED:
+            return msgpack.ExtType(code, data)
+        raise CacheFormatError(f"Unknown msgpack extension type {code}")
+
+def encode_result(codec, frozen):
+    """Encode the rows of a FrozenResult of an ORM query, with what Query._iter needs to rebuild it."""
+    rows = [[row] for row in frozen.data] if frozen._source_supports_scalars else [list(row) for row in frozen.data]
+    attributes = {name: frozen._attributes.get(name, False) for name in ('is_single_entity', 'filtered')}
+    return codec.encode([list(frozen.metadata.keys), attributes, rows])
+
+def decode_result(codec, payload, session):
+    """The Result of a payload of encode_result, with its instances merged into session."""
+    keys, attributes, rows = codec.decode(payload, session)
+    result = IteratorResult(SimpleResultMetaData(keys), iter([tuple(row) for row in rows]))
+    result._attributes = result._attributes.union(attributes)
+    return result
+
+def initial_version():
+    """
+    Version of a counter missing from the backend (never set, or evicted).
+
+    Starting from the clock rather than 0 keeps a counter that was evicted from
+    going back to a version that keys cached before the eviction still embed.
+    """
+    return time.time_ns() // 1000
+
+class LocalCache:
+    """
+    Per-process LRU cache with a timeout per entry, bounded in entries and in bytes.
+
+    It keeps the serialized values, as the backend does, so every caller still gets
+    an instance of its own.
+    """
+    def __init__(self, max_entries=DEFAULT_L1_MAX_ENTRIES, max_bytes=DEFAULT_L1_MAX_BYTES,
+                 timeout=DEFAULT_L1_TIMEOUT):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.size = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires, payload)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the payload of key, or None if it is absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, payload, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        if timeout <= 0 or len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + timeout, payload)
+            self.size += len(payload)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def __len__(self):
+        return len(self._entries)
+
+class InvalidationBus:
+    """
+    Delivers invalidated keys to the LocalCache of every worker.
+
+    This one only reaches the current process; see RedisInvalidationBus.
+    """
+    def __init__(self, local_cache):
+        self.local_cache = local_cache
+
+    def publish(self, keys=(), prefix=None):
+        """Invalidate keys, or every key starting with prefix, in the local caches."""
+        self.deliver({'keys': list(keys), 'prefix': prefix})
+
+    def deliver(self, message):
+        if message.get('keys'):
+            self.local_cache.delete(*message['keys'])
+        if message.get('prefix'):
+            self.local_cache.delete_prefix(message['prefix'])
+
+class RedisInvalidationBus(InvalidationBus):
+    """Invalidation messages over Redis pub/sub, received by a listener thread in each process."""
+    def __init__(self, local_cache, client, channel=DEFAULT_INVALIDATION_CHANNEL):
+        super().__init__(local_cache)
+        self.client = client
+        self.channel = channel
+        self._listener_pid = None
+        self._lock = threading.Lock()
+
+    def publish(self, keys=(), prefix=None):
+        message = {'keys': list(keys), 'prefix': prefix}
+        self.deliver(message)
+        try:
+            self.client.publish(self.channel, json.dumps(message))
+        except Exception:
+            # The other workers' entries still expire with their L1 timeout
+            logger.exception("Could not publish cache invalidation on %s", self.channel)
+
+    def ensure_listener(self):
+        """Start the listener thread of this process (again after a fork, which does not copy threads)."""
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid != os.getpid():
+                # Entries cached before the fork were not invalidated while nobody listened
+                self.local_cache.clear()
+                threading.Thread(target=self._listen, name='cache-invalidation', daemon=True).start()
+                self._listener_pid = os.getpid()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        self.deliver(json.loads(message['data']))
+            except Exception:
+                logger.exception("Cache invalidation listener on %s failed, reconnecting", self.channel)
+                # Messages may have been missed meanwhile
+                self.local_cache.clear()
+                time.sleep(1)
+
+class CachePolicy:
+    """
+    How a cached_method or CachedQuery value is recomputed when it expires.
+
+    Args:
+        timeout (int): Seconds the value is fresh (None: the backend's default timeout, without early refresh).
+        stale_timeout (int): Seconds an expired value is still returned while another caller recomputes it.
+        lock_timeout (int): Longest a caller holds the recomputation lock; callers without a value to return
+            wait as long for the new one before computing it themselves.
+        early_expiration (float): XFetch beta; values are recomputed before they expire with a probability
+            growing with it (0: only when expired, 1: the usual setting, >1: earlier).
+        background_refresh (bool): Return the old value and recompute it in a worker thread.
+    """
+    def __init__(self, timeout=None, stale_timeout=DEFAULT_STALE_TIMEOUT, lock_timeout=DEFAULT_LOCK_TIMEOUT,
+                 early_expiration=1.0, background_refresh=False):
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        self.lock_timeout = lock_timeout
+        self.early_expiration = early_expiration
+        self.background_refresh = background_refresh
+
+    def expires(self, now):
+        return now + self.timeout if self.timeout else math.inf
+
+    def backend_timeout(self):
+        """Timeout of the stored value: its freshness plus the time it may be returned stale."""
+        return self.timeout + self.stale_timeout if self.timeout else self.timeout
+
+    def should_refresh(self, expires, delta, now):
+        """Whether a value expiring at expires, which took delta seconds to compute, is recomputed now (XFetch)."""
+        if now >= expires:
+            return True
+        # -log(u) for u in (0, 1] is exponentially distributed: mostly small, sometimes large
+        return now - delta * self.early_expiration * math.log(1.0 - random.random()) >= expires
+
+Fetched = namedtuple('Fetched', 'payload value computed')
+
+_refresh_executor = None
+_refresh_executor_lock = threading.Lock()
+
+def _submit_refresh(job):
+    global _refresh_executor
+    with _refresh_executor_lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(REFRESH_WORKERS, thread_name_prefix='cache-refresh')
+    _refresh_executor.submit(job)
+
+class TwoTierCache:
+    """
+    The per-process LocalCache (L1) in front of the app's Flask-Caching backend (L2),
+    with hit and miss counters per model.
+    """
+    def __init__(self, backend, local_cache, bus):
+        self.backend = backend
+        self.local_cache = local_cache
+        self.bus = bus
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_app(cls, app):
+        config = app.config
+        backend = app.extensions['cache']
+        if isinstance(backend, dict):
+            # Flask-Caching registers {Cache object: backend}
+            backend = next(iter(backend.values()))
+        local_cache = LocalCache(config.get('CACHE_L1_MAX_ENTRIES', DEFAULT_L1_MAX_ENTRIES),
+                                 config.get('CACHE_L1_MAX_BYTES', DEFAULT_L1_MAX_BYTES),
+                                 config.get('CACHE_L1_TIMEOUT', DEFAULT_L1_TIMEOUT))
+        client = None
+        if config.get('CACHE_INVALIDATION_REDIS_URL'):
+            import redis
+            client = redis.Redis.from_url(config['CACHE_INVALIDATION_REDIS_URL'])
+        else:
+            # Flask-Caching's Redis backends keep their client here
+            client = getattr(backend, '_write_client', None)
+        if client is None:
+            return cls(backend, local_cache, InvalidationBus(local_cache))
+        channel = config.get('CACHE_INVALIDATION_CHANNEL', DEFAULT_INVALIDATION_CHANNEL)
+        return cls(backend, local_cache, RedisInvalidationBus(local_cache, client, channel))
+
+    def get(self, key, model, l1_timeout=None):
+        """Return the payload of key from L1, else from L2 (keeping it in L1), or None."""
+        if isinstance(self.bus, RedisInvalidationBus):
+            self.bus.ensure_listener()
+        payload = self.local_cache.get(key)
+        if payload is not None:
+            self._count(model, 'l1_hits')
+            return payload
+        payload = self.backend.get(key)
+        if payload is None:
+            self._count(model, 'misses')
+            return None
+        self._count(model, 'l2_hits')
+        self.local_cache.set(key, payload, l1_timeout)
+        return payload
+
+    def set(self, key, payload, timeout=None, l1_timeout=None):
+        self.set_many({key: payload}, timeout, l1_timeout)
+
+    def set_many(self, mapping, timeout=None, l1_timeout=None):
+        self.backend.set_many(mapping, timeout=timeout)
+        if timeout:
+            l1_timeout = min(timeout, self.local_cache.timeout if l1_timeout is None else l1_timeout)
+        for key, payload in mapping.items():
+            self.local_cache.set(key, payload, l1_timeout)
+
+    def delete(self, *keys):
+        """Delete keys from L2 and from the L1 of every worker."""
+        self.backend.delete_many(*keys)
+        self.bus.publish(keys)
+
+    def versions(self, names):
+        """
+        Current versions of the counters of names (table names, or model:<Model> generations).
+
+        Returns:
+            dict: name -> version.
+        """
+        names = list(names)
+        keys = [VERSION_PREFIX + name for name in names]
+        values = list(self.backend.get_many(*keys)) if keys else []
+        for i, value in enumerate(values):
+            if value is None:
+                # add() keeps the value of a concurrent initialization
+                self.backend.add(keys[i], initial_version(), timeout=0)
+                values[i] = self.backend.get(keys[i]) or 0
+        return dict(zip(names, values))
+
+    def bump(self, names):
+        """Increment the version counters of names."""
+        for name in names:
+            key = VERSION_PREFIX + name
+            self.backend.add(key, initial_version(), timeout=0)
+            self.backend.inc(key)
+
+    def generation(self, name, l1_timeout=None):
+        """
+        Version of a counter read on every lookup and bumped rarely, kept in L1.
+
+        Bump it with bump_generation, which drops it from the L1 of every worker.
+        """
+        key = VERSION_PREFIX + name
+        version = self.local_cache.get(key)
+        if version is None:
+            version = str(self.versions([name])[name])
+            self.local_cache.set(key, version, l1_timeout)
+        return version
+
+    def bump_generation(self, name):
+        self.bump([name])
+        self.bus.publish([VERSION_PREFIX + name])
+
+    def fetch(self, key, compute, model, policy, refresh=None, l1_timeout=None):
+        """
+        The payload of key, computed by a single caller at a time when it is missing or expired.
+
+        Args:
+            key (str): Cache key.
+            compute (callable): Returns (value, payload) of a new value.
+            model (str): Name the hits and misses are counted under.
+            policy (CachePolicy): Timeouts, early expiration and background refresh.
+            refresh (callable): compute for a worker thread, run in an app context of its own; with
+                policy.background_refresh, a caller finding an expired value returns it and this recomputes it.
+            l1_timeout (int): Seconds the payload stays in the per-process cache.
+
+        Returns:
+            Fetched: payload, and the value when computed by this call (computed is then True).
+        """
+        now = time.time()
+        stale = None
+        envelope = self.local_cache.get(key)
+        if envelope is not None:
+            expires, delta, payload = msgpack.unpackb(envelope)
+            if not policy.should_refresh(expires, delta, now):
+                self._count(model, 'l1_hits')
+                return Fetched(payload, None, False)
+        # An expired L1 copy may have been recomputed in another process meanwhile
+        envelope = self.backend.get(key)
+        if envelope is not None:
+            expires, delta, payload = msgpack.unpackb(envelope)
+            if not policy.should_refresh(expires, delta, now):
+                self._count(model, 'l2_hits')
+                self.local_cache.set(key, envelope, self._l1_timeout(policy, l1_timeout))
+                return Fetched(payload, None, False)
+            if now < expires + policy.stale_timeout:
+                stale = payload
+            if now < expires:
+                self._count(model, 'early_refreshes')
+
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+        locked = self.backend.add(lock_key, token, timeout=policy.lock_timeout)
+        if stale is not None and locked and policy.background_refresh and refresh is not None:
+            self._refresh_in_background(key, refresh, policy, lock_key, token, l1_timeout)
+            self._count(model, 'stale_hits')
+            return Fetched(stale, None, False)
+        if locked:
+            try:
+                self._count(model, 'misses')
+                return self._compute(key, compute, policy, l1_timeout)
+            finally:
+                self._release(lock_key, token)
+        if stale is not None:
+            # Another caller is recomputing it
+            self._count(model, 'stale_hits')
+            return Fetched(stale, None, False)
+
+        self._count(model, 'lock_waits')
+        deadline = time.monotonic() + policy.lock_timeout
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+            envelope = self.backend.get(key)
+            if envelope is not None:
+                expires, delta, payload = msgpack.unpackb(envelope)
+                if time.time() < expires:
+                    return Fetched(payload, None, False)
+        # The lock holder is slow or gone; compute without it
+        self._count(model, 'misses')
+        return self._compute(key, compute, policy, l1_timeout)
+
+    def store(self, key, payload, policy, delta=0.0, l1_timeout=None):
+        """Cache a payload computed in delta seconds under the expiry of policy."""
+        envelope = msgpack.packb([policy.expires(time.time()), delta, payload])
+        self.backend.set(key, envelope, timeout=policy.backend_timeout())
+        self.local_cache.set(key, envelope, self._l1_timeout(policy, l1_timeout))
+
+    def _compute(self, key, compute, policy, l1_timeout):
+        start = time.monotonic()
+        value, payload = compute()
+        self.store(key, payload, policy, time.monotonic() - start, l1_timeout)
+        return Fetched(payload, value, True)
+
+    def _refresh_in_background(self, key, refresh, policy, lock_key, token, l1_timeout):
+        app = current_app._get_current_object()
+
+        def job():
+            try:
+                with app.app_context():
+                    self._compute(key, refresh, policy, l1_timeout)
+            except Exception:
+                logger.exception("Background refresh of %s failed", key)
+            finally:
+                self._release(lock_key, token)
+
+        _submit_refresh(job)
+
+    def _release(self, lock_key, token):
+        # Not if it expired and another caller took it
+        if self.backend.get(lock_key) == token:
+            self.backend.delete(lock_key)
+
+    def _l1_timeout(self, policy, l1_timeout):
+        l1_timeout = self.local_cache.timeout if l1_timeout is None else l1_timeout
+        return min(l1_timeout, policy.timeout) if policy.timeout else l1_timeout
+
+    def _count(self, model, counter):
+        with self._stats_lock:
+            self._stats.setdefault(model, Counter())[counter] += 1
+
+    def stats(self, model=None):
+        """Hit and miss counters of a model's lookups in this process, or of all models by name."""
+        with self._stats_lock:
+            if model is not None:
+                counters = self._stats.get(model, Counter())
+                return {name: counters[name] for name in COUNTERS}
+        return {name: self.stats(name) for name in list(self._stats)}
+
+def two_tier_cache(app=None):
+    """The TwoTierCache of an app (by default the current one), created on first use."""
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('two_tier_cache')
+    if cache is None:
+        cache = app.extensions['two_tier_cache'] = TwoTierCache.from_app(app)
+    return cache
+
+def bump_table_versions(*table_names):
+    """Invalidate the cached queries reading tables written without the ORM session (e.g. with raw SQL)."""
+    two_tier_cache().bump(table_names)
+
+def _mapper_tables(mapper):
+    """The tables written with the instances of a mapper: its own and those of its many-to-many relationships."""
+    tables = {table.fullname for table in mapper.tables}
+    tables.update(rel.secondary.fullname for rel in mapper.relationships if isinstance(rel.secondary, Table))
+    return tables
+
+def _written_tables(session):
+    return session.info.setdefault('cache_written_tables', set())
+
+def _record_flush(session, flush_context):
+    """Note the tables written by a flush; their versions are bumped when the transaction commits."""
+    tables = _written_tables(session)
+    for instance in chain(session.new, session.dirty, session.deleted):
+        tables.update(_mapper_tables(inspect(instance).mapper))
+
+def _record_bulk_write(orm_execute_state):
+    """Note the table of an ORM-enabled insert, update or delete statement."""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _written_tables(orm_execute_state.session).add(orm_execute_state.statement.table.fullname)
+
+def _bump_committed(session):
+    tables = session.info.pop('cache_written_tables', None)
+    if tables and has_app_context():
+        two_tier_cache().bump(sorted(tables))
+
+def _discard_rolled_back(session, previous_transaction=None):
+    session.info.pop('cache_written_tables', None)
+
+def listen_for_writes():
+    """Bump the version of the tables written through any ORM session when its transaction commits."""
+    for name, listener in (('after_flush', _record_flush), ('do_orm_execute', _record_bulk_write),
+                           ('after_commit', _bump_committed), ('after_rollback', _discard_rolled_back)):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
 
 class CachedQuery(Query):
     """
@@ -33,47 +729,142 @@ class CachedQuery(Query):
     """
     def __init__(self, *args, **kwargs):
         super(CachedQuery, self).__init__(*args, **kwargs)
+        self._cached = False
         self._cache_key = None
-        self._cache_timeout = None
+        self._cache_policy = None
+        self._cache_tables = ()
 
-    def cache(self, key=None, timeout=None):
+    def cache(self, key=None, timeout=None, tables=(), stale_timeout=DEFAULT_STALE_TIMEOUT,
+              lock_timeout=DEFAULT_LOCK_TIMEOUT, early_expiration=1.0, background_refresh=False):
         """
         Mark the query for caching.
 
         Args:
             key (str, optional): Custom cache key. If not provided, one will be generated.
             timeout (int, optional): Cache timeout in seconds.
+            tables (iterable, optional): Names of other tables the results depend on, e.g. those
+                of relationships loaded with query options; the statement's own are found.
+            stale_timeout, lock_timeout, early_expiration, background_refresh: How the results are
+                recomputed when they expire; see CachePolicy.
 
         Returns:
             CachedQuery: The query object for method chaining.
         """
+        self._cached = True
         self._cache_key = key
-        self._cache_timeout = timeout
+        self._cache_policy = CachePolicy(timeout, stale_timeout, lock_timeout, early_expiration, background_refresh)
+        self._cache_tables = tuple(tables)
         return self
 
-    def _get_cache_key(self):
-        """Generate a cache key if not provided."""
-        if self._cache_key is None:
-            query_string = str(self.statement.compile(compile_kwargs={"literal_binds": True}))
-            self._cache_key = f"query_{hash(query_string)}"
-        return self._cache_key
-
-    def __iter__(self):
-        """Override the iterator to implement caching."""
-        if self._cache_key is None:
-            return super(CachedQuery, self).__iter__()
-
-        cache = current_app.extensions['cache']
-        key = self._get_cache_key()
-        result = cache.get(key)
-
-        if result is None:
-            result = list(super(CachedQuery, self).__iter__())
-            cache.set(key, pickle.dumps(result), timeout=self._cache_timeout)
+    def _get_tables(self):
+        """Names of the tables the results are read from, sorted."""
+        tables = {element.fullname for element in visitors.iterate(self.statement) if isinstance(element, Table)}
+        tables.update(self._cache_tables)
+        # Relationships loaded eagerly by default come with the rows, from tables the statement does not name
+        mappers = [entity['entity'].__mapper__ for entity in self.column_descriptions
+                   if hasattr(entity.get('entity'), '__mapper__')]
+        seen = set()
+        while mappers:
+            mapper = mappers.pop()
+            if mapper in seen:
+                continue
+            seen.add(mapper)
+            for rel in mapper.relationships:
+                if rel.lazy in EAGER_LOADS:
+                    tables.update(_mapper_tables(rel.mapper))
+                    mappers.append(rel.mapper)
+        return sorted(tables)
+
+    def _get_entity(self):
+        """The first mapped class the query selects from, or None."""
+        for description in self.column_descriptions:
+            if description.get('entity') is not None:
+                return description['entity']
+        return None
+
+    def _get_codec(self):
+        entity = self._get_entity()
+        return RowCodec(None) if entity is None else RowCodec.for_model(entity)
+
+    def _get_model_name(self):
+        return getattr(self._get_entity(), '__name__', 'query')
+
+    # Digest of the SQL of each statement shape, by SQLAlchemy cache key: statements differing only in
+    # their parameter values are compiled once
+    _statement_digests = LocalCache(max_entries=STATEMENT_DIGESTS_SIZE, timeout=float('inf'))
+
+    def _get_cache_key(self, statement=None):
+        """
+        The custom key, or a digest of the statement's SQL and bound parameter values.
+
+        The key is the same in every process, so workers share their cached results.
+        """
+        if self._cache_key is not None:
+            return self._cache_key
+        statement = self._statement_20() if statement is None else statement
+        dialect = self.session.get_bind().dialect
+        shape = statement._generate_cache_key()
+        if shape is None:
+            # Statements SQLAlchemy cannot cache (e.g. with custom constructs) are compiled every time
+            compiled = statement.compile(dialect=dialect)
+            sql_digest, values = _digest(str(compiled)), sorted(compiled.params.items())
         else:
-            result = pickle.loads(result)
+            sql_digest = self._statement_digests.get(shape.key)
+            if sql_digest is None:
+                sql_digest = _digest(str(statement.compile(dialect=dialect)))
+                self._statement_digests.set(shape.key, sql_digest)
+            # Anonymous parameter names hold object ids; the values are taken in statement order
+            values = [bind.effective_value for bind in shape.bindparams]
+        return f"query_{_digest(sql_digest, repr(values), repr(sorted(self._params.items())))}"
+
+    def _compute(self, codec, statement=None):
+        """Run the query; returns its FrozenResult and the payload caching it."""
+        statement = self._statement_20() if statement is None else statement
+        result = self.session.execute(statement, self._params,
+                                      execution_options={'_sa_orm_load_options': self.load_options})
+        if result._attributes.get('filtered', False):
+            # Rows of joined eager loads against collections are only frozen once made unique
+            result = result.unique()
+        frozen = result.freeze()
+        return frozen, encode_result(codec, frozen)
+
+    def _iter(self):
+        """Run the query, or rebuild its result from the cache; all(), first(), one() and iteration go through here."""
+        if not self._cached:
+            return super(CachedQuery, self)._iter()
 
-        return iter(result)
+        cache = two_tier_cache()
+        statement = self._statement_20()
+        versions = cache.versions(self._get_tables())
+        # A write to any of the tables changes the key; the results under the old one are left to expire
+        key = self._get_cache_key(statement) + '@' + ','.join(f"{table}={version}" for table, version in versions.items())
+        codec = self._get_codec()
+        entity = self._get_entity()
+        refresh = None
+        if hasattr(entity, 'query'):
+            # Background refreshes query in the session of the worker's own app context
+            refresh = lambda: self.with_session(entity.query.session)._compute(codec)
+        fetched = cache.fetch(key, lambda: self._compute(codec, statement), self._get_model_name(),
+                              self._cache_policy, refresh)
+
+        if fetched.computed:
+            result = fetched.value()
+        else:
+            try:
+                result = decode_result(codec, fetched.payload, self.session)
+            except CacheFormatError:
+                # Written by a process with other models, e.g. during a deploy
+                logger.warning("Discarding cached query %s", key, exc_info=True)
+                frozen, payload = self._compute(codec, statement)
+                cache.store(key, payload, self._cache_policy)
+                result = frozen()
+
+        # As Query._iter does
+        if result._attributes.get('is_single_entity', False):
+            result = result.scalars()
+        if result._attributes.get('filtered', False):
+            result = result.unique()
+        return result
 
 class CacheMixin(AuditMixin):
     """
@@ -84,28 +875,39 @@ class CacheMixin(AuditMixin):
 
     Class Attributes:
         __cache_timeout__ (int): Default cache timeout in seconds.
+        __cache_l1_timeout__ (int): Seconds an instance stays in the per-process cache.
         query_class (CachedQuery): Custom query class for caching queries.
     """
 
     __cache_timeout__ = 3600  # Default cache timeout: 1 hour
+    __cache_l1_timeout__ = None  # Seconds an instance stays in the per-process cache (None: CACHE_L1_TIMEOUT)
     query_class = CachedQuery
 
+    @classmethod
+    def _cache(cls):
+        return two_tier_cache()
+
+    @classmethod
+    def _codec(cls):
+        return RowCodec.for_model(cls)
+
     @classmethod
     def __declare_last__(cls):
         """Set up event listeners for cache invalidation."""
         event.listen(cls, 'after_update', cls._invalidate_cache)
         event.listen(cls, 'after_delete', cls._invalidate_cache)
+        listen_for_writes()
 
     @classmethod
     def _invalidate_cache(cls, mapper, connection, target):
-        """Invalidate the cache for the updated/deleted instance."""
-        cache = current_app.extensions['cache']
-        cache.delete(cls._get_instance_cache_key(target.id))
+        """Invalidate the cache for the updated/deleted instance, in every worker."""
+        cls._cache().delete(cls._get_instance_cache_key(target.id))
 
     @classmethod
     def _get_instance_cache_key(cls, instance_id):
-        """Generate a cache key for an instance."""
-        return f"{cls.__name__}:{instance_id}"
+        """Generate a cache key for an instance, in the model's current generation (see clear_cache)."""
+        generation = cls._cache().generation(f"model:{cls.__name__}", cls.__cache_l1_timeout__)
+        return f"{cls.__name__}:{generation}:{instance_id}"
 
     @classmethod
     def cache_instance(cls, instance):
@@ -115,14 +917,13 @@ class CacheMixin(AuditMixin):
         Args:
             instance: The model instance to cache.
         """
-        cache = current_app.extensions['cache']
         key = cls._get_instance_cache_key(instance.id)
-        cache.set(key, pickle.dumps(instance), timeout=cls.__cache_timeout__)
+        cls._cache().set(key, cls._codec().encode(instance), cls.__cache_timeout__, cls.__cache_l1_timeout__)
 
     @classmethod
     def get_cached(cls, instance_id):
         """
-        Retrieve a cached model instance.
+        Retrieve a cached model instance, merged into the session without loading it.
 
         Args:
             instance_id: The ID of the instance to retrieve.
@@ -130,11 +931,13 @@ class CacheMixin(AuditMixin):
         Returns:
             The cached instance if found, None otherwise.
         """
-        cache = current_app.extensions['cache']
         key = cls._get_instance_cache_key(instance_id)
-        cached_data = cache.get(key)
+        cached_data = cls._cache().get(key, cls.__name__, cls.__cache_l1_timeout__)
         if cached_data:
-            return pickle.loads(cached_data)
+            try:
+                return cls._codec().decode(cached_data, cls.query.session)
+            except CacheFormatError:
+                logger.warning("Discarding cached %s", key, exc_info=True)
         return None
 
     @classmethod
@@ -145,11 +948,21 @@ class CacheMixin(AuditMixin):
         Args:
             instances (list): List of model instances to cache.
         """
-        cache = current_app.extensions['cache']
-        with cache.pipeline() as pipe:
-            for instance in instances:
-                key = cls._get_instance_cache_key(instance.id)
-                pipe.set(key, pickle.dumps(instance), timeout=cls.__cache_timeout__)
+        codec = cls._codec()
+        mapping = {cls._get_instance_cache_key(instance.id): codec.encode(instance) for instance in instances}
+        cls._cache().set_many(mapping, cls.__cache_timeout__, cls.__cache_l1_timeout__)
+
+    @classmethod
+    def cache_stats(cls):
+        """
+        Hit and miss counters of this model's cached lookups (instances, queries, methods) in this process.
+
+        Returns:
+            dict: l1_hits (served by the per-process cache), l2_hits (by the shared backend), misses
+                (computed), stale_hits (expired values returned while recomputed), early_refreshes
+                (values recomputed before expiring) and lock_waits (callers waiting for a recomputation).
+        """
+        return cls._cache().stats(cls.__name__)
 
     @classmethod
     def cached_query(cls):
@@ -162,28 +975,60 @@ class CacheMixin(AuditMixin):
         return cls.query.cache()
 
     @staticmethod
-    def cached_method(timeout=None):
+    def cached_method(timeout=None, stale_timeout=DEFAULT_STALE_TIMEOUT, lock_timeout=DEFAULT_LOCK_TIMEOUT,
+                      early_expiration=1.0, background_refresh=False, tables=()):
         """
         Decorator for caching method results.
 
+        The results are keyed on the versions of the model's tables and on its generation, so a
+        committed write to the tables or clear_cache makes them stale. When a result expires, one
+        caller recomputes it while the others get the expired result or wait for the new one; see
+        CachePolicy for the other arguments.
+
         Args:
             timeout (int, optional): Cache timeout in seconds.
+            stale_timeout (int, optional): Seconds an expired result is still returned while recomputed.
+            lock_timeout (int, optional): Longest a caller holds the recomputation lock.
+            early_expiration (float, optional): XFetch beta of early recomputation (0 disables it).
+            background_refresh (bool, optional): Return the expired result and recompute it in a worker thread.
+            tables (iterable, optional): Names of other tables the results depend on, e.g. those of
+                the relationships the method reads.
 
         Returns:
             function: Decorated method with caching.
         """
+        policy = CachePolicy(timeout, stale_timeout, lock_timeout, early_expiration, background_refresh)
+
         def decorator(func):
             @wraps(func)
             def wrapper(self, *args, **kwargs):
-                cache = current_app.extensions['cache']
-                key = f"{self.__class__.__name__}:{self.id}:{func.__name__}:{args}:{kwargs}"
-                result = cache.get(key)
-                if result is None:
-                    result = func(self, *args, **kwargs)
-                    cache.set(key, pickle.dumps(result), timeout=timeout)
-                else:
-                    result = pickle.loads(result)
-                return result
+                cls = type(self)
+                cache = self._cache()
+                codec = self._codec()
+                generation = cache.generation(f"model:{cls.__name__}", cls.__cache_l1_timeout__)
+                versions = cache.versions(sorted(_mapper_tables(inspect(cls)).union(tables)))
+                key = (f"{cls.__name__}:{generation}:{self.id}:{func.__name__}:{args}:{kwargs}@"
+                       + ','.join(f"{table}={version}" for table, version in versions.items()))
+
+                def compute(instance=self):
+                    result = func(instance, *args, **kwargs)
+                    return result, codec.encode(result)
+
+                def refresh():
+                    # In a worker thread: self belongs to the caller's session
+                    return compute(cls.query.session.get(cls, self.id))
+
+                fetched = cache.fetch(key, compute, cls.__name__, policy, refresh)
+                if fetched.computed:
+                    return fetched.value
+                try:
+                    # Instances in the result join the session of self
+                    return codec.decode(fetched.payload, object_session(self))
+                except CacheFormatError:
+                    logger.warning("Discarding cached %s", key, exc_info=True)
+                    result, payload = compute()
+                    cache.store(key, payload, policy)
+                    return result
             return wrapper
         return decorator
 
@@ -193,10 +1038,10 @@ class CacheMixin(AuditMixin):
 
     @classmethod
     def clear_cache(cls):
-        """Clear all cached data for this model."""
-        cache = current_app.extensions['cache']
-        cache.delete_memoized(cls.get_cached)
-        cache.delete_memoized(cls.cached_query)
+        """Clear all cached data for this model: its cached instances and the cached queries reading its tables."""
+        cache = cls._cache()
+        cache.bump_generation(f"model:{cls.__name__}")
+        cache.bump(sorted(_mapper_tables(inspect(cls))))
 
 # Example usage (commented out):
 """
@@ -222,6 +1067,11 @@ class User(CacheMixin, Model):
             "followers_count": len(self.followers)
         }
 
+    # Recomputed in a worker thread, early when it is slow; callers meanwhile get the previous result
+    @CacheMixin.cached_method(timeout=300, stale_timeout=600, early_expiration=1.0, background_refresh=True)
+    def get_activity_summary(self):
+        return {"posts_per_day": ..., "top_followers": ...}
+
 # In your application code:
 # Caching an instance
 user = User.query.get(1)
@@ -232,6 +1082,15 @@ cached_user = User.get_cached(1)
 
 # Using cached query
 recent_users = User.cached_query().filter(User.created_on > datetime.utcnow() - timedelta(days=7)).all()
+# Any write committed to nx_users (or to a table the query joins) makes the next call read the database
+
+# A hot query: one worker recomputes it at a time, the others keep getting the previous rows
+active_users = User.query.filter(User.active).cache(timeout=60, stale_timeout=120, background_refresh=True).all()
+
+# Writes made with raw SQL invalidate the cached queries of their tables explicitly
+db.session.execute(text("UPDATE nx_users SET email = lower(email)"))
+db.session.commit()
+bump_table_versions('nx_users')
 
 # Using cached method
 user_profile = user.get_full_profile()  # This result will be cached
@@ -240,6 +1099,9 @@ user_profile = user.get_full_profile()  # This result will be cached
 users = User.query.limit(100).all()
 User.bulk_cache(users)
 
+# Hit/miss counters of User.get_cached in this process
+User.cache_stats()  # {'l1_hits': 120, 'l2_hits': 8, 'misses': 2}
+
 # Clear cache
 User.clear_cache()
 """
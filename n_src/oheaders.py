@@ -1,6 +1,8 @@
 from datetime import date
 from typing import List, Optional
 
+from utils import snake_to_pascal
+
 # Constants
 CURRENT_YEAR = date.today().year
 DOC_HEADER = f"""
@@ -52,10 +54,11 @@ from geoalchemy2 import Geometry
 # View header components
 VIEW_IMPORTS = """
 import calendar
-from flask import redirect, flash, url_for, request, jsonify, current_app, g, Markup
+from flask import redirect, flash, url_for, request, jsonify, current_app, g
+from markupsafe import Markup
 from flask import render_template
 from flask_appbuilder.models.sqla.interface import SQLAInterface
-from flask_appbuilder.views import ModelView, BaseView, MasterDetailView, MultipleView, RestCRUDView, CompactCRUDMixin
+from flask_appbuilder.views import ModelView, BaseView, MasterDetailView, MultipleView, CompactCRUDMixin
 from flask_appbuilder import ModelView, ModelRestApi, CompactCRUDMixin, aggregate_count, action, expose, BaseView, has_access
 from flask_appbuilder.charts.views import ChartView, TimeChartView, GroupByChartView
 from flask_appbuilder.models.group import aggregate_count
@@ -88,6 +91,100 @@ from . import appbuilder, db
 from .models import *
 """
 
+# View file footer
+VIEW_FILE_FOOTER = """
+appbuilder.add_link("rest_api", href="/swagger/v1", icon="fa-sliders", label="REST Api", category="Utilities")
+appbuilder.add_link("graphql", href="/graphql", icon="fa-wrench", label="GraphQL", category="Utilities")
+
+
+#appbuilder.add_separator("Setup")
+#appbuilder.add_separator("My Views")
+#appbuilder.add_link(name, href, icon='', label='', category='', category_icon='', category_label='', baseview=None)
+
+'''
+     Application wide 404 error handler
+'''
+
+@appbuilder.app.errorhandler(404)
+def page_not_found(e):
+    return (
+        render_template(
+           "404.html", base_template=appbuilder.base_template, appbuilder=appbuilder
+        ),
+        404,
+     )
+
+
+db.create_all()
+appbuilder.security_cleanup()
+"""
+
+# Lazy registration of views and APIs (codegen.py --lazy-views, see py_templates/lazy_views.py)
+LAZY_REGISTRY_IMPORTS = """
+from flask import render_template
+from flask_appbuilder import ModelView, ModelRestApi
+from flask_appbuilder.views import MasterDetailView, MultipleView
+
+from . import appbuilder, db
+from .lazy_views import LazyViews
+"""
+
+
+def gen_lazy_registry_header(registry) -> List[str]:
+    """Generate the header of a module registering views or APIs lazily."""
+    return [DOC_HEADER, LAZY_REGISTRY_IMPORTS, f"{registry} = LazyViews(appbuilder, __package__)\n"]
+
+
+LAZY_VIEW_FILE_FOOTER = """
+appbuilder.add_link("rest_api", href="/swagger/v1", icon="fa-sliders", label="REST Api", category="Utilities")
+appbuilder.add_link("graphql", href="/graphql", icon="fa-wrench", label="GraphQL", category="Utilities")
+
+'''
+     Application wide 404 error handler
+'''
+
+@appbuilder.app.errorhandler(404)
+def page_not_found(e):
+    return (
+        render_template(
+           "404.html", base_template=appbuilder.base_template, appbuilder=appbuilder
+        ),
+        404,
+     )
+
+
+db.create_all()
+# appbuilder.security_cleanup() drops the permissions of the views that were not used yet;
+# call lazy_views.materialize_all() and lazy_apis.materialize_all() before running it
+"""
+
+# __init__.py of the models package (codegen.py --models-package): the model classes are imported
+# from their module on first access, so `from .models import Loan` only imports the module of Loan
+# and the modules of its relationship targets
+MODELS_PACKAGE_INIT = """
+import importlib
+
+from . import enums
+from .enums import *
+
+_lazy_imports = {
+@LAZY_IMPORTS@
+}
+
+
+def __getattr__(name):
+    \"\"\"Lazy import handler\"\"\"
+    if name in _lazy_imports:
+        module_name, class_name = _lazy_imports[name]
+        module = importlib.import_module(module_name, package=__name__)
+        return getattr(module, class_name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Everything models.py exported: the model classes and the enums, domains and imports of enums.py
+__all__ = list(_lazy_imports.keys()) + [name for name in dir(enums) if not name.startswith('_')]
+"""
+
 def gen_model_header() -> List[str]:
     """Generate the header for the models file."""
     return [
@@ -95,11 +192,17 @@ def gen_model_header() -> List[str]:
         MODEL_IMPORTS
     ]
 
+def gen_models_package_init(lazy_imports: List[str]) -> List[str]:
+    """Generate the __init__.py of the models package from the "'Class': ('.module', 'Class')," lines of _lazy_imports."""
+    return [DOC_HEADER, MODELS_PACKAGE_INIT.replace('@LAZY_IMPORTS@', '\n'.join(lazy_imports))]
+
 def gen_view_header() -> List[str]:
     """Generate the header for the views file."""
     return [
         DOC_HEADER,
         VIEW_IMPORTS,
+        "from . import appbuilder, db",
+        "from .models import *\n",
         VIEW_UTILITIES
     ]
 
@@ -111,15 +214,16 @@ def gen_api_header() -> List[str]:
     ]
 
 def gen_photo_column(column_name: str, table_class: str) -> str:
-    """Generate code for a photo column."""
+    """Generate code for a photo column, mapped without its suffix so the rendering method can take its name."""
+    col_name = column_name.split('_img')[0].split('_photo')[0]
     return f"""
-    {column_name} = Column(ImageColumn(size=(300, 300, True), thumbnail_size=(30, 30, True)))
-    
+    {col_name} = Column('{column_name}', ImageColumn(size=(300, 300, True), thumbnail_size=(30, 30, True)))
+
     def {column_name}(self):
         im = ImageManager()
-        if self.{column_name}:
+        if self.{col_name}:
             return Markup('<a href="' + url_for('{table_class}ModelView.show', pk=str(self.id)) +
-             '" class="thumbnail"><img src="' + im.get_url(self.photo) +
+             '" class="thumbnail"><img src="' + im.get_url(self.{col_name}) +
               '" alt="Photo" class="img-rounded img-responsive"></a>')
         else:
             return Markup('<a href="' + url_for('{table_class}ModelView.show', pk=str(self.id)) +
@@ -127,9 +231,9 @@ def gen_photo_column(column_name: str, table_class: str) -> str:
 
     def {column_name}_thumbnail(self):
         im = ImageManager()
-        if self.photo:
+        if self.{col_name}:
             return Markup('<a href="' + url_for('{table_class}ModelView.show', pk=str(self.id)) +
-             '" class="thumbnail"><img src="' + im.get_url_thumbnail(self.photo) +
+             '" class="thumbnail"><img src="' + im.get_url_thumbnail(self.{col_name}) +
               '" alt="{column_name}" class="img-rounded img-responsive"></a>')
         else:
             return Markup('<a href="' + url_for('{table_class}ModelView.show', pk=str(self.id)) +
@@ -137,16 +241,75 @@ def gen_photo_column(column_name: str, table_class: str) -> str:
     """
 
 def gen_file_column(column_name: str, table_class: str) -> str:
-    """Generate code for a file column."""
+    """Generate code for a file column, mapped without its suffix so the download link can take its name."""
+    col_name = column_name.split('_file')[0].split('_doc')[0]
     return f"""
-    {column_name} = Column(FileColumn, nullable=False)
-    
-    def download(self):
+    {col_name} = Column('{column_name}', FileColumn())
+
+    def {column_name}(self):
         return Markup(
-            '<a href="' + url_for('{table_class}ModelView.download', filename=str(self.file)) + '">Download</a>'
+            '<a href="' + url_for('{table_class}ModelView.download', filename=str(self.{col_name})) + '">Download</a>'
         )
     """
 
+# GraphQL components
+GQL_IMPORTS = """
+import graphene
+from graphene_sqlalchemy import SQLAlchemyObjectType, SQLAlchemyConnectionField
+from graphene import relay
+from flask_graphql import GraphQLView
+
+from flask_appbuilder.security.sqla.models import User, Role, Permission, PermissionView, RegisterUser
+from .models import *
+from .gql_loaders import batch_relationships
+from .gql_limits import CostLimitBackend
+from .gql_cache import DocumentCache, PersistedQueries, PersistedQueryView
+from . import app
+"""
+
+GQL_QUERY_HDR = """
+class Query(graphene.ObjectType):
+    node = relay.Node.Field()"""
+
+GQL_FOOTER = """
+schema = graphene.Schema(query=Query)
+app.add_url_rule('/graphql', view_func=PersistedQueryView.as_view(
+    'graphql',
+    schema=schema,
+    graphiql=True,
+    backend=DocumentCache.from_config(CostLimitBackend.from_config(app.config), app.config),
+    persisted_queries=PersistedQueries.from_config(app.config),
+))
+"""
+
+def gen_gql_header() -> str:
+    """Generate the header for the GraphQL file."""
+    return DOC_HEADER + GQL_IMPORTS
+
+def gen_gql_class(table: str, exclusions: str) -> str:
+    """Generate the graphene-sqlalchemy object type of a model."""
+    gql_class = f"""
+@batch_relationships
+class {table}Gql(SQLAlchemyObjectType):
+    class Meta:
+        model = {table}
+        interfaces = (relay.Node, )
+        # use `only_fields` to only expose specific fields ie "name"
+        # only_fields = ("name",)
+        # use `exclude_fields` to exclude specific fields ie "last_name"
+        # exclude_fields = ({exclusions},)
+        
+"""
+    if len(exclusions) > 1:
+        gql_class = gql_class + '\n' + f"        exclude_fields = ({exclusions},)"
+    return gql_class
+
+def gen_gql_query(table: str) -> str:
+    """Generate the Query field listing the rows of a table."""
+    table_class = snake_to_pascal(table)
+    return f"""    # Allows sorting over multiple {table_class}columns, by default over the primary key
+    all_{table.lower()} = SQLAlchemyConnectionField({table_class}Gql.connection) #sort={table_class}Gql.sort_argument())"""
+
 # Add more generator functions for other components as needed
 
 def gen_view_body(class_name: str, snk_table_name: str, tbl_columns: List[str], rt_fld_set: str, rt_cols: List[str], lbl_cols: dict) -> str:
@@ -0,0 +1,104 @@
+"""
+partition.py: Split the generated code of a schema into modules
+
+A schema of a few hundred tables gives views.py and apis.py files of tens of
+thousands of lines, all of which every process imports at startup. The lazy
+generation modes put the code of each group of tables in a module of its own,
+so a process only imports the groups it uses.
+
+Tables are grouped by the prefix of their name (acc_, loan_, inventory_, ...),
+the way the schemas this generator is used on are organised, or by the
+components of the foreign key graph, so no relationship crosses modules.
+Prefixes and components of fewer than min_size tables go to a common group, so
+small schemas do not end up as one module per table.
+
+Usage:
+    groups = group_tables([t.name for t in metadata.sorted_tables])
+    groups['loan_repayment_schedule']   # 'loan'
+
+    foreign_keys = [(t.name, fk.column.table.name) for t in metadata.sorted_tables for fk in t.foreign_keys]
+    groups = group_components([t.name for t in metadata.sorted_tables], foreign_keys)
+    groups['loan_repayment_schedule']   # 'person', when person is the first table of its component
+"""
+
+import re
+
+DEFAULT_GROUP = 'misc'
+
+
+def table_prefix(table_name):
+    """The first word of a snake_case table name, usable in a module name."""
+    prefix = table_name.split('_', 1)[0].lower()
+    prefix = re.sub(r'\W', '', prefix)
+    return prefix or DEFAULT_GROUP
+
+
+def group_tables(table_names, min_size=2, default=DEFAULT_GROUP):
+    """
+    Group tables by the prefix of their name.
+
+    Args:
+        table_names (list): Names of the tables to group.
+        min_size (int): Smallest number of tables a prefix needs to form a group of its own.
+        default (str): Group of the tables whose prefix is too rare.
+
+    Returns:
+        dict: table name -> group name, in the order of table_names.
+    """
+    prefixes = {name: table_prefix(name) for name in table_names}
+    sizes = {}
+    for prefix in prefixes.values():
+        sizes[prefix] = sizes.get(prefix, 0) + 1
+    return {name: prefix if sizes[prefix] >= min_size else default for name, prefix in prefixes.items()}
+
+
+def module_name(kind, group):
+    """Module holding the code of kind ('views', 'apis', ...) for a group of tables."""
+    return f"{kind}_{group}"
+
+
+def group_components(table_names, foreign_keys, min_size=2, default=DEFAULT_GROUP):
+    """
+    Group tables by the connected components of the foreign key graph.
+
+    Each component is named after the prefix of its first table (in the order of
+    table_names), with a number appended when an earlier component has that name.
+
+    Args:
+        table_names (list): Names of the tables to group.
+        foreign_keys (list): (table, referred table) pairs; tables not in table_names are ignored.
+        min_size (int): Smallest number of tables a component needs to form a group of its own.
+        default (str): Group of the tables of smaller components.
+
+    Returns:
+        dict: table name -> group name, in the order of table_names.
+    """
+    parents = {name: name for name in table_names}
+
+    def find(name):
+        while parents[name] != name:
+            parents[name] = parents[parents[name]]
+            name = parents[name]
+        return name
+
+    for table, referred_table in foreign_keys:
+        if table in parents and referred_table in parents:
+            parents[find(table)] = find(referred_table)
+
+    components = {}
+    for name in table_names:
+        components.setdefault(find(name), []).append(name)
+    groups = {}
+    names = {default}
+    for tables in components.values():
+        group = default
+        if len(tables) >= min_size:
+            group = table_prefix(tables[0])
+            suffix = 2
+            while group in names:
+                group = f"{table_prefix(tables[0])}{suffix}"
+                suffix += 1
+            names.add(group)
+        for name in tables:
+            groups[name] = group
+    return {name: groups[name] for name in table_names}
@@ -0,0 +1,194 @@
+"""
+profiling.py: Opt-in timing and counters for the code generation pipeline
+
+Nothing is recorded unless profiling is enabled (the generators' --profile
+option). Once enabled it records:
+
+- wall time per phase, with nested phases (e.g. gen_models/prepare_relationship_info)
+- wall time per table for every per-table task run through parallel.emit_parallel,
+  including tasks run in worker processes
+- the number of calls made to each Inspector / SchemaSnapshot method
+- the number of lines and bytes each phase emitted
+
+At the end a summary table is printed and the full trace is written as JSON.
+
+Usage:
+    profiler = profiling.enable()
+    with profiling.phase('reflection'):
+        metadata, inspector = load_schema(uri)
+    inspector = profiling.count_calls(inspector)
+    with profiling.phase('gen_models'):
+        write_file('models.py', profiling.counted(gen_models(metadata, inspector)))
+    profiler.print_summary()
+    profiler.dump('profile.json')
+"""
+
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from functools import partial
+
+# Calls made through count_calls proxies in this process, by method name
+_calls = Counter()
+
+# The active Profiler, or None when profiling is disabled
+_profiler = None
+
+
+def enable():
+    """Turn profiling on for this process and return the Profiler."""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def active():
+    """Return the active Profiler, or None when profiling is disabled."""
+    return _profiler
+
+
+def phase(name):
+    """Context manager timing a phase; does nothing when profiling is disabled."""
+    return _profiler.phase(name) if _profiler else nullcontext()
+
+
+def counted(lines):
+    """Pass generated lines through, counting them towards the current phase."""
+    return _profiler.counted(lines) if _profiler else lines
+
+
+def count_calls(inspector):
+    """Wrap an inspector so its method calls are counted; returns it unchanged when profiling is disabled."""
+    return CountingInspector(inspector) if _profiler else inspector
+
+
+def timed(func):
+    """Wrap a per-table task so it also returns its wall time and inspector calls (see parallel.emit_parallel)."""
+    return partial(_timed_call, func)
+
+
+def _timed_call(func, state, item):
+    # Runs in the worker process when generating in parallel, so the call counts are returned as a delta
+    calls_before = Counter(_calls)
+    start = time.perf_counter()
+    result = func(state, item)
+    return result, time.perf_counter() - start, dict(Counter(_calls) - calls_before)
+
+
+class CountingInspector:
+    """Proxy counting the method calls made on an Inspector or SchemaSnapshot."""
+
+    def __init__(self, inspector):
+        self._inspector = inspector
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        attr = getattr(self._inspector, name)
+        if not callable(attr):
+            return attr
+
+        def counted_call(*args, **kwargs):
+            _calls[name] += 1
+            return attr(*args, **kwargs)
+        return counted_call
+
+
+class Profiler:
+    """Collects the phase and table timings of one generator run."""
+
+    def __init__(self):
+        self.phases = []
+        self._stack = []
+        self.started = datetime.now(timezone.utc).isoformat()
+
+    @contextmanager
+    def phase(self, name):
+        """Time a phase; phases opened inside it are recorded as its children."""
+        if self._stack:
+            name = f"{self._stack[-1]['name']}/{name}"
+        record = {
+            'name': name,
+            'depth': len(self._stack),
+            'seconds': None,
+            'lines': 0,
+            'bytes': 0,
+            'inspector_calls': {},
+            'tables': [],
+            '_worker_calls': Counter(),
+        }
+        self.phases.append(record)
+        self._stack.append(record)
+        calls_before = Counter(_calls)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self._stack.pop()
+            worker_calls = record.pop('_worker_calls')
+            record['inspector_calls'] = dict((Counter(_calls) - calls_before) + worker_calls)
+            if self._stack:
+                self._stack[-1]['_worker_calls'] += worker_calls
+                self._stack[-1]['lines'] += record['lines']
+                self._stack[-1]['bytes'] += record['bytes']
+
+    def counted(self, lines):
+        """Count lines and bytes towards the phase that is current now, while passing them through."""
+        record = self._stack[-1] if self._stack else None
+
+        def count():
+            for line in lines:
+                if record is not None:
+                    record['lines'] += line.count('\n') + 1
+                    record['bytes'] += len(line.encode())
+                yield line
+        return count()
+
+    def record_tables(self, items, timed_results, in_workers):
+        """Unpack the results of tasks wrapped with timed(), recording each table in the current phase."""
+        record = self._stack[-1] if self._stack else None
+        results = []
+        for item, (result, seconds, calls) in zip(items, timed_results):
+            results.append(result)
+            if record is None:
+                continue
+            record['tables'].append({'table': item, 'seconds': seconds, 'inspector_calls': sum(calls.values())})
+            if in_workers:
+                record['_worker_calls'].update(calls)
+        return results
+
+    def totals(self):
+        """Return the inspector calls of all top-level phases, by method name."""
+        totals = Counter()
+        for record in self.phases:
+            if record['depth'] == 0:
+                totals.update(record['inspector_calls'])
+        return dict(totals)
+
+    def print_summary(self, slowest=10):
+        """Print the phase table and the slowest tables."""
+        print(f"\n{'phase':<44}{'seconds':>10}{'tables':>8}{'lines':>10}{'bytes':>12}{'inspector calls':>17}")
+        for record in self.phases:
+            label = '  ' * record['depth'] + record['name'].rsplit('/', 1)[-1]
+            print(f"{label:<44}{record['seconds'] or 0:>10.3f}{len(record['tables']) or '':>8}"
+                  f"{record['lines'] or '':>10}{record['bytes'] or '':>12}"
+                  f"{sum(record['inspector_calls'].values()) or '':>17}")
+
+        tables = [(t['seconds'], record['name'], t['table'], t['inspector_calls'])
+                  for record in self.phases for t in record['tables']]
+        if tables:
+            print(f"\n{'slowest tables':<44}{'seconds':>10}{'calls':>8}")
+            for seconds, phase_name, table, calls in sorted(tables, reverse=True)[:slowest]:
+                print(f"{phase_name + ': ' + table:<44}{seconds:>10.4f}{calls:>8}")
+
+    def dump(self, path):
+        """Write the full trace as JSON."""
+        with open(path, 'w') as f:
+            json.dump({
+                'started': self.started,
+                'inspector_calls': self.totals(),
+                'phases': self.phases,
+            }, f, indent=2)
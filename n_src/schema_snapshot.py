@@ -0,0 +1,393 @@
+"""
+schema_snapshot.py: Bulk catalog snapshot for the code generators
+
+SQLAlchemy's Inspector issues one catalog query per table for every
+get_columns / get_pk_constraint / get_foreign_keys / ... call. With seven
+lookups per table this adds up to thousands of round trips on a large schema.
+
+SchemaSnapshot loads the whole catalog up front using the Inspector's bulk
+``get_multi_*`` methods (one query per kind of object for all tables) and then
+answers the same calls from memory, returning exactly the same dict shapes the
+Inspector would. The generators can therefore take a SchemaSnapshot wherever
+they used to take an Inspector.
+
+A snapshot can also be dumped to a JSON file and loaded back later, so the
+generators can run without a database connection (e.g. in CI or benchmarks).
+``to_metadata`` rebuilds from it the MetaData that ``metadata.reflect`` would
+give, so ``load_schema`` reads the catalog once, in bulk, for both.
+
+Usage:
+    engine = create_engine("postgresql:///your_database_name")
+    snapshot = SchemaSnapshot.from_engine(engine)
+    columns = snapshot.get_columns("person")
+
+    snapshot.dump("schema.json")
+    metadata, snapshot = load_schema(snapshot_path="schema.json")
+"""
+
+import importlib
+import json
+from inspect import signature
+
+from sqlalchemy import (
+    CheckConstraint, Column, Computed, ForeignKeyConstraint, Identity, Index, MetaData,
+    Table, UniqueConstraint, create_engine, inspect, text,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import NoSuchTableError
+from sqlalchemy.types import TypeEngine
+
+import profiling
+
+SNAPSHOT_VERSION = 2
+
+
+class SchemaSnapshot:
+    """
+    In-memory copy of the reflected schema exposing the Inspector API used by the generators.
+
+    The lists and dicts returned are shared with the snapshot; callers must treat them as read-only.
+    """
+
+    def __init__(self, table_names, columns, pk_constraints, foreign_keys, unique_constraints,
+                 indexes, check_constraints, table_comments, enums=None, domains=None,
+                 default_schema_name=None, dialect_name=None, row_estimates=None):
+        self.table_names = list(table_names)
+        self.columns = columns
+        self.pk_constraints = pk_constraints
+        self.foreign_keys = foreign_keys
+        self.unique_constraints = unique_constraints
+        self.indexes = indexes
+        self.check_constraints = check_constraints
+        self.table_comments = table_comments
+        self.enums = enums or []
+        self.domains = domains or []
+        self.default_schema_name = default_schema_name
+        self.dialect_name = dialect_name
+        self.row_estimates = row_estimates or {}
+
+    @classmethod
+    def from_engine(cls, engine, schema=None):
+        """
+        Build a snapshot from a live database connection.
+
+        Args:
+            engine (Engine): SQLAlchemy engine bound to the database to introspect.
+            schema (str, optional): Schema to load; defaults to the connection's default schema.
+
+        Returns:
+            SchemaSnapshot: The loaded snapshot.
+        """
+        return cls.from_inspector(inspect(engine), schema=schema)
+
+    @classmethod
+    def from_inspector(cls, inspector, schema=None):
+        """
+        Build a snapshot using the Inspector's bulk reflection methods.
+
+        Each ``get_multi_*`` call is a single catalog query covering every table in the schema.
+
+        Args:
+            inspector (Inspector): SQLAlchemy Inspector object.
+            schema (str, optional): Schema to load; defaults to the connection's default schema.
+
+        Returns:
+            SchemaSnapshot: The loaded snapshot.
+        """
+        table_names = inspector.get_table_names(schema=schema)
+
+        columns = _by_table(inspector.get_multi_columns(schema=schema))
+        for table_columns in columns.values():
+            for column in table_columns:
+                column.setdefault('comment', None)
+
+        return cls(
+            table_names=table_names,
+            columns=columns,
+            pk_constraints=_by_table(inspector.get_multi_pk_constraint(schema=schema)),
+            foreign_keys=_by_table(inspector.get_multi_foreign_keys(schema=schema)),
+            unique_constraints=_by_table(inspector.get_multi_unique_constraints(schema=schema)),
+            indexes=_by_table(inspector.get_multi_indexes(schema=schema)),
+            check_constraints=_by_table(_get_multi_optional(inspector, 'get_multi_check_constraints', schema)),
+            table_comments=_by_table(_get_multi_optional(inspector, 'get_multi_table_comment', schema)),
+            enums=inspector.get_enums(schema=schema) if hasattr(inspector, 'get_enums') else [],
+            domains=inspector.get_domains(schema=schema) if hasattr(inspector, 'get_domains') else [],
+            default_schema_name=inspector.default_schema_name,
+            dialect_name=inspector.dialect.name,
+            row_estimates=_get_row_estimates(inspector, schema),
+        )
+
+    def to_dict(self):
+        """Return the snapshot as a plain dict; column types are left as TypeEngine objects."""
+        return {
+            'version': SNAPSHOT_VERSION,
+            'dialect_name': self.dialect_name,
+            'default_schema_name': self.default_schema_name,
+            'table_names': self.table_names,
+            'columns': self.columns,
+            'pk_constraints': self.pk_constraints,
+            'foreign_keys': self.foreign_keys,
+            'unique_constraints': self.unique_constraints,
+            'indexes': self.indexes,
+            'check_constraints': self.check_constraints,
+            'table_comments': self.table_comments,
+            'enums': self.enums,
+            'domains': self.domains,
+            'row_estimates': self.row_estimates,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a snapshot from the output of to_dict."""
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported schema snapshot version: {data.get('version')}")
+        return cls(**{key: value for key, value in data.items() if key != 'version'})
+
+    def dump(self, path):
+        """
+        Write the snapshot to a JSON file.
+
+        Column types are stored as their class path and constructor arguments (see _encode_type)
+        and rebuilt on load.
+
+        Args:
+            path (str): File to write.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, default=_encode_type, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a snapshot written by dump.
+
+        Args:
+            path (str): File to read.
+
+        Returns:
+            SchemaSnapshot: The loaded snapshot.
+        """
+        with open(path) as f:
+            data = json.load(f)
+        for table_columns in data.get('columns', {}).values():
+            for column in table_columns:
+                column['type'] = _decode_type(column['type'])
+        return cls.from_dict(data)
+
+    def to_metadata(self):
+        """
+        Rebuild the tables of the snapshot as a MetaData, as metadata.reflect would.
+
+        Returns:
+            MetaData: One Table per table in the snapshot, with columns, keys, constraints and indexes.
+        """
+        metadata = MetaData()
+        for table_name in self.table_names:
+            pk_columns = self.get_pk_constraint(table_name)['constrained_columns']
+            items = [_to_column(column, column['name'] in pk_columns) for column in self.get_columns(table_name)]
+
+            for fk in self.get_foreign_keys(table_name):
+                referred = fk['referred_table']
+                if fk.get('referred_schema'):
+                    referred = f"{fk['referred_schema']}.{referred}"
+                items.append(ForeignKeyConstraint(
+                    fk['constrained_columns'], [f"{referred}.{column}" for column in fk['referred_columns']],
+                    name=fk['name'], **fk.get('options', {})))
+
+            for uq in self.get_unique_constraints(table_name):
+                items.append(UniqueConstraint(*uq['column_names'], name=uq['name']))
+
+            for ck in self.get_check_constraints(table_name):
+                items.append(CheckConstraint(text(ck['sqltext']), name=ck['name']))
+
+            for index in self.get_indexes(table_name):
+                # Expression indexes have no column names, and some indexes only back a unique constraint
+                if None in index['column_names'] or 'duplicates_constraint' in index:
+                    continue
+                items.append(Index(index['name'], *index['column_names'], unique=index['unique']))
+
+            Table(table_name, metadata, *items, comment=self.get_table_comment(table_name)['text'])
+        return metadata
+
+    def get_table_names(self):
+        """Return the names of all tables in the snapshot, in reflection order."""
+        return self.table_names
+
+    def get_columns(self, table_name):
+        """Return the reflected columns of a table."""
+        return self._lookup(self.columns, table_name)
+
+    def get_pk_constraint(self, table_name):
+        """Return the primary key constraint of a table."""
+        return self._lookup(self.pk_constraints, table_name)
+
+    def get_foreign_keys(self, table_name):
+        """Return the foreign keys of a table."""
+        return self._lookup(self.foreign_keys, table_name)
+
+    def get_unique_constraints(self, table_name):
+        """Return the unique constraints of a table."""
+        return self._lookup(self.unique_constraints, table_name)
+
+    def get_indexes(self, table_name):
+        """Return the indexes of a table."""
+        return self._lookup(self.indexes, table_name)
+
+    def get_check_constraints(self, table_name):
+        """Return the check constraints of a table."""
+        # Known tables may be missing here: not every dialect reflects check constraints or table comments
+        self._lookup(self.columns, table_name)
+        return self.check_constraints.get(table_name, [])
+
+    def get_table_comment(self, table_name):
+        """Return the comment of a table as a dict with a 'text' key."""
+        self._lookup(self.columns, table_name)
+        return self.table_comments.get(table_name, {'text': None})
+
+    def get_enums(self):
+        """Return the enum types defined in the database."""
+        return self.enums
+
+    def get_domains(self):
+        """Return the domains defined in the database."""
+        return self.domains
+
+    def get_row_estimates(self):
+        """Return the planner's estimated row count per table; tables without statistics are left out."""
+        return self.row_estimates
+
+    def _lookup(self, catalog, table_name):
+        try:
+            return catalog[table_name]
+        except KeyError:
+            raise NoSuchTableError(table_name) from None
+
+
+def load_schema(database_uri=None, snapshot_path=None):
+    """
+    Load the schema for the generators from a database or from a dumped snapshot.
+
+    Args:
+        database_uri (str, optional): SQLAlchemy database URI to reflect.
+        snapshot_path (str, optional): Snapshot file written by SchemaSnapshot.dump; takes precedence.
+
+    Returns:
+        tuple: (MetaData, SchemaSnapshot)
+    """
+    if snapshot_path:
+        snapshot = SchemaSnapshot.load(snapshot_path)
+        return snapshot.to_metadata(), snapshot
+
+    engine = create_engine(database_uri)
+    snapshot = SchemaSnapshot.from_inspector(profiling.count_calls(inspect(engine)))
+    return snapshot.to_metadata(), snapshot
+
+
+def _to_column(column, primary_key):
+    """Build a Column from a reflected column dict."""
+    args = []
+    if column.get('computed'):
+        args.append(Computed(column['computed']['sqltext'], persisted=column['computed'].get('persisted')))
+    if column.get('identity'):
+        args.append(Identity(**column['identity']))
+    default = column.get('default')
+    return Column(
+        column['name'], column['type'], *args,
+        primary_key=primary_key,
+        nullable=column['nullable'],
+        server_default=text(default) if default is not None and not column.get('computed') else None,
+        autoincrement=column.get('autoincrement', 'auto'),
+        comment=column.get('comment'),
+    )
+
+
+def _encode_type(value):
+    """
+    Store a column type as its class path and the constructor arguments that differ from the defaults,
+    e.g. {"type": "sqlalchemy.sql.sqltypes:VARCHAR", "args": [], "kwargs": {"length": 50}}.
+
+    The arguments are read back from the attributes of the same name, as SQLAlchemy's own repr of a
+    type does, so third-party types (geoalchemy2's Geometry, ...) are stored the same way.
+    """
+    if not isinstance(value, TypeEngine):
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    cls = type(value)
+    args, kwargs = [], {}
+    # Only a constructor taking **kw passes arguments on to the constructors of its bases
+    takes_kw = any(param.kind is param.VAR_KEYWORD for param in signature(cls.__init__).parameters.values())
+    for klass in cls.__mro__:
+        if '__init__' not in vars(klass) or klass in (TypeEngine, object):
+            continue
+        for param in signature(klass.__init__).parameters.values():
+            name = param.name
+            # The MetaData of a SchemaType (Enum, ...) is the schema it was defined in, not part of the type
+            if name in ('self', 'metadata') or name.startswith('_') or name in kwargs or not hasattr(value, name):
+                continue
+            attribute = getattr(value, name)
+            if param.kind is param.VAR_POSITIONAL:
+                if not args:
+                    args = list(attribute)
+            elif param.kind is not param.VAR_KEYWORD and attribute != param.default:
+                kwargs[name] = attribute
+        if not takes_kw:
+            break
+    return {'type': f"{cls.__module__}:{cls.__qualname__}", 'args': args, 'kwargs': kwargs}
+
+
+def _is_encoded_type(value):
+    return isinstance(value, dict) and value.keys() == {'type', 'args', 'kwargs'}
+
+
+def _decode_type(encoded):
+    """Rebuild a column type stored by _encode_type, importing its class from the stored path."""
+    module_name, _, qualname = encoded['type'].partition(':')
+    try:
+        cls = importlib.import_module(module_name)
+        for name in qualname.split('.'):
+            cls = getattr(cls, name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f"Cannot import column type {encoded['type']!r} from snapshot") from e
+    if not (isinstance(cls, type) and issubclass(cls, TypeEngine)):
+        raise ValueError(f"{encoded['type']!r} in snapshot is not a column type")
+
+    def decode(value):
+        if _is_encoded_type(value):
+            return _decode_type(value)
+        if isinstance(value, list):
+            return [decode(item) for item in value]
+        return value
+
+    args = [decode(arg) for arg in encoded['args']]
+    kwargs = {name: decode(value) for name, value in encoded['kwargs'].items()}
+    try:
+        return cls(*args, **kwargs)
+    except Exception as e:
+        raise ValueError(f"Cannot rebuild column type {encoded['type']!r} from snapshot") from e
+
+
+def _by_table(multi_result):
+    """Re-key a ``get_multi_*`` result from (schema, table_name) to table_name."""
+    return {table_name: value for (_, table_name), value in multi_result.items()}
+
+
+def _get_row_estimates(inspector, schema):
+    """Read the row count estimates from pg_class; other databases do not keep comparable statistics."""
+    if inspector.dialect.name != 'postgresql' or not isinstance(inspector.bind, Engine):
+        return {}
+    query = text(
+        "SELECT c.relname, c.reltuples FROM pg_catalog.pg_class c "
+        "JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relkind IN ('r', 'p') AND n.nspname = :schema"
+    )
+    with inspector.bind.connect() as conn:
+        rows = conn.execute(query, {'schema': schema or inspector.default_schema_name})
+        # reltuples is -1 for tables that have never been vacuumed or analyzed
+        return {name: int(reltuples) for name, reltuples in rows if reltuples >= 0}
+
+
+def _get_multi_optional(inspector, method_name, schema):
+    """Call a ``get_multi_*`` method that some dialects (e.g. SQLite comments) do not implement."""
+    try:
+        return getattr(inspector, method_name)(schema=schema)
+    except NotImplementedError:
+        return {}
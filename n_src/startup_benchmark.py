@@ -0,0 +1,228 @@
+"""
+startup_benchmark.py: Startup time of generated apps, eager against lazy views
+
+Synthesizes a schema (see benchmark.py), generates its models with codegen.py
+and then its views and APIs twice: as single views.py / apis.py files
+registering every class at import time, and with codegen.py --lazy-views, one
+module per group of tables registered through lazy_views.LazyViews. Each
+variant is written as an app package next to a copy of the schema's SQLite
+database and started in a fresh Python process, --repeat times, measuring:
+
+    startup          import of the app package: models, views, APIs, permissions
+    first_view       first request to a ModelView list
+    first_api        first request to a ModelRestApi list
+    second_view      the same ModelView list again
+    views            views instantiated after startup
+    modules          app modules imported after the requests
+    max_rss_kb       peak resident memory of the process
+
+The best and median of every measure are written as JSON, with the git commit
+and the schema parameters, like benchmark.py. A variant whose app fails to
+start is recorded with the error instead of aborting the run.
+
+The apps run the generated code as is, so this needs the environment the
+generated apps are deployed in: Flask-AppBuilder, Flask-SQLAlchemy and the
+packages the generated model header imports (GeoAlchemy2, SQLAlchemy-Utils).
+Measured with Python 3.11, Flask 3.1, Flask-AppBuilder 5.2 and SQLAlchemy 2.1.
+
+Usage:
+python startup_benchmark.py --tables 300 --fk-density 0.5 --repeat 5 --output startup.json
+
+Dependencies:
+- SQLAlchemy
+- inflect
+- Flask-AppBuilder
+- Flask-SQLAlchemy
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from schema_snapshot import load_schema
+from benchmark import synthesize_schema, load_schema_source, git_commit
+import codegen
+from utils import write_file, snake_to_pascal
+
+MODES = ['eager', 'lazy']
+MEASURES = ['startup', 'first_view', 'first_api', 'second_view', 'views', 'modules', 'max_rss_kb']
+
+# The lazy registry the --lazy-views modules import, copied into the app package
+LAZY_VIEWS_RUNTIME = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'py_templates',
+                                  'lazy_views.py')
+
+APP_INIT = """
+from flask import Flask
+from flask_appbuilder import AppBuilder
+from flask_appbuilder.models.sqla import Model
+from flask_sqlalchemy import SQLAlchemy
+
+app = Flask(__name__)
+app.config.update(SECRET_KEY='startup-benchmark', SQLALCHEMY_DATABASE_URI={database_uri!r},
+                  WTF_CSRF_ENABLED=False, AUTH_ROLE_PUBLIC='Admin', FAB_ADD_SECURITY_VIEWS=False)
+db = SQLAlchemy(app, model_class=Model)
+with app.app_context():
+    appbuilder = AppBuilder(app, db.session)
+    from . import models, views, apis
+"""
+
+# Run in a fresh process from the directory holding the app package; prints the measures as JSON
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+measures = {{'startup': time.perf_counter() - start}}
+client = app.app.test_client()
+for name, url in (('first_view', {view_url!r}), ('first_api', {api_url!r}), ('second_view', {view_url!r})):
+    start = time.perf_counter()
+    response = client.get(url)
+    measures[name] = time.perf_counter() - start
+    if response.status_code != 200:
+        raise SystemExit(f"GET {{url}}: {{response.status_code}}")
+measures['views'] = len(app.appbuilder.baseviews)
+measures['modules'] = len([name for name in sys.modules if name.startswith('app.')])
+measures['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps(measures))
+"""
+
+
+def build_app(directory, mode, metadata, inspector, database_path):
+    """
+    Generate the app package of a mode into directory/app.
+
+    Returns:
+        str: The directory to start the app from.
+    """
+    package = os.path.join(directory, mode, 'app')
+    shutil.rmtree(os.path.dirname(package), ignore_errors=True)
+    os.makedirs(package)
+    database = os.path.join(directory, mode, 'app.db')
+    shutil.copyfile(database_path, database)
+    write_file(os.path.join(package, '__init__.py'), [APP_INIT.format(database_uri=f"sqlite:///{database}")])
+    write_file(os.path.join(package, 'models.py'), codegen.gen_models(metadata, inspector))
+    if mode == 'lazy':
+        shutil.copyfile(LAZY_VIEWS_RUNTIME, os.path.join(package, 'lazy_views.py'))
+        codegen.write_modules(os.path.join(package, 'views.py'), codegen.gen_lazy_views(metadata, inspector))
+        codegen.write_modules(os.path.join(package, 'apis.py'), codegen.gen_lazy_api(metadata, inspector))
+    else:
+        write_file(os.path.join(package, 'views.py'), codegen.gen_views(metadata, inspector))
+        write_file(os.path.join(package, 'apis.py'), codegen.gen_api(metadata, inspector))
+    return os.path.dirname(package)
+
+
+def probe(app_directory, view_url, api_url):
+    """Start the app in a new process and return its measures, or raise RuntimeError with its error."""
+    result = subprocess.run([sys.executable, '-c', PROBE.format(view_url=view_url, api_url=api_url)],
+                            cwd=app_directory, capture_output=True, text=True)
+    if result.returncode != 0:
+        error = (result.stderr or result.stdout).strip().splitlines()
+        raise RuntimeError(error[-1] if error else f"exit status {result.returncode}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def time_mode(app_directory, view_url, api_url, repeat):
+    """Probe an app `repeat` times and summarize each measure."""
+    runs = []
+    try:
+        for _ in range(repeat):
+            runs.append(probe(app_directory, view_url, api_url))
+    except RuntimeError as e:
+        return {'error': str(e)}
+    return {measure: {'best': min(run[measure] for run in runs),
+                      'median': statistics.median(run[measure] for run in runs),
+                      'runs': [run[measure] for run in runs]}
+            for measure in MEASURES}
+
+
+def run_benchmark(source, repeat=3, directory=None):
+    """
+    Generate the eager and lazy apps of a schema source and time their startup.
+
+    Args:
+        source (dict): Keyword arguments for schema_snapshot.load_schema; must be an SQLite database.
+        repeat (int): Number of processes started per mode.
+        directory (str): Where to generate the apps (default: a temporary directory).
+
+    Returns:
+        dict: Mode -> measure -> timing summary (see time_mode).
+    """
+    if directory is None:
+        with tempfile.TemporaryDirectory() as temporary:
+            return run_benchmark(source, repeat, temporary)
+    metadata, inspector = load_schema(**source)
+    database_path = source['database_uri'][len('sqlite:///'):]
+    # The first table's views: present in both modes, and the first lazy module to be imported
+    model = snake_to_pascal(metadata.sorted_tables[0].name)
+    view_url = f"/{model.lower()}modelview/list/"
+    api_url = f"/api/v1/{model.lower()}api/"
+
+    results = {}
+    for mode in MODES:
+        app_directory = build_app(directory, mode, metadata, inspector, database_path)
+        results[mode] = time_mode(app_directory, view_url, api_url, repeat)
+    return results
+
+
+def print_results(results):
+    """Print the best and median of every measure per mode, with the lazy/eager ratio of the best runs."""
+    for mode in MODES:
+        if 'error' in results[mode]:
+            print(f"{mode}: {results[mode]['error']}")
+    print(f"{'measure':<16}" + ''.join(f"{mode + ' best':>14}{mode + ' median':>16}" for mode in MODES)
+          + f"{'lazy/eager':>12}")
+    for measure in MEASURES:
+        row = f"{measure:<16}"
+        for mode in MODES:
+            result = results[mode].get(measure, {})
+            row += f"{result.get('best', ''):>14.4g}{result.get('median', ''):>16.4g}" if result else f"{'':>30}"
+        eager, lazy = results['eager'].get(measure), results['lazy'].get(measure)
+        if eager and lazy and eager['best']:
+            row += f"{lazy['best'] / eager['best']:>12.2f}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the startup time of eager and lazily registered views.')
+    parser.add_argument('--tables', type=int, default=100, help='Number of entity tables')
+    parser.add_argument('--columns', type=int, default=10, help='Data columns per table')
+    parser.add_argument('--fk-density', type=float, default=0.3, help='Average foreign keys per table')
+    parser.add_argument('--association-tables', type=int, default=10, help='Number of _link tables')
+    parser.add_argument('--self-refs', type=int, default=5, help='Number of self-referential tables')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the schema')
+    parser.add_argument('--path', type=str, help='Directory for the database and the apps (default: a temporary one)')
+    parser.add_argument('--repeat', type=int, default=3, help='Processes started per mode')
+    parser.add_argument('--output', type=str, default='startup_benchmark.json', help='JSON results file')
+    args = parser.parse_args()
+
+    params = {key: getattr(args, key) for key in
+              ('tables', 'columns', 'fk_density', 'association_tables', 'self_refs', 'seed')}
+    # SQLite has no enum types; the generated apps run on a copy of this database
+    metadata = synthesize_schema(args.tables, args.columns, args.fk_density, args.association_tables,
+                                 0, args.self_refs, args.seed)
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = args.path or temporary
+        os.makedirs(directory, exist_ok=True)
+        source = load_schema_source(metadata, 'sqlite', os.path.join(directory, 'schema.db'))
+        results = run_benchmark(source, args.repeat, directory)
+    print_results(results)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'params': params,
+            'modes': results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
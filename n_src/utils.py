@@ -1,23 +1,43 @@
 
 import sqlalchemy.types as types
 import logging
+import os
+from typing import Iterable
 
 # Set up logging configuration
 logging.basicConfig(level=logging.ERROR)
 
-def write_file(filename: str, list_of_strings: list[str]) -> None:
+WRITE_BUFFER_SIZE = 1 << 16
+
+def write_file(filename: str, list_of_strings: Iterable[str], atomic: bool = False) -> None:
     """
-    Writes a list of strings to a file, with each string on a new line.
+    Writes strings to a file, with each string on a new line.
+
+    The strings are written as they are produced, so a generator of code chunks is
+    streamed to disk without the whole file ever being held in memory.
 
     :param filename: The name of the file to write to.
-    :param list_of_strings: A list of strings to be written to the file.
+    :param list_of_strings: A list, or any iterable, of strings to be written to the file.
+    :param atomic: Write to a temporary file first and rename it over filename once complete,
+        so the file is never seen half-written.
     """
+    target = filename
     try:
-        with open(filename, "w") as f:
-            s = "\n".join(list_of_strings)
-            f.write(s)
+        if atomic:
+            target = f"{filename}.tmp"
+        with open(target, "w", buffering=WRITE_BUFFER_SIZE) as f:
+            separator = ""
+            for s in list_of_strings:
+                f.write(separator)
+                f.write(s)
+                separator = "\n"
+        if atomic:
+            os.replace(target, filename)
     except IOError as e:
         logging.error(f"An error occurred while writing to the file: {e}")
+    finally:
+        if atomic and os.path.exists(target):
+            os.remove(target)
 
 
 class LowerCaseString(types.TypeDecorator):
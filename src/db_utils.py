@@ -432,19 +432,21 @@ def is_association_table(table_name):
     return False
 
 
-# Selects the best display name given a list of column names
-def get_display_column(column_names):
+# Selects the best display column given the reflected column dicts of a table; returns
+# (display_expr, is_expression) like n_src/db_utils.py, the column name here is never an expression
+def get_display_column(columns):
+    column_names = [col['name'] for col in columns]
     priorities = ['name', 'alias', 'title', 'label', 'display_name', 'code']
 
     for name in priorities:
         if name in column_names:
-            return name
+            return name, False
 
     for name in column_names:
         if 'name' in name.lower() or 'model' in name.lower():
-            return name
+            return name, False
 
-    return column_names[0]
+    return column_names[0], False
 
 
 # In order to generate tables in topological sort order
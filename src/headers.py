@@ -14,6 +14,11 @@ def gen_model_header():
     return model_header
 
 
+def gen_models_package_init(lazy_imports):
+    # lazy_imports: the "'Class': ('.module', 'Class')," lines of _lazy_imports
+    return [DOC_HEADER, MODELS_PACKAGE_INIT.replace('@LAZY_IMPORTS@', '\n'.join(lazy_imports))]
+
+
 def gen_view_header():
     view_header = []
     view_header.append(DOC_HEADER)
@@ -42,10 +47,11 @@ DOC_HEADER = f"""
 
 VIEW_HEADER = """
 import calendar
-from flask import redirect, flash, url_for, Markup, g
+from flask import redirect, flash, url_for, g
+from markupsafe import Markup
 from flask import render_template
 from flask_appbuilder.models.sqla.interface import SQLAInterface
-from flask_appbuilder.views import ModelView, BaseView, MasterDetailView, MultipleView, RestCRUDView, CompactCRUDMixin
+from flask_appbuilder.views import ModelView, BaseView, MasterDetailView, MultipleView, CompactCRUDMixin
 from flask_appbuilder import ModelView, ModelRestApi, CompactCRUDMixin, aggregate_count, action, expose, BaseView, has_access
 from flask_appbuilder.charts.views import ChartView, TimeChartView, GroupByChartView
 from flask_appbuilder.models.group import aggregate_count
@@ -170,6 +176,33 @@ from flask_mail import Mail, Message  # Requires Flask-Mail
 
 """
 
+# __init__.py of the models package (codegen.py --models-package): the model classes are imported
+# from their module on first access, so `from .models import Loan` only imports the module of Loan
+# and the modules of its relationship targets
+MODELS_PACKAGE_INIT = """
+import importlib
+
+from . import enums
+from .enums import *
+
+_lazy_imports = {
+@LAZY_IMPORTS@
+}
+
+
+def __getattr__(name):
+    \"\"\"Lazy import handler\"\"\"
+    if name in _lazy_imports:
+        module_name, class_name = _lazy_imports[name]
+        module = importlib.import_module(module_name, package=__name__)
+        return getattr(module, class_name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Everything models.py exported: the model classes and the enums, domains and imports of enums.py
+__all__ = list(_lazy_imports.keys()) + [name for name in dir(enums) if not name.startswith('_')]
+"""
+
 DATA_DICTIONARY_MODELS = """
 # WE geneerate the model data dictionary
 # Define the app_Table, app_Column, and app_Relationship tables
@@ -556,6 +589,44 @@ db.create_all()
 appbuilder.security_cleanup()
 """
 
+# Lazy registration of views and APIs (codegen.py --lazy-views, see py_templates/lazy_views.py)
+LAZY_REGISTRY_IMPORTS = """
+from flask import render_template
+from flask_appbuilder import ModelView, ModelRestApi
+from flask_appbuilder.views import MasterDetailView, MultipleView
+
+from . import appbuilder, db
+from .lazy_views import LazyViews
+"""
+
+
+def gen_lazy_registry_header(registry):
+    return [DOC_HEADER, LAZY_REGISTRY_IMPORTS, f"{registry} = LazyViews(appbuilder, __package__)\n"]
+
+
+LAZY_VIEW_FILE_FOOTER = """
+appbuilder.add_link("rest_api", href="/swagger/v1", icon="fa-sliders", label="REST Api", category="Utilities")
+appbuilder.add_link("graphql", href="/graphql", icon="fa-wrench", label="GraphQL", category="Utilities")
+
+'''
+     Application wide 404 error handler
+'''
+
+@appbuilder.app.errorhandler(404)
+def page_not_found(e):
+    return (
+        render_template(
+           "404.html", base_template=appbuilder.base_template, appbuilder=appbuilder
+        ),
+        404,
+     )
+
+
+db.create_all()
+# appbuilder.security_cleanup() drops the permissions of the views that were not used yet;
+# call lazy_views.materialize_all() and lazy_apis.materialize_all() before running it
+"""
+
 API_BODY = """
 # API
 class {0}ModelApi(ModelRestApi):
@@ -689,6 +760,9 @@ from flask_graphql import GraphQLView
 
 from flask_appbuilder.security.sqla.models import User, Role, Permission, PermissionView, RegisterUser
 from .models import *
+from .gql_loaders import batch_relationships
+from .gql_limits import CostLimitBackend
+from .gql_cache import DocumentCache, PersistedQueries, PersistedQueryView
 from . import app
 """
     return DOC_HEADER + GQL_HEADER  # + MODEL_HEADER
@@ -702,6 +776,7 @@ GQL_SEC_IMPORT = "from flask_appbuilder.security.sqla.models import {0} as {0}Mo
 # https://github.com/graphql-python/graphene-sqlalchemy
 def gen_gql_class(table, exclusions):
     GQL_CLASS = f"""
+@batch_relationships
 class {table}Gql(SQLAlchemyObjectType):
     class Meta:
         model = {table}
@@ -730,10 +805,12 @@ def gen_gql_query(table):
 
 GQL_FOOTER = f"""
 schema = graphene.Schema(query=Query)
-app.add_url_rule('/graphql', view_func=GraphQLView.as_view(
+app.add_url_rule('/graphql', view_func=PersistedQueryView.as_view(
     'graphql',
     schema=schema,
     graphiql=True,
+    backend=DocumentCache.from_config(CostLimitBackend.from_config(app.config), app.config),
+    persisted_queries=PersistedQueries.from_config(app.config),
 ))
 """
 
@@ -1094,7 +1171,7 @@ MODEL_PHOTO = """
             im = ImageManager()
             if self.{col_name}:
                 return Markup('<a href="' + url_for('{table_class}ModelView.show',pk=str(self.id)) +\
-                 '" class="thumbnail"><img src="' + im.get_url(self.photo) +\
+                 '" class="thumbnail"><img src="' + im.get_url(self.{col_name}) +\
                   '" alt="Photo" class="img-rounded img-responsive"></a>')
             else:
                 return Markup('<a href="' + url_for('{table_class}ModelView.show',pk=str(self.id)) +\
@@ -1102,19 +1179,30 @@ MODEL_PHOTO = """
 
     def {column_name}_thumbnail(self):
         im = ImageManager()
-        if self.photo:
+        if self.{col_name}:
             return Markup('<a href="' + url_for('{table_class}ModelView.show',pk=str(self.id)) +\
-                 '" class="thumbnail"><img src="' + im.get_url_thumbnail(self.photo) +\
+                 '" class="thumbnail"><img src="' + im.get_url_thumbnail(self.{col_name}) +\
                   '" alt="{column_name}" class="img-rounded img-responsive"></a>')
         else:
             return Markup('<a href="' + url_for('{table_class}ModelView.show',pk=str(self.id)) +\
                  '" class="thumbnail"><img src="//:0" alt="{column_name}" class="img-responsive"></a>')
 """
+MODEL_FILE = """
+    def {column_name}(self):
+        return Markup('<a href="' + url_for('{table_class}ModelView.download', filename=str(self.{col_name})) +\
+                 '">Download</a>')
+"""
+
 def gen_photo_column(column_name, table_class):
     ret_list = []
-    col_name = column_name.split('_img')[0]
-    col_name = column_name.split('_photo')[0]
-    ret_list.append(f"    {col_name} = Column(ImageColumn(size=(300, 300, True), thumbnail_size=(30, 30, True) )")
-    ret_list.append(MODEL_PHOTO.format(column_name=column_name, table_class=table_class))
+    col_name = column_name.split('_img')[0].split('_photo')[0]
+    ret_list.append(f"    {col_name} = Column('{column_name}', ImageColumn(size=(300, 300, True), thumbnail_size=(30, 30, True)))")
+    ret_list.append(MODEL_PHOTO.format(column_name=column_name, col_name=col_name, table_class=table_class))
+    return "\n".join(ret_list)
 
-def gen_file_column(column_name, table_class)
\ No newline at end of file
+def gen_file_column(column_name, table_class):
+    ret_list = []
+    col_name = column_name.split('_file')[0].split('_doc')[0]
+    ret_list.append(f"    {col_name} = Column('{column_name}', FileColumn())")
+    ret_list.append(MODEL_FILE.format(column_name=column_name, col_name=col_name, table_class=table_class))
+    return "\n".join(ret_list)
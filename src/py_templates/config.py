@@ -93,6 +93,25 @@ IMG_UPLOAD_URL = "/static/uploads/"
 # Setup image size default is (300, 200, True)
 # IMG_SIZE = (300, 200, True)
 
+# ---------------------------------------------------
+# GraphQL configuration
+# ---------------------------------------------------
+# Queries resolving more objects than this are rejected (see gql_limits.py)
+GRAPHQL_MAX_COST = 10000
+# Deepest field nesting allowed
+GRAPHQL_MAX_DEPTH = 15
+# Assumed page size of connections without first:/last:, and the largest page size of truncated queries
+GRAPHQL_PAGE_SIZE = 100
+# Scale the page sizes of every connection of an over-budget query down until it fits GRAPHQL_MAX_COST,
+# nested ones included, instead of rejecting it; the response extensions show the requested and executed cost
+GRAPHQL_TRUNCATE = False
+# Parsed and validated queries kept in memory (see gql_cache.py)
+GRAPHQL_DOCUMENT_CACHE_SIZE = 1000
+# JSON file of the queries clients may run by id: {"<id>": "<query>", ...}
+# GRAPHQL_PERSISTED_QUERIES = basedir + "/persisted_queries.json"
+# Let clients register queries by their sha256 (Apollo automatic persisted queries)
+GRAPHQL_REGISTER_QUERIES = True
+
 # Theme configuration
 # these are located on static/appbuilder/css/themes
 # you can create your own and easily use them placing them on the same dir structure to override
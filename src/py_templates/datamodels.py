@@ -0,0 +1,465 @@
+# datamodels.py
+# SQLAInterface subclasses and view/API mixins used by the generated views and APIs of large tables.
+import datetime
+import decimal
+import json
+import logging
+import threading
+import time
+import uuid
+
+from flask import current_app, request, url_for
+from flask_appbuilder.const import API_RESULT_RES_KEY, API_SELECT_COLUMNS_RIS_KEY
+from flask_appbuilder.exceptions import FABException, InvalidColumnArgsFABException
+from flask_appbuilder.models.filters import Filters
+from flask_appbuilder.models.sqla.interface import SQLAInterface
+from flask_appbuilder.widgets import ListWidget
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import asc, desc, func, inspect, select, text, tuple_
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import defer, load_only
+from sqlalchemy.orm.exc import UnmappedColumnError
+
+"""
+Keyset (seek) pagination
+
+OFFSET/LIMIT paging reads and throws away every row before the requested page,
+so deep pages on multi-million-row tables get slower the further you go.
+KeysetSQLAInterface orders the rows by a sort key plus the primary key and
+starts each page right after the last row of the previous one:
+
+    WHERE (created_on, id) > (:last_created_on, :last_id) ORDER BY created_on, id LIMIT :page_size
+
+so every page is the same index range scan. The position is carried between
+requests as a signed cursor token instead of a page number.
+
+class LoanTransactionView(KeysetModelViewMixin, ModelView):
+    datamodel = KeysetSQLAInterface(LoanTransaction, keyset_columns=['created_on'])
+
+class LoanTransactionApi(KeysetApiMixin, ModelRestApi):
+    datamodel = KeysetSQLAInterface(LoanTransaction, keyset_columns=['created_on'])
+
+The API returns `next_cursor` with each page; GET /api/v1/loan_transaction/?cursor=<next_cursor>
+returns the page after it. Ordering by another column works when it is a
+non-nullable column of the model; otherwise the keyset columns are used.
+"""
+
+"""
+Column projection
+
+Loading whole rows for a list drags along Text columns, image and file payloads
+and document text the list never shows. ProjectedSQLAInterface loads only
+load_columns for lists (load_only), and defers deferred_columns on every other
+read, so they are only fetched when a show or edit page touches them. Both
+take column names; photo and file columns, which the models map under another
+attribute (scan_img as scan), are looked up through the mapper.
+
+class DocumentView(ModelView):
+    datamodel = ProjectedSQLAInterface(Document, load_columns=['id', 'title', 'owner_id_fk'],
+                                       deferred_columns=['body', 'scan_img'])
+    list_columns = ['id', 'title', 'owner']
+"""
+
+"""
+Approximate counts
+
+Rendering the pager runs SELECT count(*) over the whole filtered list, which on
+tables with millions of rows costs more than fetching the page itself.
+ApproxCountSQLAInterface asks PostgreSQL for its estimate first:
+
+- unfiltered lists use pg_class.reltuples; above count_threshold the last exact
+  count is shown instead, recounted in a background thread once it is older
+  than count_max_age seconds (the estimate is shown until the first count is done)
+- filtered lists use the row estimate of EXPLAIN; above count_threshold the
+  estimate is shown, below it the exact count is run as before
+
+Other databases, and interfaces created without a count_threshold, always count exactly,
+as does a filtered list whose EXPLAIN fails.
+
+class InventoryLogView(ModelView):
+    datamodel = ApproxCountSQLAInterface(InventoryLog, count_threshold=100000)
+"""
+
+log = logging.getLogger(__name__)
+
+CURSOR_SALT = 'keyset-cursor'
+
+
+def _cursor_serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt=CURSOR_SALT)
+
+
+def _to_json(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+def _from_json(column, value):
+    # Turn a cursor value back into the column's Python type, so the comparison binds correctly
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type in (datetime.date, datetime.datetime, datetime.time):
+        return python_type.fromisoformat(value)
+    if python_type in (decimal.Decimal, uuid.UUID):
+        return python_type(value)
+    return value
+
+
+def column_attribute(model, name):
+    """
+    The mapped attribute of a column given its attribute key or its name in the table, or None if it is not mapped.
+
+    Photo and file columns are mapped under another key than their column name (scan_img as scan), and
+    a method of the column's name renders them.
+    """
+    mapper = inspect(model)
+    if name in mapper.column_attrs:
+        return getattr(model, name)
+    column = model.__table__.c.get(name)
+    if column is None:
+        return None
+    try:
+        return getattr(model, mapper.get_property_by_column(column).key)
+    except UnmappedColumnError:
+        return None
+
+
+def encode_cursor(keys, direction, values):
+    """Signed token for the position after a row with the given values of the keys."""
+    return _cursor_serializer().dumps({'k': keys, 'd': direction, 'v': [_to_json(v) for v in values]})
+
+
+def decode_cursor(token):
+    """Return the cursor's {'k': keys, 'd': direction, 'v': values}, or None if it was tampered with."""
+    try:
+        return _cursor_serializer().loads(token)
+    except BadSignature:
+        return None
+
+
+class ProjectedSQLAInterface(SQLAInterface):
+    """SQLAInterface loading only the columns lists show; see the module notes."""
+
+    def __init__(self, obj, session=None, load_columns=None, deferred_columns=None):
+        super().__init__(obj, session=session)
+        self.load_columns = load_columns
+        self.deferred_columns = list(deferred_columns or [])
+
+    def load_options(self, list_view=False, extra_columns=()):
+        """
+        Loader options of a read: load_only the list columns (plus extra_columns) for lists,
+        else defer the heavy columns.
+        """
+        if list_view and self.load_columns is not None:
+            names = list(self.load_columns) + [name for name in extra_columns if name not in self.load_columns]
+            return [load_only(*self._attributes(names))]
+        return [defer(attribute) for attribute in self._attributes(self.deferred_columns)]
+
+    def _attributes(self, names):
+        # Column names (as the generator gives them) or attribute keys; columns that are not mapped are skipped
+        attributes = {}
+        for name in names:
+            attribute = column_attribute(self.obj, name)
+            if attribute is not None:
+                attributes.setdefault(attribute.key, attribute)
+        return list(attributes.values())
+
+    def query(self, filters=None, order_column="", order_direction="", page=None, page_size=None,
+              select_columns=None, outer_default_load=False):
+        query = self.session.query(self.obj)
+        count = self.query_count(query, filters, select_columns)
+        query = self.apply_all(
+            query, filters, order_column, order_direction, page, page_size, select_columns, outer_default_load
+        )
+        if not select_columns:
+            # Explicitly selected columns are already projected by apply_all
+            query = query.options(*self.load_options(list_view=True))
+        query_results = query.all()
+
+        result = []
+        for item in query_results:
+            if hasattr(item, self.obj.__name__):
+                result.append(getattr(item, self.obj.__name__))
+            else:
+                return count, query_results
+        return count, result
+
+    def get(self, id, filters=None, select_columns=None, outer_default_load=False):
+        pk = self.get_pk_name()
+        _filters = filters.copy() if filters else Filters(self.filter_converter_class, self)
+        if self.is_pk_composite() and isinstance(pk, list):
+            for _pk, _id in zip(pk, id):
+                _filters.add_filter(_pk, self.FilterEqual, _id)
+        else:
+            _filters.add_filter(pk, self.FilterEqual, id)
+        query = self.apply_all(
+            self.session.query(self.obj), _filters, select_columns=select_columns,
+            outer_default_load=outer_default_load,
+        )
+        if not select_columns:
+            query = query.options(*self.load_options())
+        item = query.one_or_none()
+        if item and hasattr(item, self.obj.__name__):
+            return getattr(item, self.obj.__name__)
+        return item
+
+
+class ApproxCountSQLAInterface(ProjectedSQLAInterface):
+    """SQLAInterface returning estimated counts for large lists; see the module notes."""
+
+    def __init__(self, obj, session=None, count_threshold=None, count_max_age=300, **kwargs):
+        super().__init__(obj, session=session, **kwargs)
+        self.count_threshold = count_threshold
+        self.count_max_age = count_max_age
+        self._exact_count = None
+        self._counted_at = None
+        self._count_lock = threading.Lock()
+        self._refreshing = False
+
+    def query_count(self, query, filters=None, select_columns=None):
+        if self.count_threshold is None:
+            return super().query_count(query, filters, select_columns)
+        query = self._apply_inner_all(query, filters, select_columns=select_columns, aliases_mapping={})
+        filtered = bool(filters and filters.filters)
+        estimate = self.estimate_count(query) if filtered else self.table_estimate()
+        if estimate is None or estimate < self.count_threshold:
+            return query.count()
+        return estimate if filtered else self.cached_count(estimate)
+
+    def table_estimate(self):
+        """Row count of the table from pg_class.reltuples, or None without statistics or on other databases."""
+        if self.session.get_bind().dialect.name != 'postgresql':
+            return None
+        rows = self.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+            {'name': self.obj.__table__.fullname},
+        ).scalar()
+        # reltuples is -1 for tables that were never vacuumed or analyzed
+        return rows if rows is not None and rows >= 0 else None
+
+    def estimate_count(self, query):
+        """
+        Number of rows the planner expects query to return (EXPLAIN), or None on other databases
+        or when EXPLAIN fails, so the caller falls back to an exact count.
+        """
+        dialect = self.session.get_bind().dialect
+        if dialect.name != 'postgresql':
+            return None
+        # Expand IN (...) parameters, which otherwise compile to a __[POSTCOMPILE_x] placeholder
+        compiled = query.statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+        if compiled.positional:
+            params = tuple(compiled.params[name] for name in compiled.positiontup)
+        else:
+            params = compiled.params
+        try:
+            # In a savepoint, so a failed EXPLAIN does not abort the request's transaction
+            with self.session.begin_nested():
+                plan = self.session.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params).scalar()
+        except DBAPIError:
+            log.warning("EXPLAIN of the %s count failed, counting exactly", self.obj.__name__, exc_info=True)
+            return None
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def cached_count(self, estimate):
+        """
+        The last exact count of the table, or estimate until there is one.
+        A missing or older than count_max_age count is refreshed in a background thread.
+        """
+        with self._count_lock:
+            stale = self._counted_at is None or time.monotonic() - self._counted_at > self.count_max_age
+            if stale and not self._refreshing:
+                self._refreshing = True
+                engine = self.session.get_bind()
+                threading.Thread(target=self._refresh_count, args=(engine,), daemon=True).start()
+            return estimate if self._exact_count is None else self._exact_count
+
+    def _refresh_count(self, engine):
+        try:
+            with engine.connect() as connection:
+                count = connection.execute(select(func.count()).select_from(self.obj.__table__)).scalar()
+            with self._count_lock:
+                self._exact_count = count
+                self._counted_at = time.monotonic()
+        finally:
+            with self._count_lock:
+                self._refreshing = False
+
+
+class KeysetSQLAInterface(ApproxCountSQLAInterface):
+    """SQLAInterface with keyset pagination through query_keyset; see the module notes."""
+
+    def __init__(self, obj, session=None, keyset_columns=None, **kwargs):
+        super().__init__(obj, session=session, **kwargs)
+        self.keyset_columns = list(keyset_columns or [])
+
+    def keyset_keys(self, order_column=''):
+        """Column names the rows are ordered and sought by: the sort key, then the primary key as tie breaker."""
+        pk = self.get_pk_name()
+        pk_names = pk if isinstance(pk, list) else [pk]
+        if order_column and self.is_keyset_column(order_column):
+            keys = [order_column]
+        else:
+            keys = list(self.keyset_columns)
+        return keys + [name for name in pk_names if name not in keys]
+
+    def is_keyset_column(self, name):
+        """Rows can only be sought on non-nullable columns of the model itself."""
+        column = inspect(self.obj).columns.get(name)
+        return column is not None and not column.nullable
+
+    def query_keyset(self, filters=None, order_column='', order_direction='', cursor=None,
+                     page_size=None, select_columns=None):
+        """
+        Returns the page after cursor as (count, items, next_cursor).
+
+        next_cursor is None on the last page. A missing cursor, or one issued for
+        a different ordering, returns the first page.
+        """
+        keys = self.keyset_keys(order_column)
+        direction = 'desc' if order_direction == 'desc' else 'asc'
+        mapper_columns = inspect(self.obj).columns
+        columns = [getattr(self.obj, key) for key in keys]
+
+        query = self.session.query(self.obj)
+        count = self.query_count(query, filters, select_columns)
+        query = self.apply_filters(query, filters)
+
+        position = decode_cursor(cursor) if cursor else None
+        if position and position['k'] == keys and position['d'] == direction:
+            values = [_from_json(mapper_columns[key], value) for key, value in zip(keys, position['v'])]
+            left = columns[0] if len(columns) == 1 else tuple_(*columns)
+            right = values[0] if len(values) == 1 else tuple_(*values)
+            query = query.filter(left > right if direction == 'asc' else left < right)
+
+        order = asc if direction == 'asc' else desc
+        query = query.order_by(*[order(column) for column in columns])
+        if select_columns:
+            names = [name for name in select_columns if name in mapper_columns and name not in keys]
+            query = query.options(load_only(*[getattr(self.obj, name) for name in keys + names]))
+        else:
+            query = query.options(*self.load_options(list_view=True, extra_columns=keys))
+        if page_size:
+            # One row more than the page tells whether there is a next page
+            query = query.limit(page_size + 1)
+        items = query.all()
+
+        next_cursor = None
+        if page_size and len(items) > page_size:
+            items = items[:page_size]
+            next_cursor = encode_cursor(keys, direction, [getattr(items[-1], key) for key in keys])
+        return count, items, next_cursor
+
+
+class KeysetListWidget(ListWidget):
+    template = 'keyset_list.html'
+
+
+def cursor_arg(modelview_name):
+    """Request argument carrying a list view's cursor, like FAB's page_<VIEW_NAME>."""
+    return f"cursor_{modelview_name}"
+
+
+class KeysetModelViewMixin(object):
+    """
+    ModelView list pages with First/Next links carrying a cursor instead of page numbers.
+    The view's datamodel must be a KeysetSQLAInterface.
+    """
+    list_widget = KeysetListWidget
+
+    def _get_list_widget(self, filters, actions=None, order_column="", order_direction="",
+                         page=None, page_size=None, widgets=None, **kwargs):
+        widgets = widgets or {}
+        actions = actions or self.actions
+        page_size = page_size or self.page_size
+        if not order_column and self.base_order:
+            order_column, order_direction = self.base_order
+        joined_filters = filters.get_joined_filters(self._base_filters)
+        arg = cursor_arg(self.__class__.__name__)
+        cursor = request.args.get(arg)
+        count, lst, next_cursor = self.datamodel.query_keyset(
+            joined_filters, order_column, order_direction, cursor=cursor, page_size=page_size
+        )
+        pks = [self._serialize_pk_if_composite(pk) for pk in self.datamodel.get_keys(lst)]
+
+        args = request.args.to_dict()
+        args.pop(arg, None)
+        first_url = url_for(request.endpoint, **(request.view_args or {}), **args) if cursor else None
+        next_url = None
+        if next_cursor:
+            next_url = url_for(request.endpoint, **(request.view_args or {}), **args, **{arg: next_cursor})
+
+        widgets["list"] = self.list_widget(
+            label_columns=self.label_columns,
+            include_columns=self.list_columns,
+            value_columns=self.datamodel.get_values(lst, self.list_columns),
+            order_columns=self.order_columns,
+            formatters_columns=self.formatters_columns,
+            page=None,
+            page_size=page_size,
+            count=count,
+            pks=pks,
+            actions=actions,
+            filters=filters,
+            modelview_name=self.__class__.__name__,
+            first_url=first_url,
+            next_url=next_url,
+            **kwargs,
+        )
+        return widgets
+
+
+class KeysetApiMixin(object):
+    """
+    ModelRestApi list endpoint with keyset pagination.
+
+    GET /?q=(page_size:100) returns the first page and a next_cursor; pass it
+    back as ?cursor=<next_cursor> for the following page. The page argument is ignored.
+    The API's datamodel must be a KeysetSQLAInterface.
+    """
+
+    def get_list_headless(self, **kwargs):
+        response = dict()
+        args = kwargs.get("rison", {})
+        try:
+            select_columns, pruned_select_cols = self._handle_columns_args(
+                args, self.list_select_columns, self.list_columns
+            )
+        except InvalidColumnArgsFABException as e:
+            return self.response_400(message=str(e))
+        self.set_response_key_mappings(
+            response, self.get_list, args, **{API_SELECT_COLUMNS_RIS_KEY: pruned_select_cols}
+        )
+        if pruned_select_cols:
+            list_model_schema = self.model2schemaconverter.convert(pruned_select_cols)
+        else:
+            list_model_schema = self.list_model_schema
+        try:
+            joined_filters = self._handle_filters_args(args)
+            order_column, order_direction = self._handle_order_args(args)
+        except FABException as e:
+            return self.response_400(message=str(e))
+        _, page_size = self._handle_page_args(args)
+
+        count, lst, next_cursor = self.datamodel.query_keyset(
+            joined_filters,
+            order_column,
+            order_direction,
+            cursor=request.args.get("cursor"),
+            page_size=page_size,
+            select_columns=select_columns,
+        )
+        response[API_RESULT_RES_KEY] = list_model_schema.dump(lst, many=True)
+        response["ids"] = self.datamodel.get_keys(lst)
+        response["count"] = count
+        response["next_cursor"] = next_cursor
+        self.pre_get_list(response)
+        return self.response(200, **response)
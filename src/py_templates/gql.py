@@ -20,31 +20,18 @@ t_payment_method_gql = graphene.Enum.from_enum(t_payment_method)
 t_lesson_level_gql = graphene.Enum.from_enum(t_lesson_level)
 t_person_role_gql = graphene.Enum.from_enum(t_person_role)
 t_transaction_status_gql = graphene.Enum.from_enum(t_transaction_status)
-t_severity_level_gql = graphene.Enum.from_enum(t_severity_level)
-t_severity_level_gql = graphene.Enum.from_enum(t_severity_level)
-t_severity_level_gql = graphene.Enum.from_enum(t_severity_level)
-t_severity_level_gql = graphene.Enum.from_enum(t_severity_level)
-t_severity_level_gql = graphene.Enum.from_enum(t_severity_level)
 t_animal_type_gql = graphene.Enum.from_enum(t_animal_type)
-t_lesson_level_gql = graphene.Enum.from_enum(t_lesson_level)
 t_amortization_method_gql = graphene.Enum.from_enum(t_amortization_method)
 t_language_proficiency_level_gql = graphene.Enum.from_enum(t_language_proficiency_level)
-t_language_proficiency_level_gql = graphene.Enum.from_enum(t_language_proficiency_level)
-t_language_proficiency_level_gql = graphene.Enum.from_enum(t_language_proficiency_level)
 t_relationship_type_gql = graphene.Enum.from_enum(t_relationship_type)
-t_severity_level_gql = graphene.Enum.from_enum(t_severity_level)
-t_transaction_status_gql = graphene.Enum.from_enum(t_transaction_status)
 t_geofence_trigger_gql = graphene.Enum.from_enum(t_geofence_trigger)
 t_engagement_type_gql = graphene.Enum.from_enum(t_engagement_type)
 t_share_platform_gql = graphene.Enum.from_enum(t_share_platform)
 t_lesson_difficulty_feedback_gql = graphene.Enum.from_enum(t_lesson_difficulty_feedback)
 t_gender_gql = graphene.Enum.from_enum(t_gender)
-t_animal_type_gql = graphene.Enum.from_enum(t_animal_type)
 t_org_type_gql = graphene.Enum.from_enum(t_org_type)
 t_doc_verification_status_gql = graphene.Enum.from_enum(t_doc_verification_status)
 t_admin_level_gql = graphene.Enum.from_enum(t_admin_level)
-t_transaction_status_gql = graphene.Enum.from_enum(t_transaction_status)
-t_transaction_status_gql = graphene.Enum.from_enum(t_transaction_status)
 t_account_classification_gql = graphene.Enum.from_enum(t_account_classification)
 t_account_normal_side_gql = graphene.Enum.from_enum(t_account_normal_side)
 t_account_usage_gql = graphene.Enum.from_enum(t_account_usage)
@@ -53,53 +40,20 @@ t_account_category_gql = graphene.Enum.from_enum(t_account_category)
 t_closure_type_gql = graphene.Enum.from_enum(t_closure_type)
 t_interval_gql = graphene.Enum.from_enum(t_interval)
 t_doc_status_gql = graphene.Enum.from_enum(t_doc_status)
-t_transaction_status_gql = graphene.Enum.from_enum(t_transaction_status)
-t_transaction_status_gql = graphene.Enum.from_enum(t_transaction_status)
-t_closure_type_gql = graphene.Enum.from_enum(t_closure_type)
-t_transaction_status_gql = graphene.Enum.from_enum(t_transaction_status)
-t_payment_method_gql = graphene.Enum.from_enum(t_payment_method)
 t_account_transaction_type_gql = graphene.Enum.from_enum(t_account_transaction_type)
 t_transaction_source_gql = graphene.Enum.from_enum(t_transaction_source)
-t_account_type_gql = graphene.Enum.from_enum(t_account_type)
-t_interval_gql = graphene.Enum.from_enum(t_interval)
-t_severity_level_gql = graphene.Enum.from_enum(t_severity_level)
-t_transaction_status_gql = graphene.Enum.from_enum(t_transaction_status)
-t_transaction_status_gql = graphene.Enum.from_enum(t_transaction_status)
-t_transaction_status_gql = graphene.Enum.from_enum(t_transaction_status)
-t_soil_texture_gql = graphene.Enum.from_enum(t_soil_texture)
 t_land_use_gql = graphene.Enum.from_enum(t_land_use)
 t_water_source_gql = graphene.Enum.from_enum(t_water_source)
-t_amortization_method_gql = graphene.Enum.from_enum(t_amortization_method)
 t_pipeline_stages_gql = graphene.Enum.from_enum(t_pipeline_stages)
 t_product_return_action_gql = graphene.Enum.from_enum(t_product_return_action)
 t_product_return_reason_gql = graphene.Enum.from_enum(t_product_return_reason)
-t_interval_gql = graphene.Enum.from_enum(t_interval)
 t_remind_by_enum_gql = graphene.Enum.from_enum(t_remind_by_enum)
-t_interval_gql = graphene.Enum.from_enum(t_interval)
-t_interval_gql = graphene.Enum.from_enum(t_interval)
-t_payment_method_gql = graphene.Enum.from_enum(t_payment_method)
-t_transaction_status_gql = graphene.Enum.from_enum(t_transaction_status)
 t_improvement_type_gql = graphene.Enum.from_enum(t_improvement_type)
-t_land_use_gql = graphene.Enum.from_enum(t_land_use)
 t_recommendation_category_gql = graphene.Enum.from_enum(t_recommendation_category)
-t_transaction_status_gql = graphene.Enum.from_enum(t_transaction_status)
 t_loan_sub_status_gql = graphene.Enum.from_enum(t_loan_sub_status)
-t_interval_gql = graphene.Enum.from_enum(t_interval)
 t_interest_method_gql = graphene.Enum.from_enum(t_interest_method)
-t_interval_gql = graphene.Enum.from_enum(t_interval)
-t_interval_gql = graphene.Enum.from_enum(t_interval)
-t_interval_gql = graphene.Enum.from_enum(t_interval)
-t_amortization_method_gql = graphene.Enum.from_enum(t_amortization_method)
-t_pipeline_stages_gql = graphene.Enum.from_enum(t_pipeline_stages)
-t_doc_status_gql = graphene.Enum.from_enum(t_doc_status)
-t_soil_texture_gql = graphene.Enum.from_enum(t_soil_texture)
-t_doc_status_gql = graphene.Enum.from_enum(t_doc_status)
-t_interval_gql = graphene.Enum.from_enum(t_interval)
-t_interval_gql = graphene.Enum.from_enum(t_interval)
 t_guarantor_type_gql = graphene.Enum.from_enum(t_guarantor_type)
-t_interval_gql = graphene.Enum.from_enum(t_interval)
 t_waypoint_audit_action_gql = graphene.Enum.from_enum(t_waypoint_audit_action)
-t_severity_level_gql = graphene.Enum.from_enum(t_severity_level)
 
 
 class TechParametersGql(SQLAlchemyObjectType):
@@ -0,0 +1,167 @@
+# gql_cache.py
+# Parsed document cache and persisted queries for the generated /graphql endpoint.
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from flask import request
+from flask_graphql import GraphQLView
+from graphql.backend.base import GraphQLBackend
+from graphql_server import HttpQueryError
+
+"""
+Document cache
+
+Parsing a query and validating it against a schema of ~150 object types costs
+more than running most dashboard queries. DocumentCache keeps the documents
+its backend made (for CostLimitBackend: parsed and validated, see
+gql_limits.py) in an LRU cache keyed by the sha256 of the query text, so a
+query seen before goes straight to execution.
+
+Persisted queries
+
+PersistedQueryView accepts a query id instead of the query text:
+
+- {"id": "loan_dashboard", "variables": {...}} runs a query of the
+  GRAPHQL_PERSISTED_QUERIES JSON file ({"<id>": "<query>", ...})
+- {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "<sha256 of the query>"}}}
+  is the automatic persisted query protocol of Apollo: an unknown hash answers
+  PersistedQueryNotFound, and the client sends the query with its hash once,
+  which registers it (unless GRAPHQL_REGISTER_QUERIES is False; at most
+  GRAPHQL_DOCUMENT_CACHE_SIZE registered queries are kept)
+
+Both work for GET requests too, so hot queries can be cached by HTTP caches.
+
+app.add_url_rule('/graphql', view_func=PersistedQueryView.as_view(
+    'graphql', schema=schema,
+    backend=DocumentCache.from_config(CostLimitBackend.from_config(app.config), app.config),
+    persisted_queries=PersistedQueries.from_config(app.config)))
+"""
+
+DEFAULT_CACHE_SIZE = 1000
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe mapping keeping the max_size most recently used entries."""
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class DocumentCache(GraphQLBackend):
+    """GraphQL backend caching the documents of another backend, keyed by the sha256 of the query."""
+
+    def __init__(self, backend, max_size=DEFAULT_CACHE_SIZE):
+        self.backend = backend
+        self.documents = LRUCache(max_size)
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, backend, config):
+        return cls(backend, max_size=config.get('GRAPHQL_DOCUMENT_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+
+    def document_from_string(self, schema, document_string):
+        if not isinstance(document_string, str):
+            return self.backend.document_from_string(schema, document_string)
+        key = (id(schema), query_hash(document_string))
+        document = self.documents.get(key)
+        if document is None:
+            self.misses += 1
+            # Parse errors are raised, and not cached
+            document = self.backend.document_from_string(schema, document_string)
+            self.documents.set(key, document)
+        else:
+            self.hits += 1
+        return document
+
+
+class PersistedQueries:
+    """Queries run by id: those of a JSON file, and those registered by Apollo clients by their sha256."""
+
+    def __init__(self, queries=None, register=True, max_registered=DEFAULT_CACHE_SIZE):
+        self.queries = dict(queries or {})
+        self.register = register
+        self.registered = LRUCache(max_registered)
+
+    @classmethod
+    def from_config(cls, config):
+        path = config.get('GRAPHQL_PERSISTED_QUERIES')
+        queries = {}
+        if path:
+            with open(path) as f:
+                queries = json.load(f)
+        return cls(queries, register=config.get('GRAPHQL_REGISTER_QUERIES', True),
+                   max_registered=config.get('GRAPHQL_DOCUMENT_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+
+    def get(self, query_id):
+        return self.queries.get(query_id) or self.registered.get(query_id)
+
+
+class PersistedQueryView(GraphQLView):
+    """GraphQLView running persisted queries by id or by Apollo automatic persisted query hash."""
+
+    persisted_queries = None
+
+    def parse_body(self):
+        data = super().parse_body()
+        if request.method == 'GET':
+            resolved = self.resolve_persisted_query(request.args)
+            return data if resolved is request.args else resolved
+        if isinstance(data, list):
+            return [self.resolve_persisted_query(entry) for entry in data]
+        return self.resolve_persisted_query(data)
+
+    def resolve_persisted_query(self, data):
+        """The request parameters with the query text of their persisted query id filled in."""
+        if self.persisted_queries is None or not hasattr(data, 'get'):
+            return data
+        query_id = data.get('id')
+        extensions = data.get('extensions') or {}
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpQueryError(400, 'Extensions are invalid JSON.')
+        sha256 = (extensions.get('persistedQuery') or {}).get('sha256Hash')
+        if not query_id and not sha256:
+            return data
+
+        query = data.get('query')
+        if query:
+            if sha256 and self.persisted_queries.register:
+                if query_hash(query) != sha256:
+                    raise HttpQueryError(400, 'provided sha does not match query')
+                self.persisted_queries.registered.set(sha256, query)
+            return data
+        query = self.persisted_queries.get(query_id or sha256)
+        if query is None:
+            # Apollo clients resend the query on this error; it is not a failed request for them
+            raise HttpQueryError(400 if query_id else 200, 'PersistedQueryNotFound')
+        data = dict(data)
+        data['query'] = query
+        return data
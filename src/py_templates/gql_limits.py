@@ -0,0 +1,313 @@
+# gql_limits.py
+# Query cost and depth limits for the generated /graphql endpoint.
+import copy
+from functools import partial
+
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.error import GraphQLError
+from graphql.execution import ExecutionResult, execute
+from graphql.language import ast
+from graphql.type import GraphQLList, GraphQLNonNull, GraphQLObjectType
+from graphql.validation import validate
+from promise import is_thenable
+
+"""
+Query cost
+
+Every relay connection of the schema can be nested in every other one, so a
+short query can ask for millions of rows. CostLimitBackend computes the cost
+of each query before executing it: the number of objects it can resolve, with
+every connection multiplied by its first:/last: argument (or by
+default_page_size when it has none, as a connection without either returns
+all rows) and every plain list by default_page_size.
+
+    { allLoan(first: 50) { edges { node { schedules(first: 24) { edges { node { amount } } } } } } }
+
+costs 50 loans + 50 * 24 schedules = 1250. Queries costing more than max_cost,
+or nested deeper than max_depth fields, are rejected with an error.
+
+With truncate=True connections without first:/last: return at most
+default_page_size rows (as they were costed), and an over-budget query is scaled
+down to fit instead: every page size is capped at default_page_size and then all
+of them are multiplied by the largest common factor that brings the cost under
+max_cost (at least one row per connection). For
+
+    { allLoan(first: 20) { edges { node { schedules { edges { node { payments { edges { node { amount } } } } } } } } } }
+
+(cost 20 + 20 * 100 + 20 * 100 * 100 = 202020 with the default page size of 100)
+the pages become 7 loans, 37 schedules and 37 payments, cost 9849. A query is
+only rejected when even one row per connection is over the limit, e.g. because
+of its plain lists, which cannot be paged.
+
+The cost is returned in the extensions of every response:
+
+    {"data": {...}, "extensions": {"cost": {"requested": 1250, "executed": 1250, "maxCost": 10000, "depth": 8}}}
+
+app.add_url_rule('/graphql', view_func=GraphQLView.as_view(
+    'graphql', schema=schema, backend=CostLimitBackend.from_config(app.config)))
+
+reads GRAPHQL_MAX_COST, GRAPHQL_MAX_DEPTH, GRAPHQL_PAGE_SIZE and GRAPHQL_TRUNCATE from the app config.
+"""
+
+DEFAULT_MAX_COST = 10000
+DEFAULT_MAX_DEPTH = 15
+DEFAULT_PAGE_SIZE = 100
+
+PAGE_ARGUMENTS = ('first', 'last')
+
+
+class QueryCostError(GraphQLError):
+    pass
+
+
+class CostedExecutionResult(ExecutionResult):
+    """ExecutionResult that keeps its extensions in the response; graphql-core 2 leaves them out."""
+
+    def to_dict(self, *args, **kwargs):
+        response = super().to_dict(*args, **kwargs)
+        if self.extensions:
+            response['extensions'] = self.extensions
+        return response
+
+
+def _unwrap(type_):
+    """The named type of a field type, and whether it is a list."""
+    is_list = False
+    while isinstance(type_, (GraphQLNonNull, GraphQLList)):
+        is_list = is_list or isinstance(type_, GraphQLList)
+        type_ = type_.of_type
+    return type_, is_list
+
+
+def is_connection(type_):
+    return isinstance(type_, GraphQLObjectType) and type_.name.endswith('Connection') and 'edges' in type_.fields
+
+
+def is_edge(type_):
+    return isinstance(type_, GraphQLObjectType) and type_.name.endswith('Edge') and 'node' in type_.fields
+
+
+def _int_argument(field, name, variables):
+    """Value of an integer argument given literally or as a variable; None when absent."""
+    for argument in field.arguments or []:
+        if argument.name.value == name:
+            value = argument.value
+            if isinstance(value, ast.Variable):
+                value = variables.get(value.name.value)
+                return value if isinstance(value, int) else None
+            if isinstance(value, ast.IntValue):
+                return int(value.value)
+    return None
+
+
+def _page_size(field, variables, default_page_size):
+    sizes = [size for size in (_int_argument(field, name, variables) for name in PAGE_ARGUMENTS) if size is not None]
+    return max(0, min(sizes)) if sizes else default_page_size
+
+
+def _operation(document_ast, operation_name):
+    operations = [d for d in document_ast.definitions if isinstance(d, ast.OperationDefinition)]
+    for operation in operations:
+        if operation_name is None or (operation.name and operation.name.value == operation_name):
+            return operation
+    return None
+
+
+def _variables(operation, variable_values):
+    """Variable values of the request, completed with the defaults of the operation."""
+    variables = {}
+    for definition in operation.variable_definitions or []:
+        if isinstance(definition.default_value, ast.IntValue):
+            variables[definition.variable.name.value] = int(definition.default_value.value)
+    variables.update(variable_values or {})
+    return variables
+
+
+def query_cost(schema, document_ast, operation_name=None, variable_values=None, default_page_size=DEFAULT_PAGE_SIZE):
+    """
+    Cost and depth of the operation of a validated document.
+
+    Returns:
+        tuple: (cost, depth); cost is the number of objects the query can resolve, depth the deepest field nesting.
+    """
+    operation = _operation(document_ast, operation_name)
+    if operation is None:
+        return 0, 0
+    root_type = schema.get_mutation_type() if operation.operation == 'mutation' else schema.get_query_type()
+    fragments = {d.name.value: d for d in document_ast.definitions if isinstance(d, ast.FragmentDefinition)}
+    variables = _variables(operation, variable_values)
+
+    def walk(selection_set, parent_type, multiplicity, depth):
+        cost, max_depth = 0, depth
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.FragmentSpread):
+                fragment = fragments[selection.name.value]
+                selections = [(fragment.selection_set, schema.get_type(fragment.type_condition.name.value))]
+            elif isinstance(selection, ast.InlineFragment):
+                type_ = schema.get_type(selection.type_condition.name.value) if selection.type_condition else parent_type
+                selections = [(selection.selection_set, type_)]
+            else:
+                selections = []
+                name = selection.name.value
+                fields = getattr(parent_type, 'fields', {})
+                if name.startswith('__') or name not in fields:
+                    continue
+                max_depth = max(max_depth, depth + 1)
+                if not selection.selection_set:
+                    continue
+                field_type, is_list = _unwrap(fields[name].type)
+                if is_connection(field_type):
+                    count = multiplicity * _page_size(selection, variables, default_page_size)
+                elif is_list and not is_connection(parent_type):
+                    count = multiplicity * default_page_size
+                else:
+                    count = multiplicity
+                if not (is_connection(parent_type) or is_edge(parent_type)):
+                    # edges and node objects are already counted by the page size of their connection
+                    cost += count
+                child_cost, child_depth = walk(selection.selection_set, field_type, count, depth + 1)
+                cost += child_cost
+                max_depth = max(max_depth, child_depth)
+            for selection_set_, type_ in selections:
+                child_cost, child_depth = walk(selection_set_, type_, multiplicity, depth)
+                cost += child_cost
+                max_depth = max(max_depth, child_depth)
+        return cost, max_depth
+
+    return walk(operation.selection_set, root_type, 1, 0)
+
+
+def truncate_pages(schema, document_ast, page_size, operation_name=None, variable_values=None, scale=None):
+    """
+    Copy of the document with the page size of every connection of the operation bounded by page_size.
+
+    Connections given neither first: nor last: get first: page_size. With scale, every first:/last:
+    (literal or variable) is capped at page_size and multiplied by scale, keeping at least one row.
+    """
+    document_ast = copy.deepcopy(document_ast)
+    operation = _operation(document_ast, operation_name)
+    if operation is None:
+        return document_ast
+    fragments = {d.name.value: d for d in document_ast.definitions if isinstance(d, ast.FragmentDefinition)}
+    variables = _variables(operation, variable_values)
+    seen = set()
+
+    def walk(selection_set, parent_type):
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.FragmentSpread):
+                if selection.name.value not in seen:
+                    seen.add(selection.name.value)
+                    fragment = fragments[selection.name.value]
+                    walk(fragment.selection_set, schema.get_type(fragment.type_condition.name.value))
+                continue
+            if isinstance(selection, ast.InlineFragment):
+                type_ = schema.get_type(selection.type_condition.name.value) if selection.type_condition else parent_type
+                walk(selection.selection_set, type_)
+                continue
+            fields = getattr(parent_type, 'fields', {})
+            if selection.name.value not in fields or not selection.selection_set:
+                continue
+            field_type, _ = _unwrap(fields[selection.name.value].type)
+            if is_connection(field_type):
+                selection.arguments = list(selection.arguments or [])
+                page_arguments = [argument for argument in selection.arguments if argument.name.value in PAGE_ARGUMENTS]
+                if not page_arguments:
+                    page_arguments = [ast.Argument(name=ast.Name(value='first'), value=ast.IntValue(value=str(page_size)))]
+                    selection.arguments.extend(page_arguments)
+                if scale is not None:
+                    for argument in page_arguments:
+                        size = _int_argument(selection, argument.name.value, variables)
+                        size = page_size if size is None else min(size, page_size)
+                        argument.value = ast.IntValue(value=str(min(size, max(1, int(size * scale)))))
+            walk(selection.selection_set, field_type)
+
+    root_type = schema.get_mutation_type() if operation.operation == 'mutation' else schema.get_query_type()
+    walk(operation.selection_set, root_type)
+    return document_ast
+
+
+def fit_pages(schema, document_ast, max_cost, page_size, operation_name=None, variable_values=None, steps=20):
+    """
+    Copy of the document with its page sizes scaled down so the operation costs at most max_cost.
+
+    The scale is found by bisection, as the cost only grows with it. Returns (document, cost); the cost
+    is still over max_cost when one row per connection is already too much.
+    """
+    def scaled(scale):
+        document = truncate_pages(schema, document_ast, page_size, operation_name, variable_values, scale)
+        return document, query_cost(schema, document, operation_name, variable_values, page_size)[0]
+
+    best = scaled(1.0)
+    if best[1] <= max_cost:
+        return best
+    low, high = 0.0, 1.0
+    best = scaled(low)
+    for _ in range(steps):
+        middle = (low + high) / 2
+        document, cost = scaled(middle)
+        if cost <= max_cost:
+            low, best = middle, (document, cost)
+        else:
+            high = middle
+    return best
+
+
+class CostLimitBackend(GraphQLCoreBackend):
+    """graphql-core backend that validates documents once and checks the cost of each execution."""
+
+    def __init__(self, max_cost=DEFAULT_MAX_COST, max_depth=DEFAULT_MAX_DEPTH, default_page_size=DEFAULT_PAGE_SIZE,
+                 truncate=False, executor=None):
+        super().__init__(executor=executor)
+        self.max_cost = max_cost
+        self.max_depth = max_depth
+        self.default_page_size = default_page_size
+        self.truncate = truncate
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        return cls(max_cost=config.get('GRAPHQL_MAX_COST', DEFAULT_MAX_COST),
+                   max_depth=config.get('GRAPHQL_MAX_DEPTH', DEFAULT_MAX_DEPTH),
+                   default_page_size=config.get('GRAPHQL_PAGE_SIZE', DEFAULT_PAGE_SIZE),
+                   truncate=config.get('GRAPHQL_TRUNCATE', False), **kwargs)
+
+    def document_from_string(self, schema, document_string):
+        document = super().document_from_string(schema, document_string)
+        validation_errors = validate(schema, document.document_ast)
+        document.execute = partial(self.execute_document, schema, document.document_ast, validation_errors)
+        return document
+
+    def execute_document(self, schema, document_ast, validation_errors, operation_name=None, variable_values=None,
+                         **kwargs):
+        if validation_errors:
+            return ExecutionResult(errors=validation_errors, invalid=True)
+        try:
+            requested, depth = query_cost(schema, document_ast, operation_name, variable_values,
+                                          self.default_page_size)
+            cost = requested
+            if self.truncate and cost > self.max_cost:
+                document_ast, cost = fit_pages(schema, document_ast, self.max_cost, self.default_page_size,
+                                               operation_name, variable_values)
+            elif self.truncate:
+                # Connections without first:/last: were costed at default_page_size; make them return no more
+                document_ast = truncate_pages(schema, document_ast, self.default_page_size, operation_name,
+                                              variable_values)
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+
+        extensions = {'cost': {'requested': requested, 'executed': cost, 'maxCost': self.max_cost, 'depth': depth}}
+        if depth > self.max_depth:
+            error = QueryCostError(f"Query depth {depth} exceeds the maximum depth of {self.max_depth}")
+            return CostedExecutionResult(errors=[error], invalid=True, extensions=extensions)
+        if cost > self.max_cost:
+            error = QueryCostError(f"Query cost {cost} exceeds the maximum cost of {self.max_cost}; "
+                                   f"request fewer rows with first:/last:")
+            return CostedExecutionResult(errors=[error], invalid=True, extensions=extensions)
+
+        result = execute(schema, document_ast, operation_name=operation_name, variable_values=variable_values,
+                         **dict(self.execute_params, **kwargs))
+
+        def add_cost(result):
+            return CostedExecutionResult(result.data, result.errors, result.invalid,
+                                         dict(result.extensions, **extensions))
+
+        return result.then(add_cost) if is_thenable(result) else add_cost(result)
@@ -0,0 +1,134 @@
+# gql_loaders.py
+# Per-request batch loaders for the relationships of the generated GraphQL object types.
+from collections import defaultdict
+
+from flask import g
+from promise import Promise
+from promise.dataloader import DataLoader
+from sqlalchemy import Table, and_, inspect, tuple_
+from sqlalchemy.orm import object_session
+
+"""
+Relationship batching
+
+graphene-sqlalchemy resolves a relationship field by reading the attribute of
+each parent row, so a connection of 50 loans with their repayment schedules
+and the payments of those runs 1 + 50 + 50 * n SELECTs. batch_relationships
+gives an object type a resolver per relationship that goes through a
+DataLoader instead: the parent rows of one level of the query are collected
+and their relationship is loaded with a single
+
+    SELECT ... FROM loan_repayment_schedule WHERE loan_id_fk IN (:k1, :k2, ...)
+
+per relationship and level (split in batches of MAX_BATCH_SIZE keys), so the
+number of statements depends on the shape of the query, not on the rows.
+
+The loaders are keyed by the foreign key values of the join and cached for the
+duration of the request (on flask.g), so a row reached twice in the same query
+is loaded once; nothing is cached across requests.
+
+@batch_relationships
+class LoanGql(SQLAlchemyObjectType):
+    class Meta:
+        model = Loan
+        interfaces = (relay.Node, )
+
+Relationships already loaded on the parent (eager loading) are returned as
+they are, relationships with a custom join condition keep the default resolver,
+and object types that define a resolve_<relationship> method keep theirs.
+
+The loaders are promise DataLoaders, as graphene 2 / graphql-core 2 resolve
+them; requirements.txt pins that stack (graphene 3 has no promise support).
+"""
+
+MAX_BATCH_SIZE = 500
+
+
+class RelationshipLoader(DataLoader):
+    """Loads one relationship for a batch of parent rows, keyed by the parent's join column values."""
+
+    def __init__(self, relationship, session):
+        super().__init__(max_batch_size=MAX_BATCH_SIZE)
+        self.relationship = relationship
+        self.session = session
+
+    def batch_load_fn(self, keys):
+        relationship = self.relationship
+        target = relationship.mapper.class_
+        if relationship.secondary is not None:
+            # (parent column, secondary column) and (target column, secondary column) pairs
+            key_columns = [secondary_column for _, secondary_column in relationship.synchronize_pairs]
+            join = and_(*[target_column == secondary_column
+                          for target_column, secondary_column in relationship.secondary_synchronize_pairs])
+            query = self.session.query(target, *key_columns).join(relationship.secondary, join)
+        else:
+            key_columns = [remote for _, remote in relationship.local_remote_pairs]
+            query = self.session.query(target, *key_columns)
+        if len(key_columns) == 1:
+            query = query.filter(key_columns[0].in_([key[0] for key in keys]))
+        else:
+            query = query.filter(tuple_(*key_columns).in_(keys))
+        if relationship.order_by:
+            query = query.order_by(*relationship.order_by)
+
+        rows = defaultdict(list)
+        for row in query:
+            rows[tuple(row[1:])].append(row[0])
+        if relationship.uselist:
+            return Promise.resolve([rows.get(key, []) for key in keys])
+        return Promise.resolve([rows[key][0] if key in rows else None for key in keys])
+
+
+def is_batchable(relationship):
+    """Whether the relationship joins on plain column equality, so it can be loaded with an IN query."""
+    if not relationship.local_remote_pairs:
+        return False
+    if relationship.secondary is not None:
+        return isinstance(relationship.secondary, Table) and bool(relationship.secondary_synchronize_pairs)
+    return all(hasattr(local, 'table') and hasattr(remote, 'table')
+               for local, remote in relationship.local_remote_pairs)
+
+
+def relationship_loader(relationship, session):
+    """The loader of a relationship for the current request."""
+    loaders = g.setdefault('gql_loaders', {})
+    key = (relationship, id(session))
+    if key not in loaders:
+        loaders[key] = RelationshipLoader(relationship, session)
+    return loaders[key]
+
+
+def _parent_key(root, relationship):
+    """Values of the parent's join columns, or None when one of them is NULL."""
+    mapper = inspect(root).mapper
+    if relationship.secondary is not None:
+        columns = [parent_column for parent_column, _ in relationship.synchronize_pairs]
+    else:
+        columns = [local for local, _ in relationship.local_remote_pairs]
+    key = tuple(getattr(root, mapper.get_property_by_column(column).key) for column in columns)
+    return None if any(value is None for value in key) else key
+
+
+def batch_resolver(relationship):
+    """Resolver loading the relationship through the request's RelationshipLoader."""
+
+    def resolve(root, info, **args):
+        state = inspect(root)
+        session = object_session(root)
+        if session is None or relationship.key in state.dict:
+            return getattr(root, relationship.key)
+        key = _parent_key(root, relationship)
+        if key is None:
+            return [] if relationship.uselist else None
+        return relationship_loader(relationship, session).load(key)
+
+    return resolve
+
+
+def batch_relationships(gql_type):
+    """Class decorator giving a SQLAlchemyObjectType a batching resolver for each relationship of its model."""
+    for relationship in inspect(gql_type._meta.model).relationships:
+        name = f"resolve_{relationship.key}"
+        if relationship.key in gql_type._meta.fields and not hasattr(gql_type, name) and is_batchable(relationship):
+            setattr(gql_type, name, staticmethod(batch_resolver(relationship)))
+    return gql_type
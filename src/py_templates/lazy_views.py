@@ -0,0 +1,145 @@
+# lazy_views.py
+# Registers generated views and APIs at startup without importing or instantiating them.
+import importlib
+import threading
+
+from flask import Blueprint, current_app
+
+"""
+Lazy registration
+
+appbuilder.add_view and add_api instantiate every view at startup: the
+datamodel inspects its model, the forms and schemas are built and the
+permissions synced, for every one of a few hundred views, in every worker.
+With codegen.py --lazy-views the view and API classes are generated into one
+module per group of tables (views_loan.py, apis_loan.py, ...; see
+partition.py) and views.py / apis.py only register them here:
+
+lazy_views = LazyViews(appbuilder, __package__)
+lazy_views.add_view('views_loan', 'LoanModelView', ModelView, "Loan", icon="fa-folder-open-o", category="Setup")
+
+lazy_apis = LazyViews(appbuilder, __package__)
+lazy_apis.add_api('apis_loan', 'LoanApi', ModelRestApi)
+
+At startup each view gets its menu entry and a stub blueprint with the URL
+rules (and endpoint names, so url_for works) of its base class. The first
+request to one of them imports the view's module and instantiates the view,
+after the views it shows inline (related_views, views); requests are then
+handed to the view's own handlers.
+
+Permissions are created when a view is first used, and the OpenAPI spec only
+lists the APIs used so far. materialize_all() instantiates everything, e.g.
+before syncing permissions or running appbuilder.security_cleanup(), which
+would otherwise drop the permissions of the views not used yet.
+"""
+
+# Blueprints of views are created with this import name by Flask-AppBuilder, which finds their templates with it
+BLUEPRINT_IMPORT_NAME = 'flask_appbuilder.baseviews'
+
+
+def base_routes(base):
+    """(method name, url, methods) of the routes a view class exposes, as its blueprint would register them."""
+    routes = []
+    for attr_name in dir(base):
+        if base.include_route_methods is not None and attr_name not in base.include_route_methods:
+            continue
+        if attr_name in base.exclude_route_methods:
+            continue
+        for url, methods in getattr(getattr(base, attr_name), '_urls', ()):
+            routes.append((attr_name, url, methods))
+    return routes
+
+
+class _HandlerRecorder:
+    """Stands in for the app when replaying a blueprint's deferred functions, to collect its view functions."""
+
+    def __init__(self):
+        self.handlers = {}
+
+    def add_url_rule(self, rule, endpoint=None, view_func=None, **options):
+        self.handlers[endpoint] = view_func
+
+
+class LazyViews:
+    """Registry of the views and APIs of an app package that are instantiated on first use."""
+
+    def __init__(self, appbuilder, package):
+        self.appbuilder = appbuilder
+        self.package = package
+        self.entries = {}
+        self.handlers = {}
+        self.lock = threading.RLock()
+
+    def add_view(self, module, class_name, base, name, icon='', category='', label=''):
+        """Register a view of module; base is the Flask-AppBuilder class it derives from."""
+        route_base = f"/{class_name.lower()}"
+        self._add_stub(module, class_name, base, route_base)
+        self.appbuilder.add_link(name, href=f"{route_base}/{base.default_view}/", icon=icon, label=label,
+                                 category=category)
+
+    def add_view_no_menu(self, module, class_name, base):
+        self._add_stub(module, class_name, base, f"/{class_name.lower()}")
+
+    def add_api(self, module, class_name, base, resource_name=None, version='v1'):
+        """Register an API of module, served under /api/<version>/<resource_name> (by default the class name)."""
+        resource_name = resource_name or class_name
+        blueprint = self._add_stub(module, class_name, base, f"/api/{version}/{resource_name.lower()}")
+        csrf = current_app.extensions.get('csrf')
+        if csrf and base.csrf_exempt:
+            csrf.exempt(blueprint)
+
+    def _add_stub(self, module, class_name, base, route_base):
+        self.entries[class_name] = module
+        blueprint = Blueprint(class_name, BLUEPRINT_IMPORT_NAME, url_prefix=route_base,
+                              template_folder=getattr(base, 'template_folder', None))
+        stubs = {}
+        for attr_name, url, methods in base_routes(base):
+            # A method exposed under several urls is one endpoint, with one view function
+            stub = stubs.setdefault(attr_name, self._stub(class_name, attr_name))
+            blueprint.add_url_rule(url, attr_name, stub, methods=methods)
+        current_app.register_blueprint(blueprint)
+        return blueprint
+
+    def _stub(self, class_name, attr_name):
+        def stub(*args, **kwargs):
+            return self.materialize(class_name)[attr_name](*args, **kwargs)
+
+        stub.__name__ = attr_name
+        return stub
+
+    def materialize(self, class_name):
+        """Instantiate a registered view (once) and return its route handlers by method name."""
+        handlers = self.handlers.get(class_name)
+        if handlers is not None:
+            return handlers
+        with self.lock:
+            if class_name in self.handlers:
+                return self.handlers[class_name]
+            module = importlib.import_module(f".{self.entries[class_name]}", self.package)
+            view_class = getattr(module, class_name)
+            # Inner views first, so _process_inner_views finds their instances
+            inner_views = list(getattr(view_class, 'related_views', None) or [])
+            inner_views += list(getattr(view_class, 'views', None) or [])
+            for inner in inner_views:
+                if inner.__name__ in self.entries:
+                    self.materialize(inner.__name__)
+
+            appbuilder = self.appbuilder
+            view = view_class()
+            view.appbuilder = appbuilder
+            appbuilder.baseviews.append(view)
+            appbuilder._process_inner_views()
+            # The blueprint is only built for its view functions; the stub blueprint stays registered
+            blueprint = view.create_blueprint(appbuilder, endpoint=class_name)
+            recorder = _HandlerRecorder()
+            for deferred in blueprint.deferred_functions:
+                deferred(recorder)
+            appbuilder._add_permission(view)
+            if hasattr(appbuilder, 'add_limits'):
+                appbuilder.add_limits(view)
+            self.handlers[class_name] = recorder.handlers
+            return recorder.handlers
+
+    def materialize_all(self):
+        for class_name in list(self.entries):
+            self.materialize(class_name)
@@ -1,4 +1,4 @@
-import sqlite3, re, string
+import os, sqlite3, re, string
 from pathlib import Path
 from typing import List, Dict
 
@@ -11,11 +11,27 @@ from sqlparse.tokens import Keyword
 
 
 # For writing a list of code to a file
-def write_file(filename, list_of_strings):
-    with open(filename, "w") as f:
-        s = "\n".join(list_of_strings)
-        f.write(s)
-        # f.writelines(list_of_strings)
+WRITE_BUFFER_SIZE = 1 << 16
+
+def write_file(filename, list_of_strings, atomic=False):
+    # Streams the strings to disk as they are produced, so list_of_strings can be a generator.
+    # With atomic=True the file is written under a temporary name and renamed over filename
+    # once complete, so a reader never sees it half-written.
+    target = filename
+    if atomic:
+        target = f"{filename}.tmp"
+    try:
+        with open(target, "w", buffering=WRITE_BUFFER_SIZE) as f:
+            separator = ""
+            for s in list_of_strings:
+                f.write(separator)
+                f.write(s)
+                separator = "\n"
+        if atomic:
+            os.replace(target, filename)
+    finally:
+        if atomic and os.path.exists(target):
+            os.remove(target)
 
 
 
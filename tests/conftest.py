@@ -0,0 +1,34 @@
+"""Shared setup: the generator modules are scripts in n_src/, imported by name."""
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, text
+
+N_SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "n_src")
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, N_SRC)
+# After n_src, so only src/py_templates (imported as py_templates.<module>) comes from src/
+sys.path.append(SRC)
+
+SCHEMA = [
+    "CREATE TABLE customer (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, email VARCHAR(120) UNIQUE, "
+    "created_at DATETIME NOT NULL)",
+    "CREATE TABLE orders (id INTEGER PRIMARY KEY, total NUMERIC(12, 2), placed DATE NOT NULL, "
+    "customer_id_fk INTEGER NOT NULL REFERENCES customer (id))",
+    "CREATE TABLE order_line (id INTEGER PRIMARY KEY, quantity INTEGER NOT NULL, note TEXT, "
+    "order_id_fk INTEGER NOT NULL REFERENCES orders (id))",
+    "CREATE TABLE category (id INTEGER PRIMARY KEY, name VARCHAR(50) NOT NULL, "
+    "parent_id_fk INTEGER REFERENCES category (id))",
+    "CREATE TABLE tag (id INTEGER PRIMARY KEY, name VARCHAR(50) NOT NULL, active BOOLEAN)",
+]
+
+
+@pytest.fixture
+def schema_db(tmp_path) -> str:
+    """An SQLite database with a chain of foreign keys, a self-reference and an unrelated table."""
+    uri = f"sqlite:///{tmp_path / 'schema.db'}"
+    with create_engine(uri).begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+    return uri
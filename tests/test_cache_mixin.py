@@ -0,0 +1,311 @@
+"""Test cases for the payload codec, the two cache tiers, their recomputation and the version counters of mixins/cache-mixin.py."""
+import enum
+import math
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+for module in ("msgpack", "flask_appbuilder", "cachelib"):
+    pytest.importorskip(module)
+
+from cachelib import SimpleCache
+from flask import Flask
+from sqlalchemy import (Boolean, Column, Date, DateTime, Enum, Integer, Interval, Numeric, String, Uuid,
+                        create_engine, event, inspect)
+from sqlalchemy.orm import Session, declarative_base
+
+from cache_benchmark import load_cache_mixin
+
+cache_mixin = load_cache_mixin()
+
+
+class Status(enum.Enum):
+    OPEN = "open"
+    CLOSED = "closed"
+
+
+Base = declarative_base()
+
+
+class Account(Base):
+    __tablename__ = "account"
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50))
+    balance = Column(Numeric(12, 2))
+    opened = Column(Date)
+    updated = Column(DateTime)
+    grace = Column(Interval)
+    token = Column(Uuid)
+    active = Column(Boolean)
+    status = Column(Enum(Status))
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def column_values(instance) -> dict:
+    return {attr.key: attr.value for attr in inspect(instance).attrs}
+
+
+def test_row_codec_round_trip(engine) -> None:
+    """It rebuilds instances with every column value and merges them into the session without a query."""
+    account = Account(id=1, name="main", balance=Decimal("10.50"), opened=date(2024, 1, 2),
+                      updated=datetime(2024, 1, 2, 3, 4, 5), grace=timedelta(days=3), token=uuid.uuid4(),
+                      active=True, status=Status.OPEN)
+    codec = cache_mixin.RowCodec.for_model(Account)
+    payload = codec.encode({"accounts": [account], "page": (1, None), "total": Decimal("10.50")})
+
+    with Session(engine) as session:
+        decoded = codec.decode(payload, session)
+        cached = decoded["accounts"][0]
+        assert inspect(cached).persistent and cached in session
+        assert column_values(cached) == column_values(account)
+        assert decoded["page"] == (1, None)
+        assert decoded["total"] == Decimal("10.50")
+
+
+def test_row_codec_loads_unloaded_columns_on_access(engine) -> None:
+    """It leaves the columns that were not loaded when encoding to load from the database."""
+    with Session(engine) as session:
+        session.add(Account(id=2, name="savings", balance=Decimal("3.00")))
+        session.commit()
+        account = session.get(Account, 2)
+        session.expire(account, ["balance"])
+        payload = cache_mixin.RowCodec.for_model(Account).encode(account)
+
+    with Session(engine) as session:
+        cached = cache_mixin.RowCodec.for_model(Account).decode(payload, session)
+        assert "balance" not in inspect(cached).dict
+        assert cached.name == "savings" and cached.balance == Decimal("3.00")
+
+
+def test_row_codec_refuses_payloads_of_changed_models() -> None:
+    """It raises CacheFormatError for an instance of a model whose columns are not the ones it was stored with."""
+    OtherBase = declarative_base()
+    changed = type("Account", (OtherBase,), {"__tablename__": "account", "id": Column(Integer, primary_key=True),
+                                              "name": Column(String(50))})
+    payload = cache_mixin.RowCodec.for_model(Account).encode(Account(id=3, name="old"))
+    with pytest.raises(cache_mixin.CacheFormatError):
+        cache_mixin.RowCodec.for_model(changed).decode(payload)
+
+
+class Clock:
+    """Stands in for the time module in cache-mixin.py; sleep advances it instead of waiting."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time_ns(self) -> int:
+        return int(self.now * 1e9)
+
+    def sleep(self, seconds) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(cache_mixin, "time", clock)
+    return clock
+
+
+def test_local_cache_evicts_the_least_recently_used_entry() -> None:
+    """It evicts the entry read or written longest ago once it holds more than max_entries."""
+    local_cache = cache_mixin.LocalCache(max_entries=3)
+    for key in ("a", "b", "c"):
+        local_cache.set(key, key.encode())
+    assert local_cache.get("a") == b"a"
+    local_cache.set("d", b"d")
+    assert local_cache.get("b") is None
+    assert list(local_cache._entries) == ["c", "a", "d"]
+    assert local_cache.evictions == 1
+
+
+def test_local_cache_keeps_its_size_under_max_bytes() -> None:
+    """It evicts the oldest entries to make room in bytes, and does not keep a payload larger than max_bytes."""
+    local_cache = cache_mixin.LocalCache(max_bytes=10)
+    local_cache.set("a", b"aaaa")
+    local_cache.set("b", b"bbbb")
+    local_cache.set("c", b"cccc")
+    assert local_cache.get("a") is None and local_cache.get("c") == b"cccc"
+    assert local_cache.size == 8 and local_cache.evictions == 1
+
+    local_cache.set("b", b"b")
+    assert local_cache.size == 5
+    local_cache.set("big", b"x" * 11)
+    assert local_cache.get("big") is None and len(local_cache) == 2
+
+
+def test_local_cache_expires_entries_after_their_timeout(clock) -> None:
+    """It returns an entry until its own timeout or the cache's has passed, and keeps none with a timeout of 0."""
+    local_cache = cache_mixin.LocalCache(timeout=30)
+    local_cache.set("default", b"1")
+    local_cache.set("short", b"2", timeout=5)
+    local_cache.set("never", b"3", timeout=0)
+    assert local_cache.get("never") is None
+
+    clock.sleep(10)
+    assert local_cache.get("short") is None
+    assert local_cache.get("default") == b"1"
+    clock.sleep(25)
+    assert local_cache.get("default") is None
+    assert len(local_cache) == 0 and local_cache.size == 0
+
+
+@pytest.fixture
+def two_tier():
+    local_cache = cache_mixin.LocalCache()
+    return cache_mixin.TwoTierCache(SimpleCache(), local_cache, cache_mixin.InvalidationBus(local_cache))
+
+
+def test_bump_changes_only_the_bumped_versions(two_tier) -> None:
+    """It keeps a version until its table is bumped, and then never returns an earlier one."""
+    before = two_tier.versions(["account", "ledger"])
+    assert two_tier.versions(["account", "ledger"]) == before
+    two_tier.bump(["account"])
+    after = two_tier.versions(["account", "ledger"])
+    assert after["account"] > before["account"]
+    assert after["ledger"] == before["ledger"]
+
+
+def test_generation_is_kept_in_l1_until_bumped(two_tier) -> None:
+    """It reads a generation from L1, and bump_generation drops it there so the next read sees the new one."""
+    generation = two_tier.generation("model:Account")
+    two_tier.bump(["model:Account"])
+    assert two_tier.generation("model:Account") == generation
+    two_tier.bump_generation("model:Account")
+    assert int(two_tier.generation("model:Account")) > int(generation)
+
+
+class Computation:
+    """A compute callable for TwoTierCache.fetch that counts its calls."""
+    def __init__(self, payload, seconds=0.0):
+        self.payload = payload
+        self.seconds = seconds
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.seconds)
+        return self.payload.decode(), self.payload
+
+
+def test_fetch_computes_a_missing_value_in_one_caller(two_tier) -> None:
+    """It lets the caller holding the lock compute the value, while the others wait for it instead."""
+    compute = Computation(b"value", seconds=0.3)
+    policy = cache_mixin.CachePolicy(timeout=60)
+    with ThreadPoolExecutor(8) as executor:
+        fetched = list(executor.map(lambda _: two_tier.fetch("k", compute, "Account", policy), range(8)))
+    assert compute.calls == 1
+    assert {result.payload for result in fetched} == {b"value"}
+    assert [result.computed for result in fetched].count(True) == 1
+    stats = two_tier.stats("Account")
+    assert stats["misses"] == 1 and stats["lock_waits"] == 7
+
+
+def test_fetch_returns_a_stale_value_while_another_caller_computes(two_tier, clock) -> None:
+    """It returns an expired value within stale_timeout when the lock is taken, and waits for a new one after."""
+    policy = cache_mixin.CachePolicy(timeout=10, stale_timeout=60, lock_timeout=5, early_expiration=0)
+    two_tier.store("k", b"old", policy)
+    two_tier.backend.add("lock:k", "another caller", timeout=0)
+    compute = Computation(b"new")
+
+    clock.sleep(30)
+    assert two_tier.fetch("k", compute, "Account", policy) == (b"old", None, False)
+    assert compute.calls == 0 and two_tier.stats("Account")["stale_hits"] == 1
+
+    clock.sleep(60)
+    # Nobody stores a new value before lock_timeout, so the caller computes it itself
+    assert two_tier.fetch("k", compute, "Account", policy) == (b"new", "new", True)
+    assert compute.calls == 1 and two_tier.stats("Account")["lock_waits"] == 1
+
+
+def test_fetch_waiters_return_the_value_the_lock_holder_stores(two_tier, clock, monkeypatch) -> None:
+    """It has a caller without a stale value poll for the value of the caller holding the lock."""
+    policy = cache_mixin.CachePolicy(timeout=10, lock_timeout=5)
+    two_tier.backend.add("lock:k", "another caller", timeout=0)
+    sleep = clock.sleep
+
+    def lock_holder_stores(seconds):
+        sleep(seconds)
+        if two_tier.backend.get("k") is None:
+            two_tier.store("k", b"theirs", policy)
+
+    monkeypatch.setattr(clock, "sleep", lock_holder_stores)
+    compute = Computation(b"mine")
+    assert two_tier.fetch("k", compute, "Account", policy) == (b"theirs", None, False)
+    assert compute.calls == 0 and two_tier.stats("Account")["lock_waits"] == 1
+
+
+def test_fetch_refreshes_expired_values_in_the_background(two_tier, clock) -> None:
+    """It returns the expired value at once and recomputes it in a worker thread with background_refresh."""
+    policy = cache_mixin.CachePolicy(timeout=10, early_expiration=0, background_refresh=True)
+    two_tier.store("k", b"old", policy)
+    compute, refresh = Computation(b"new"), Computation(b"refreshed")
+    clock.sleep(20)
+    with Flask(__name__).app_context():
+        assert two_tier.fetch("k", compute, "Account", policy, refresh) == (b"old", None, False)
+    # The worker releases the lock once it stored the new value
+    deadline = time.monotonic() + 5
+    while two_tier.backend.get("lock:k") is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert refresh.calls == 1 and compute.calls == 0
+    assert two_tier.fetch("k", compute, "Account", policy).payload == b"refreshed"
+    assert two_tier.stats("Account")["stale_hits"] == 1
+
+
+def test_should_refresh_before_expiry_as_often_as_xfetch(monkeypatch) -> None:
+    """It recomputes at expiry, and before with probability exp(-(expires - now) / (delta * early_expiration))."""
+    monkeypatch.setattr(cache_mixin, "random", random.Random(0))
+
+    def refresh_rate(policy, ahead, delta=1.0) -> float:
+        return sum(policy.should_refresh(100.0, delta, 100.0 - ahead) for _ in range(10000)) / 10000
+
+    xfetch = cache_mixin.CachePolicy(timeout=10)
+    assert refresh_rate(xfetch, 0) == 1.0
+    assert refresh_rate(xfetch, 1) == pytest.approx(math.exp(-1), abs=0.02)
+    assert refresh_rate(xfetch, 0.1) == pytest.approx(math.exp(-0.1), abs=0.02)
+    assert refresh_rate(cache_mixin.CachePolicy(timeout=10, early_expiration=2), 1) \
+        == pytest.approx(math.exp(-0.5), abs=0.02)
+    assert refresh_rate(cache_mixin.CachePolicy(timeout=10, early_expiration=0), 0.001) == 0.0
+
+
+@pytest.fixture
+def write_listeners():
+    """The Session listeners of listen_for_writes, removed again so they do not reach the other tests."""
+    cache_mixin.listen_for_writes()
+    yield
+    for name, listener in (("after_flush", cache_mixin._record_flush),
+                           ("do_orm_execute", cache_mixin._record_bulk_write),
+                           ("after_commit", cache_mixin._bump_committed),
+                           ("after_rollback", cache_mixin._discard_rolled_back)):
+        event.remove(Session, name, listener)
+
+
+def test_commits_bump_the_versions_of_written_tables(engine, two_tier, write_listeners) -> None:
+    """It bumps the version of the tables written in a transaction when it commits, not when it rolls back."""
+    app = Flask(__name__)
+    app.extensions["two_tier_cache"] = two_tier
+    with app.app_context(), Session(engine) as session:
+        version = two_tier.versions(["account"])["account"]
+        session.add(Account(id=4, name="draft"))
+        session.flush()
+        session.rollback()
+        assert two_tier.versions(["account"])["account"] == version
+        session.add(Account(id=4, name="kept"))
+        session.commit()
+        assert two_tier.versions(["account"])["account"] > version
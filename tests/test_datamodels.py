@@ -0,0 +1,170 @@
+"""Test cases for the SQLAInterface subclasses of py_templates/datamodels.py."""
+import datetime
+
+import pytest
+
+pytest.importorskip("flask_appbuilder")
+
+from flask import Flask
+from flask_appbuilder import Model
+from flask_appbuilder.models.mixins import ImageColumn
+from sqlalchemy import Column, Date, Integer, String, Text, create_engine, event, inspect
+from sqlalchemy.orm import Session
+
+from py_templates.datamodels import (ApproxCountSQLAInterface, KeysetSQLAInterface, ProjectedSQLAInterface,
+                                     decode_cursor, encode_cursor)
+
+
+class KeysetEntry(Model):
+    __tablename__ = "keyset_entry"
+    id = Column(Integer, primary_key=True)
+    booked = Column(Date, nullable=False)
+    memo = Column(String(20))
+
+
+class ProjectedDocument(Model):
+    # As the generated models map photo columns: the attribute drops the suffix, a method renders the column
+    __tablename__ = "projected_document"
+    id = Column(Integer, primary_key=True)
+    title = Column(String(50), nullable=False)
+    body = Column(Text)
+    scan = Column("scan_img", ImageColumn(size=(300, 300, True)))
+
+    def scan_img(self):
+        return f"<img src='{self.scan}'>"
+
+
+@pytest.fixture
+def session():
+    """
+    A session on an in-memory database, in an app context, with 25 entries booked five to a day
+    and three documents.
+    """
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "keyset-test"
+    engine = create_engine("sqlite://")
+    for model in (KeysetEntry, ProjectedDocument):
+        model.__table__.create(engine)
+    with app.app_context(), Session(engine) as session:
+        session.add_all([KeysetEntry(id=i, booked=datetime.date(2024, 1, 1 + i % 5), memo=f"entry {i}")
+                         for i in range(1, 26)])
+        session.add_all([ProjectedDocument(id=i, title=f"doc {i}", body="text " * 100, scan=f"scan_{i}.png")
+                         for i in range(1, 4)])
+        session.commit()
+        session.expunge_all()
+        yield session
+
+
+def all_pages(interface, **kwargs) -> list:
+    pages, cursor = [], None
+    while True:
+        count, items, cursor = interface.query_keyset(cursor=cursor, page_size=7, **kwargs)
+        assert count == 25
+        pages.append([item.id for item in items])
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_every_row_once(session) -> None:
+    """It pages through all rows in key order, breaking ties on the sort column with the primary key."""
+    interface = KeysetSQLAInterface(KeysetEntry, session)
+    pages = all_pages(interface, order_column="booked", order_direction="desc")
+    assert [len(page) for page in pages] == [7, 7, 7, 4]
+    rows = [session.get(KeysetEntry, id) for page in pages for id in page]
+    assert [(row.booked, row.id) for row in rows] == sorted(((row.booked, row.id) for row in rows), reverse=True)
+
+
+def test_nullable_columns_fall_back_to_the_keyset_columns(session) -> None:
+    """It orders by keyset_columns and the primary key when the requested column cannot be sought on."""
+    interface = KeysetSQLAInterface(KeysetEntry, session, keyset_columns=["booked"])
+    assert interface.keyset_keys("memo") == ["booked", "id"]
+    assert interface.keyset_keys() == ["booked", "id"]
+    assert all_pages(interface, order_column="memo")[0] == [5, 10, 15, 20, 25, 1, 6]
+
+
+def test_foreign_or_tampered_cursor_returns_the_first_page(session) -> None:
+    """It ignores cursors issued for another ordering and cursors whose signature does not match."""
+    interface = KeysetSQLAInterface(KeysetEntry, session)
+    _, first, cursor = interface.query_keyset(page_size=7)
+    assert decode_cursor(cursor) == {"k": ["id"], "d": "asc", "v": [7]}
+    assert decode_cursor(cursor[:-2] + "xx") is None
+    other = encode_cursor(["id"], "desc", [7])
+    assert interface.query_keyset(cursor=other, page_size=7)[1] == first
+    assert interface.query_keyset(cursor=cursor[:-2] + "xx", page_size=7)[1] == first
+
+
+def test_lists_load_only_the_load_columns(session) -> None:
+    """It loads only load_columns for lists, resolving photo columns by their column name."""
+    interface = ProjectedSQLAInterface(ProjectedDocument, session, load_columns=["id", "title"])
+    count, items = interface.query()
+    assert count == 3
+    assert inspect(items[0]).unloaded == {"body", "scan"}
+
+    session.expunge_all()
+    interface = ProjectedSQLAInterface(ProjectedDocument, session, load_columns=["id", "scan_img"])
+    assert inspect(interface.query()[1][0]).unloaded == {"title", "body"}
+
+
+def test_other_reads_defer_the_deferred_columns(session) -> None:
+    """It defers deferred_columns, including shadowed photo columns, on show and edit reads, loading them on access."""
+    interface = ProjectedSQLAInterface(ProjectedDocument, session, deferred_columns=["body", "scan_img", "missing"])
+    document = interface.get(2)
+    assert inspect(document).unloaded == {"body", "scan"}
+    assert document.scan_img() == "<img src='scan_2.png'>"
+
+
+@pytest.fixture
+def planner(session, monkeypatch):
+    """
+    Makes the session's SQLite engine pass for PostgreSQL: EXPLAIN statements are recorded and, while
+    planner["rows"] is set, answered with a plan of that many rows; otherwise they fail as on a real error.
+    """
+    engine = session.get_bind()
+    monkeypatch.setattr(engine.dialect, "name", "postgresql")
+    state = {"rows": None, "explained": []}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("EXPLAIN"):
+            state["explained"].append((statement, parameters))
+            if state["rows"] is not None:
+                return "SELECT ?", (f'[{{"Plan": {{"Plan Rows": {state["rows"]}}}}}]',)
+        return statement, parameters
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute, retval=True)
+    yield state
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def memo_filter(interface, value):
+    filters = interface.get_filters(["memo"])
+    filters.add_filter("memo", interface.FilterStartsWith, value)
+    return filters
+
+
+def test_filtered_counts_use_the_planner_estimate_above_the_threshold(session, planner) -> None:
+    """It returns EXPLAIN's row estimate for filtered lists above count_threshold, and counts exactly below it."""
+    interface = ApproxCountSQLAInterface(KeysetEntry, session, count_threshold=1000)
+    query = session.query(KeysetEntry)
+    planner["rows"] = 250000
+    assert interface.query_count(query, memo_filter(interface, "entry 1")) == 250000
+    planner["rows"] = 10
+    assert interface.query_count(query, memo_filter(interface, "entry 1")) == 11
+
+
+def test_failed_explain_falls_back_to_an_exact_count(session, planner) -> None:
+    """It counts exactly when EXPLAIN fails, and the session's transaction remains usable."""
+    interface = ApproxCountSQLAInterface(KeysetEntry, session, count_threshold=1)
+    assert interface.estimate_count(session.query(KeysetEntry)) is None
+    assert interface.query_count(session.query(KeysetEntry), memo_filter(interface, "entry 2")) == 7
+    assert len(planner["explained"]) == 2
+    assert session.query(KeysetEntry).count() == 25
+
+
+def test_in_parameters_are_expanded_for_explain(session, planner) -> None:
+    """It sends EXPLAIN one bound parameter per IN value instead of a POSTCOMPILE placeholder."""
+    interface = ApproxCountSQLAInterface(KeysetEntry, session, count_threshold=1)
+    planner["rows"] = 3
+    assert interface.estimate_count(session.query(KeysetEntry).filter(KeysetEntry.id.in_([4, 5, 6]))) == 3
+    statement, parameters = planner["explained"][0]
+    assert "POSTCOMPILE" not in statement
+    assert tuple(parameters) == (4, 5, 6)
@@ -0,0 +1,43 @@
+"""Test cases for the fragment cache of incremental regeneration."""
+from sqlalchemy import create_engine, text
+
+import codegen
+from fragment_cache import FragmentCache
+
+
+def table_task(state, table_name):
+    return [f"{state['prefix']}{table_name}"]
+
+
+def emit(uri, path, salt=""):
+    _, snapshot = codegen.inspect_metadata(uri)
+    cache = FragmentCache(str(path), snapshot, salt=salt)
+    fragments = cache.emit("models", table_task, snapshot.get_table_names(), state={"prefix": "class "})
+    cache.save()
+    return cache.regenerated["models"], fragments
+
+
+def test_unchanged_schema_reuses_every_fragment(schema_db, tmp_path) -> None:
+    """It regenerates nothing when neither the schema nor the generator changed."""
+    path = tmp_path / "cache.json"
+    regenerated, fragments = emit(schema_db, path)
+    assert sorted(regenerated) == ["category", "customer", "order_line", "orders", "tag"]
+    assert emit(schema_db, path) == ([], fragments)
+
+
+def test_changed_table_invalidates_its_fk_neighbours(schema_db, tmp_path) -> None:
+    """It regenerates a changed table and the tables referencing it or referenced by it, and nothing else."""
+    path = tmp_path / "cache.json"
+    emit(schema_db, path)
+    with create_engine(schema_db).begin() as conn:
+        conn.execute(text("ALTER TABLE orders ADD COLUMN shipped DATE"))
+    regenerated, _ = emit(schema_db, path)
+    assert sorted(regenerated) == ["customer", "order_line", "orders"]
+
+
+def test_changed_generator_invalidates_everything(schema_db, tmp_path) -> None:
+    """It regenerates every table when the salt (the digest of the generator sources) changes."""
+    path = tmp_path / "cache.json"
+    emit(schema_db, path, salt="a")
+    regenerated, _ = emit(schema_db, path, salt="b")
+    assert len(regenerated) == 5
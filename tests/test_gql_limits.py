@@ -0,0 +1,125 @@
+"""Test cases for the query cost limits of py_templates/gql_limits.py."""
+import pytest
+
+# gql_limits is written against graphql-core 2 (graphene 2), whose backends graphql-core 3 dropped
+pytest.importorskip("graphql.backend")
+graphene = pytest.importorskip("graphene")
+
+from graphene import relay
+from graphql import parse
+
+from py_templates.gql_limits import CostLimitBackend, fit_pages, query_cost, truncate_pages
+
+
+class Payment(graphene.ObjectType):
+    amount = graphene.Int()
+
+
+class PaymentConnection(relay.Connection):
+    class Meta:
+        node = Payment
+
+
+class Schedule(graphene.ObjectType):
+    amount = graphene.Int()
+    payments = relay.ConnectionField(PaymentConnection)
+
+    def resolve_payments(self, info, **kwargs):
+        return [Payment(amount=i) for i in range(200)]
+
+
+class ScheduleConnection(relay.Connection):
+    class Meta:
+        node = Schedule
+
+
+class Loan(graphene.ObjectType):
+    name = graphene.String()
+    tags = graphene.List(graphene.String)
+    schedules = relay.ConnectionField(ScheduleConnection)
+
+    def resolve_schedules(self, info, **kwargs):
+        return [Schedule(amount=i) for i in range(200)]
+
+
+class LoanConnection(relay.Connection):
+    class Meta:
+        node = Loan
+
+
+class Query(graphene.ObjectType):
+    all_loan = relay.ConnectionField(LoanConnection)
+
+    def resolve_all_loan(self, info, **kwargs):
+        return [Loan(name=f"loan {i}", tags=["a"]) for i in range(200)]
+
+
+SCHEMA = graphene.Schema(query=Query)
+
+NESTED = "{ allLoan(first: 20) { edges { node { schedules { edges { node { payments { edges { node { amount } } } } } } } } } }"
+
+
+def cost(query, **kwargs) -> int:
+    return query_cost(SCHEMA, parse(query), **kwargs)[0]
+
+
+def page_sizes(document) -> list:
+    # The first: argument of every connection, outermost first
+    sizes = []
+
+    def walk(selection_set):
+        for selection in selection_set.selections if selection_set else []:
+            sizes.extend(int(argument.value.value) for argument in selection.arguments or []
+                         if argument.name.value == "first")
+            walk(selection.selection_set)
+
+    walk(document.definitions[0].selection_set)
+    return sizes
+
+
+def execute(query, backend):
+    return backend.document_from_string(SCHEMA, query).execute()
+
+
+def test_connections_multiply_by_their_page_size() -> None:
+    """It counts every connection's page size times the rows of its parent, and plain lists at the default page size."""
+    assert cost("{ allLoan(first: 50) { edges { node { name schedules(first: 24) { edges { node { amount } } } } } } }") \
+        == 50 + 50 * 24
+    assert cost(NESTED) == 20 + 20 * 100 + 20 * 100 * 100
+    assert cost("{ allLoan(first: 5) { edges { node { tags } } } }") == 5
+    assert cost("query($n: Int) { allLoan(first: $n, last: 3) { edges { node { name } } } }",
+                variable_values={"n": 40}) == 3
+    assert cost("{ allLoan { edges { node { name } } } }", default_page_size=10) == 10
+
+
+def test_fragments_are_costed_where_they_are_spread() -> None:
+    """It costs a fragment at the multiplicity of each place it is spread in."""
+    query = ("{ allLoan(first: 10) { edges { node { ...Loan } } } } "
+             "fragment Loan on Loan { schedules(first: 3) { edges { node { amount } } } }")
+    assert cost(query) == 10 + 10 * 3
+
+
+def test_truncate_pages_adds_the_default_page_size() -> None:
+    """It gives connections without first:/last: the page size they were costed at."""
+    assert page_sizes(truncate_pages(SCHEMA, parse(NESTED), 100)) == [20, 100, 100]
+
+
+def test_fit_pages_scales_over_budget_queries_down() -> None:
+    """It scales every page size by the largest factor that brings the cost under the limit."""
+    document, fitted_cost = fit_pages(SCHEMA, parse(NESTED), 10000, 100)
+    assert page_sizes(document) == [7, 37, 37]
+    assert fitted_cost == 7 + 7 * 37 + 7 * 37 * 37
+
+
+def test_backend_rejects_or_truncates_over_budget_queries() -> None:
+    """It rejects a query over max_cost, and with truncate executes it with smaller pages instead."""
+    query = "{ allLoan(first: 50) { edges { node { schedules(first: 50) { edges { node { amount } } } } } } }"
+    rejected = execute(query, CostLimitBackend(max_cost=1000))
+    assert rejected.errors and rejected.extensions["cost"]["requested"] == 2550
+
+    truncated = execute(query, CostLimitBackend(max_cost=1000, truncate=True))
+    assert not truncated.errors
+    loans = truncated.data["allLoan"]["edges"]
+    assert truncated.extensions["cost"]["executed"] == len(loans) * (1 + len(loans[0]["node"]["schedules"]["edges"]))
+    assert truncated.extensions["cost"]["executed"] <= 1000
+
@@ -0,0 +1,93 @@
+"""Test cases for the index suggestions of index_advisor.py."""
+import pytest
+from sqlalchemy import create_engine, text
+
+from index_advisor import advise_indexes, advise_table_indexes, render_migration
+from schema_snapshot import load_schema
+
+SCHEMA = [
+    "CREATE TABLE customer (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL)",
+    "CREATE TABLE invoice (id INTEGER PRIMARY KEY, number VARCHAR(20) NOT NULL, memo TEXT, "
+    "is_deleted BOOLEAN NOT NULL, customer_id_fk INTEGER NOT NULL REFERENCES customer (id), "
+    "approver_id_fk INTEGER REFERENCES customer (id), issuer_id_fk INTEGER REFERENCES customer (id))",
+    # Full, and partial on the soft-delete predicate, which does not serve joins to deleted invoices
+    "CREATE INDEX ix_invoice_issuer ON invoice (issuer_id_fk, id)",
+    "CREATE INDEX ix_invoice_approver ON invoice (approver_id_fk) WHERE is_deleted = false",
+]
+
+
+@pytest.fixture
+def schema(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'invoices.db'}"
+    with create_engine(uri).begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+    return load_schema(uri)
+
+
+def by_columns(suggestions) -> dict:
+    return {(tuple(s["columns"]), s["using"]): s for s in suggestions}
+
+
+def test_soft_delete_predicate_is_only_on_search_indexes(schema) -> None:
+    """It suggests full btree indexes for foreign keys and partial trigram indexes for search columns."""
+    metadata, snapshot = schema
+    suggestions = by_columns(advise_table_indexes(metadata.tables["invoice"], snapshot))
+    assert set(suggestions) == {(("customer_id_fk",), "btree"), (("approver_id_fk",), "btree"),
+                                (("number",), "gin"), (("memo",), "gin")}
+    assert suggestions[("customer_id_fk",), "btree"]["where"] is None
+    assert suggestions[("approver_id_fk",), "btree"]["where"] is None
+    assert suggestions[("number",), "gin"]["where"] == "is_deleted = false"
+    assert suggestions[("number",), "gin"]["ops"] == {"number": "gin_trgm_ops"}
+
+    customer_suggestions = advise_table_indexes(metadata.tables["customer"], snapshot)
+    assert [s["where"] for s in customer_suggestions] == [None]
+
+
+def test_partial_indexes_cover_suggestions_on_the_same_predicate(schema) -> None:
+    """It takes an existing partial index as covering only suggestions with the same predicate."""
+    metadata, snapshot = schema
+    snapshot.indexes["invoice"] = snapshot.indexes["invoice"] + [
+        {"name": "ix_invoice_number_trgm", "column_names": ["number"], "unique": False,
+         "dialect_options": {"postgresql_using": "gin", "postgresql_where": "(is_deleted = false)"}},
+        {"name": "ix_invoice_memo_trgm", "column_names": ["memo"], "unique": False,
+         "dialect_options": {"postgresql_using": "gin", "postgresql_where": "(memo IS NOT NULL)"}},
+    ]
+    suggestions = by_columns(advise_table_indexes(metadata.tables["invoice"], snapshot))
+    assert (("number",), "gin") not in suggestions
+    assert (("memo",), "gin") in suggestions
+
+
+def test_max_search_indexes_limits_the_trigram_indexes(schema) -> None:
+    """It suggests trigram indexes for the first max_search_indexes search columns only."""
+    metadata, snapshot = schema
+    suggestions = advise_table_indexes(metadata.tables["invoice"], snapshot, max_search_indexes=1)
+    assert [s["columns"] for s in suggestions if s["using"] == "gin"] == [["number"]]
+
+
+def test_render_migration(schema) -> None:
+    """It renders a migration creating the suggestions in order and dropping them in reverse, the same every time."""
+    suggestions = advise_indexes(*schema)
+    code = render_migration(suggestions, down_revision="base")
+    assert code == render_migration(suggestions, down_revision="base")
+    source = "\n".join(code)
+    compile(source, "migration.py", "exec")
+
+    upgrade = source[source.index("def upgrade():"):source.index("def downgrade():")]
+    downgrade = source[source.index("def downgrade():"):]
+    assert 'op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")' in upgrade
+    assert ("op.create_index('ix_invoice_customer_id_fk', 'invoice', ['customer_id_fk'])"
+            in upgrade)
+    assert ("op.create_index('ix_invoice_number_trgm', 'invoice', ['number'], postgresql_using='gin', "
+            "postgresql_ops={'number': 'gin_trgm_ops'}, postgresql_where=sa.text('is_deleted = false'))"
+            in upgrade)
+    names = [s["name"] for table_suggestions in suggestions.values() for s in table_suggestions]
+    assert [line.split("'")[1] for line in downgrade.splitlines() if "drop_index" in line] == names[::-1]
+    assert "down_revision = 'base'" in source and "Create Date" not in source
+
+
+def test_render_migration_without_suggestions() -> None:
+    """It renders a migration with empty upgrade and downgrade functions."""
+    source = "\n".join(render_migration({}))
+    compile(source, "migration.py", "exec")
+    assert "pg_trgm" not in source and source.count("    pass") == 2
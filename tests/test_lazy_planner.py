@@ -0,0 +1,31 @@
+"""Test cases for the loader strategies chosen by the lazy planner."""
+from lazy_planner import LazyPlanner, fk_cycles
+
+
+def fks(*referred_tables) -> list:
+    return [{"referred_table": table} for table in referred_tables]
+
+
+def test_fk_cycles_groups_cycles_and_self_references() -> None:
+    """It puts the tables of a cycle in one component, self-references in their own, and leaves the rest out."""
+    cycles = fk_cycles({"a": {"b"}, "b": {"c"}, "c": {"a"}, "d": {"a"}, "e": {"e"}, "f": set()})
+    assert set(cycles) == {"a", "b", "c", "e"}
+    assert cycles["a"] == cycles["b"] == cycles["c"] != cycles["e"]
+
+
+def test_fk_cycles_handles_deep_chains() -> None:
+    """It does not recurse, so a chain longer than the recursion limit is fine."""
+    parents = {f"t{i}": {f"t{i + 1}"} for i in range(5000)}
+    parents["t5000"] = {"t0"}
+    assert len(set(fk_cycles(parents).values())) == 1
+
+
+def test_relationships_in_a_cycle_are_not_eager_loaded() -> None:
+    """It loads relationships within a cycle with 'select', and eager loads the ones leaving it."""
+    planner = LazyPlanner({"employee": fks("employee", "department"), "department": fks("employee"),
+                           "country": []})
+    assert planner.scalar("employee", "manager", "employee") == "select"
+    assert planner.scalar("employee", "department", "department") == "select"
+    assert planner.collection("department", "employees", "employee") == "select"
+    planner = LazyPlanner({"employee": fks("employee", "country"), "country": []})
+    assert planner.scalar("employee", "country", "country") == "joined"
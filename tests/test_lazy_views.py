@@ -0,0 +1,130 @@
+"""Test cases for the lazy view registry of py_templates/lazy_views.py."""
+import sys
+import textwrap
+
+import pytest
+
+for module in ("flask_appbuilder", "flask_sqlalchemy"):
+    pytest.importorskip(module)
+
+from flask import Flask, url_for
+from flask_appbuilder import AppBuilder, ModelView
+from flask_appbuilder.models.sqla import Model
+from flask_appbuilder.views import MasterDetailView
+from flask_sqlalchemy import SQLAlchemy
+
+from py_templates.lazy_views import LazyViews
+
+# An app package as codegen.py --lazy-views generates it: the views of a group of tables in a module of their own
+PACKAGE = {
+    "__init__.py": "",
+    "models.py": """
+        from flask_appbuilder import Model
+        from sqlalchemy import Column, ForeignKey, Integer, String
+        from sqlalchemy.orm import relationship
+
+
+        class Loan(Model):
+            __tablename__ = "lazy_loan"
+            id = Column(Integer, primary_key=True)
+            name = Column(String(50))
+
+            def __repr__(self):
+                return self.name
+
+
+        class LoanSched(Model):
+            __tablename__ = "lazy_loan_sched"
+            id = Column(Integer, primary_key=True)
+            name = Column(String(50))
+            loan_id_fk = Column(ForeignKey("lazy_loan.id"))
+            loan = relationship(Loan)
+    """,
+    "views_loan.py": """
+        from flask_appbuilder import ModelView
+        from flask_appbuilder.models.sqla.interface import SQLAInterface
+        from flask_appbuilder.views import MasterDetailView
+
+        from .models import Loan, LoanSched
+
+
+        class LoanModelView(ModelView):
+            datamodel = SQLAInterface(Loan)
+
+
+        class LoanSchedModelView(ModelView):
+            datamodel = SQLAInterface(LoanSched)
+
+
+        class Loan_LoanSchedMasterDetailView(MasterDetailView):
+            datamodel = SQLAInterface(Loan)
+            related_views = [LoanSchedModelView]
+    """,
+}
+
+
+@pytest.fixture(scope="module")
+def package(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("lazy")
+    (directory / "lazy_app").mkdir()
+    for name, source in PACKAGE.items():
+        (directory / "lazy_app" / name).write_text(textwrap.dedent(source))
+    sys.path.insert(0, str(directory))
+    yield "lazy_app"
+    sys.path.remove(str(directory))
+
+
+@pytest.fixture
+def app(package):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY="lazy-views", SQLALCHEMY_DATABASE_URI="sqlite://", WTF_CSRF_ENABLED=False,
+                      AUTH_ROLE_PUBLIC="Admin", FAB_ADD_SECURITY_VIEWS=False)
+    db = SQLAlchemy(app, model_class=Model)
+    with app.app_context():
+        __import__(f"{package}.models")
+        db.create_all()
+        AppBuilder(app, db.session)
+        yield app
+
+
+@pytest.fixture
+def lazy_views(app, package) -> LazyViews:
+    lazy_views = LazyViews(app.appbuilder, package)
+    lazy_views.add_view("views_loan", "LoanModelView", ModelView, "Loan", category="Setup")
+    lazy_views.add_view("views_loan", "LoanSchedModelView", ModelView, "Loan Sched", category="Setup")
+    lazy_views.add_view_no_menu("views_loan", "Loan_LoanSchedMasterDetailView", MasterDetailView)
+    return lazy_views
+
+
+def instances(app) -> list:
+    return [type(view).__name__ for view in app.appbuilder.baseviews]
+
+
+def test_stub_endpoints_materialize_the_view_once(app, lazy_views) -> None:
+    """It instantiates a view on the first request to its stub endpoint, and reuses it for the next ones."""
+    client = app.test_client()
+    assert "LoanModelView" not in instances(app)
+    for _ in range(2):
+        assert client.get("/loanmodelview/list/").status_code == 200
+    assert instances(app).count("LoanModelView") == 1
+    assert lazy_views.materialize("LoanModelView") is lazy_views.materialize("LoanModelView")
+
+
+def test_url_for_resolves_before_the_view_is_materialized(app, lazy_views) -> None:
+    """It registers the endpoint names of the base class, so url_for works before the first request."""
+    with app.test_request_context():
+        assert url_for("LoanModelView.list") == "/loanmodelview/list/"
+        assert url_for("LoanModelView.show", pk=1) == "/loanmodelview/show/1"
+    assert "LoanModelView" not in instances(app)
+    menu = [item.name for category in app.appbuilder.menu.get_list() for item in category.childs]
+    assert "Loan" in menu
+
+
+def test_related_views_are_materialized_first(app, lazy_views) -> None:
+    """It instantiates the related_views of a view before the view itself, and not the unrelated ones."""
+    assert app.test_client().get("/loan_loanschedmasterdetailview/list/").status_code == 200
+    views = instances(app)
+    assert views.index("LoanSchedModelView") < views.index("Loan_LoanSchedMasterDetailView")
+    assert "LoanModelView" not in views
+    master_detail = app.appbuilder.baseviews[views.index("Loan_LoanSchedMasterDetailView")]
+    assert type(master_detail._related_views[0]).__name__ == "LoanSchedModelView"
@@ -0,0 +1,46 @@
+"""Test cases for the models package written by codegen --models-package."""
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import codegen
+
+
+@pytest.fixture
+def loans_db(tmp_path) -> str:
+    """A person table and a loan table referencing it, in different table prefix groups."""
+    uri = f"sqlite:///{tmp_path / 'loans.db'}"
+    with create_engine(uri).begin() as conn:
+        conn.execute(text("CREATE TABLE person_person (id INTEGER PRIMARY KEY, name VARCHAR(50) NOT NULL)"))
+        conn.execute(text("CREATE TABLE loan_loans (id INTEGER PRIMARY KEY, amount NUMERIC(12, 2), "
+                          "person_id_fk INTEGER NOT NULL REFERENCES person_person (id))"))
+    return uri
+
+
+def test_single_model_import_configures_both_sides(loans_db, tmp_path) -> None:
+    """Importing one model maps its relationships and the backrefs other modules give it."""
+    for module in ("flask_appbuilder", "geoalchemy2", "sqlalchemy_utils"):
+        pytest.importorskip(module)
+    metadata, snapshot = codegen.inspect_metadata(loans_db)
+    package = tmp_path / "app" / "models"
+    package.mkdir(parents=True)
+    (tmp_path / "app" / "__init__.py").write_text("")
+    groups = {"person_person": "person", "loan_loans": "loan"}
+    for module, lines in codegen.gen_models_package(metadata, snapshot, groups=groups).items():
+        codegen.write_file(str(package / f"{module}.py"), lines)
+
+    script = (
+        "from sqlalchemy.orm import configure_mappers\n"
+        "from app.models import PersonPerson\n"
+        "configure_mappers()\n"
+        "for rel in PersonPerson.__mapper__.relationships:\n"
+        "    print(rel.key, rel.mapper.class_.__name__, ','.join(r.key for r in rel._reverse_property))\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path)] + sys.path))
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env)
+    assert result.returncode == 0, result.stderr
+    # The backref from LoanLoans.person, defined in models_loan which PersonPerson's module never uses itself
+    assert result.stdout.split() == ["loan_loanss_person", "LoanLoans", "person"]
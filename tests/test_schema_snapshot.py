@@ -0,0 +1,75 @@
+"""Test cases for dumping and loading schema snapshots."""
+import pytest
+from sqlalchemy import Enum, Integer, MetaData, Numeric, String
+from sqlalchemy.dialects.postgresql import ARRAY, DOUBLE_PRECISION, TIMESTAMP
+from sqlalchemy.exc import NoSuchTableError
+
+import codegen
+from schema_snapshot import SchemaSnapshot, load_schema
+
+
+def test_dump_load_round_trip(schema_db, tmp_path) -> None:
+    """It loads back the catalog it dumped, and the generators produce the same code from either."""
+    metadata, snapshot = load_schema(schema_db)
+    path = str(tmp_path / "schema.json")
+    snapshot.dump(path)
+    loaded_metadata, loaded = load_schema(snapshot_path=path)
+
+    assert loaded.get_table_names() == snapshot.get_table_names()
+    for table_name in snapshot.get_table_names():
+        for column, loaded_column in zip(snapshot.get_columns(table_name), loaded.get_columns(table_name)):
+            assert repr(loaded_column["type"]) == repr(column["type"])
+            assert dict(loaded_column, type=None) == dict(column, type=None)
+        assert loaded.get_foreign_keys(table_name) == snapshot.get_foreign_keys(table_name)
+    assert list(codegen.gen_models(loaded_metadata, loaded)) == list(codegen.gen_models(metadata, snapshot))
+
+
+@pytest.mark.parametrize("column_type", [
+    String(50),
+    Numeric(12, 2),
+    DOUBLE_PRECISION(),
+    TIMESTAMP(timezone=True),
+    ARRAY(Integer, dimensions=2),
+    Enum("draft", "paid", name="invoice_status"),
+], ids=repr)
+def test_column_types_round_trip(column_type, tmp_path) -> None:
+    """It rebuilds each column type with the arguments it was reflected with."""
+    column = {"name": "value", "type": column_type, "nullable": True, "default": None, "comment": None}
+    snapshot = SchemaSnapshot(["t"], {"t": [column]}, {}, {}, {}, {}, {}, {})
+    path = str(tmp_path / "schema.json")
+    snapshot.dump(path)
+    loaded_type = SchemaSnapshot.load(path).get_columns("t")[0]["type"]
+    assert type(loaded_type) is type(column_type)
+    assert repr(loaded_type) == repr(column_type)
+
+
+def test_load_rejects_non_type_classes(tmp_path) -> None:
+    """It refuses to instantiate a class that is not a column type."""
+    path = tmp_path / "schema.json"
+    path.write_text('{"version": 2, "table_names": ["t"], "columns": {"t": [{"name": "value", "type": '
+                    '{"type": "os:system", "args": ["true"], "kwargs": {}}}]}}')
+    with pytest.raises(ValueError):
+        SchemaSnapshot.load(str(path))
+
+
+def test_load_schema_builds_the_metadata_from_the_snapshot(schema_db, monkeypatch) -> None:
+    """It builds the tables, keys and foreign keys from the bulk-loaded catalog, without reflecting them again."""
+    def reflect(self, *args, **kwargs):
+        raise AssertionError("metadata.reflect called")
+
+    monkeypatch.setattr(MetaData, "reflect", reflect)
+    metadata, snapshot = load_schema(schema_db)
+    assert sorted(metadata.tables) == sorted(snapshot.get_table_names())
+    orders = metadata.tables["orders"]
+    assert [column.name for column in orders.primary_key] == ["id"]
+    assert [fk.target_fullname for fk in orders.foreign_keys] == ["customer.id"]
+
+
+@pytest.mark.parametrize("getter", ["get_columns", "get_pk_constraint", "get_foreign_keys", "get_unique_constraints",
+                                    "get_indexes", "get_check_constraints", "get_table_comment"])
+def test_getters_raise_for_unknown_tables(schema_db, getter) -> None:
+    """It raises NoSuchTableError for a table it does not have, as the Inspector does, from every getter."""
+    _, snapshot = load_schema(schema_db)
+    getattr(snapshot, getter)("customer")
+    with pytest.raises(NoSuchTableError):
+        getattr(snapshot, getter)("missing")